@@ -3,6 +3,14 @@
 // #include <numpy/arrayobject.h> // remove dependencies
 
 #include <cmath>
+#include <cstring>
+#include <cstdint>
+#include <atomic>
+#include <memory>
+#include <thread>
+#include <mutex>
+#include <condition_variable>
+#include <vector>
 
 #define M_PI 3.14159265358979323846f
 
@@ -16,6 +24,9 @@
 #define MIN(a, b) ((a) < (b) ? (a) : (b))
 #define MAX(a, b) ((a) > (b) ? (a) : (b))
 
+#define BANDS_PER_THREAD 4 // more bands than threads, so a slow band does not stall the others
+#define MIN_BAND_SIZE 16 // rows of a band, under which waking up a thread costs more than it saves
+
 int _get_buffer_from_Surface(PyObject *img, Py_buffer *buffer) {
     PyObject * get_view_method = PyObject_GetAttrString(img, "get_view");
     if (get_view_method == NULL) {
@@ -58,81 +69,245 @@ int _get_3DBuffer_from_Surface(PyObject *img, Py_buffer *buffer) {
     return 0;
 }
 
-static PyObject *method_color_filter_from_buffer(PyObject *self, PyObject *args, PyObject *kwargs) {
-    PyObject * img;
+/*
+    Pool of native threads shared by all the filters, like the one of the ray caster.
+    The workers sleep until a job is given, then take the tasks of the job one by one.
+    The calling thread works on the job too, and returns once every task is done.
+*/
+typedef void (*task_function)(int task, void *data);
+
+struct ThreadPool {
+    std::mutex busy; // held by the thread giving a job, for the whole job
+    std::mutex mutex;
+    std::condition_variable wake_up;
+    std::condition_variable finished;
+    int size = 0; // number of workers, without the calling thread
+    unsigned long generation = 0; // incremented for each new job
+
+    task_function function = nullptr;
+    void *data = nullptr;
+    int task_count = 0;
+    int workers_wanted = 0;
+    std::atomic<int> next_task{0};
+    int workers_running = 0;
+};
 
-    bool red = true;
-    bool green = true;
-    bool blue = true;
+static struct ThreadPool *THREAD_POOL = nullptr;
+static int THREAD_COUNT = 0; // threads used by the filters, 0 to use every core
 
-    bool magenta = true;
-    bool yellow = true;
-    bool cyan = true;
+static void run_tasks(struct ThreadPool *pool) {
+    int task;
+    while ((task = pool->next_task.fetch_add(1)) < pool->task_count)
+        pool->function(task, pool->data);
+}
 
-    static char *kwlist[] = {"image", "red", "green", "blue", "magenta", "yellow", "cyan", NULL};
-    if (!PyArg_ParseTupleAndKeywords( args, kwargs, "O|pppppp", kwlist, &img, &red, &green, &blue, &magenta,&yellow, &cyan))
-        return NULL;
+static void worker_loop(struct ThreadPool *pool, int index) {
+    unsigned long seen = 0;
+    while (true) {
+        std::unique_lock<std::mutex> lock(pool->mutex);
+        pool->wake_up.wait(lock, [pool, seen] { return pool->generation != seen; });
+        seen = pool->generation;
+        if (index >= pool->workers_wanted)
+            continue;
+        lock.unlock();
 
-    Py_buffer buffer;
-    if (_get_3DBuffer_from_Surface(img, &buffer)) {
-        printf("image isn't a valid Surface\n");
-        Py_RETURN_NONE;
+        run_tasks(pool);
+
+        lock.lock();
+        if (--pool->workers_running == 0)
+            pool->finished.notify_one();
     }
+}
 
-    Py_ssize_t width = buffer.shape[0];
-    Py_ssize_t height = buffer.shape[1];
+static int default_thread_count() {
+    unsigned int count = std::thread::hardware_concurrency();
+    return count ? (int)count : 1;
+}
 
-    long *buf = (long *) buffer.buf;
+static void parallel_for(int task_count, task_function function, void *data, int threads) {
+    /*
+        Call function(task, data) for every task in [0, task_count[ using at most "threads" threads.
+        Must be called without the GIL, by one thread at a time.
+    */
+    if (threads > task_count)
+        threads = task_count;
+    if (threads <= 1) {
+        for (int task = 0; task < task_count; ++task)
+            function(task, data);
+        return;
+    }
 
-//    printf("%d\n", buffer.ndim);
-//    for (int i = 0; i < buffer.ndim; i++){
-//        printf("%lld\n", buffer.shape[i]);
-//        printf("%lld\n", buffer.strides[i]);
-//    }
-//
-//    Py_RETURN_NONE;
+    if (THREAD_POOL == nullptr) { // The workers live until the end of the program.
+        THREAD_POOL = new ThreadPool();
+        THREAD_POOL->size = default_thread_count() - 1;
+        for (int i = 0; i < THREAD_POOL->size; ++i)
+            std::thread(worker_loop, THREAD_POOL, i).detach();
+    }
+    struct ThreadPool *pool = THREAD_POOL;
+    std::lock_guard<std::mutex> busy(pool->busy);
+
+    {
+        std::lock_guard<std::mutex> lock(pool->mutex);
+        pool->function = function;
+        pool->data = data;
+        pool->task_count = task_count;
+        pool->next_task = 0;
+        pool->workers_wanted = MIN(threads - 1, pool->size);
+        pool->workers_running = pool->workers_wanted;
+        ++pool->generation;
+    }
+    pool->wake_up.notify_all();
 
+    run_tasks(pool);
 
-    for (Py_ssize_t x = 0; x < width; ++x){
+    std::unique_lock<std::mutex> lock(pool->mutex);
+    pool->finished.wait(lock, [pool] { return pool->workers_running == 0; });
+}
 
-        for(Py_ssize_t y = 0; y < height; ++y){
+/*
+    The filters work on bands of rows: every band is a range [start, end[ given to a function with the job of the filter.
+*/
+typedef void (*band_function)(const void *job, Py_ssize_t start, Py_ssize_t end);
+
+struct Bands {
+    band_function function;
+    const void *job;
+    Py_ssize_t count;
+    int band_count;
+};
+
+static void run_band(int task, void *data) {
+    const struct Bands *bands = (const struct Bands *) data;
+    bands->function(bands->job, bands->count * task / bands->band_count, bands->count * (task + 1) / bands->band_count);
+}
+
+static void parallel_bands(Py_ssize_t count, band_function function, const void *job, int threads = 0) {
+    /*
+        Split [0, count[ in bands, and give them to the threads of the pool.
+        threads=0 uses the number of threads set with set_threads.
+        Must be called without the GIL.
+    */
+    if (threads == 0)
+        threads = THREAD_COUNT ? THREAD_COUNT : default_thread_count();
+    struct Bands bands = {function, job, count, (int)MIN((Py_ssize_t)threads * BANDS_PER_THREAD, count / MIN_BAND_SIZE)};
+    if (bands.band_count <= 1) {
+        if (count > 0)
+            function(job, 0, count);
+        return;
+    }
+    parallel_for(bands.band_count, run_band, &bands, threads);
+}
+
+static PyObject *method_set_threads(PyObject *self, PyObject *args) {
+    int threads;
+    if (!PyArg_ParseTuple(args, "i", &threads))
+        return NULL;
+    if (threads < 0) {
+        PyErr_SetString(PyExc_ValueError, "threads must be positive");
+        return NULL;
+    }
+    THREAD_COUNT = threads;
+    Py_RETURN_NONE;
+}
+
+static PyObject *method_get_threads(PyObject *self, PyObject *args) {
+    return PyLong_FromLong(THREAD_COUNT ? THREAD_COUNT : default_thread_count());
+}
+
+struct ColorSelection {
+    // colors kept by the color filter, "p" writes an int
+    int red = 1;
+    int green = 1;
+    int blue = 1;
+
+    int magenta = 1;
+    int yellow = 1;
+    int cyan = 1;
+};
+
+inline bool _is_selected_color(unsigned char r, unsigned char g, unsigned char b, const struct ColorSelection *selection) {
+    if(selection->red && r > g * D_C_QUOT && r > b * D_C_QUOT) return true; // _red
+    if(selection->green && g > r * D_C_QUOT && g > b * D_C_QUOT) return true; // green
+    if(selection->blue && b > r * D_C_QUOT && b > g * D_C_QUOT) return true; // blue
+
+    if(selection->magenta && ((r > D_C_QUOT * g && b > g) || (b > D_C_QUOT * g && r > g)) && r <= D_C_QUOT * b && b <= D_C_QUOT * r) return true; // magenta
+    if(selection->yellow && ((r > D_C_QUOT * b && g > b) || (g > D_C_QUOT * b && r > b)) && r <= D_C_QUOT * g && g <= D_C_QUOT * r) return true; // yellow
+    if(selection->cyan && ((b > D_C_QUOT * r && g > r) || (g > D_C_QUOT * r && b > r)) && g <= D_C_QUOT * b && b <= D_C_QUOT * g) return true; // cyan
+
+    if (selection->red && selection->green && selection->blue &&
+        r <= D_C_QUOT * g && r <= D_C_QUOT * b &&
+        g <= D_C_QUOT * r && g <= D_C_QUOT * b &&
+        b <= D_C_QUOT * r && b <= D_C_QUOT * g)
+        return true; // brown
+
+    return false;
+}
 
-            unsigned char *pixel = (unsigned char *)(buf + (y * width + x));
+inline void _sepia(unsigned char *r, unsigned char *g, unsigned char *b) {
+    int _blue = (int)(*r * 0.272f + *g * 0.504f + *b * 0.131f);
+    int _green = (int)(*r * 0.349f + *g * 0.656f + *b * 0.168f);
+    int _red = (int)(*r * 0.393f + *g * 0.739f + *b * 0.189f);
+
+    *b = (unsigned char)((_blue > 255) ? 255 : _blue);
+    *g = (unsigned char)((_green > 255) ? 255 : _green);
+    *r = (unsigned char)((_red > 255) ? 255 : _red);
+}
+
+struct ColorFilterJob {
+    uint32_t *buf;
+    Py_ssize_t width;
+    struct ColorSelection selection;
+};
+
+static void _color_filter_rows(const void *data, Py_ssize_t start, Py_ssize_t end) {
+    const struct ColorFilterJob *job = (const struct ColorFilterJob *) data;
+    for (Py_ssize_t y = start; y < end; ++y) {
+        for (Py_ssize_t x = 0; x < job->width; ++x) {
+            unsigned char *pixel = (unsigned char *)(job->buf + (y * job->width + x));
 
             unsigned char b = pixel[BLUE];
             unsigned char g = pixel[GREEN];
             unsigned char r = pixel[RED];
 
-//            printf("0 - %hhu\n", r);
-//            printf("-1 - %hhu\n", g);
-//            printf("-2 - %hhu\n", b);
-//            printf("\n");
+            if (_is_selected_color(r, g, b, &job->selection))
+                continue;
 
+            _sepia(&r, &g, &b);
 
-            if(red && r > g * D_C_QUOT && r > b * D_C_QUOT) continue; // _red
-            if(green && g > r * D_C_QUOT && g > b * D_C_QUOT) continue; // green
-            if(blue && b > r * D_C_QUOT && b > g * D_C_QUOT) continue; // blue
+            pixel[BLUE] = b;
+            pixel[GREEN] = g;
+            pixel[RED] = r;
+        }
+    }
+}
 
-            if(magenta && ((r > D_C_QUOT * g && b > g) || (b > D_C_QUOT * g && r > g)) && r <= D_C_QUOT * b && b <= D_C_QUOT * r) continue; // magenta
-            if(yellow && ((r > D_C_QUOT * b && g > b) || (g > D_C_QUOT * b && r > b)) && r <= D_C_QUOT * g && g <= D_C_QUOT * r) continue; // yellow
-            if(cyan && ((b > D_C_QUOT * r && g > r) || (g > D_C_QUOT * r && b > r)) && g <= D_C_QUOT * b && b <= D_C_QUOT * g) continue; // cyan
+static PyObject *method_color_filter_from_buffer(PyObject *self, PyObject *args, PyObject *kwargs) {
+    PyObject * img;
 
-            if (red && green && blue &&
-                r <= D_C_QUOT * g && r <= D_C_QUOT * b &&
-                g <= D_C_QUOT * r && g <= D_C_QUOT * b &&
-                b <= D_C_QUOT * r && b <= D_C_QUOT * g)
-                continue; // brown
+    struct ColorFilterJob job;
+    struct ColorSelection *selection = &job.selection;
 
-            int _blue = (int)(r * 0.272f + g * 0.504f + b * 0.131f);
-            int _green = (int)(r * 0.349f + g * 0.656f + b * 0.168f);
-            int _red = (int)(r * 0.393f + g * 0.739f + b * 0.189f);
+    static char *kwlist[] = {"image", "red", "green", "blue", "magenta", "yellow", "cyan", NULL};
+    if (!PyArg_ParseTupleAndKeywords( args, kwargs, "O|pppppp", kwlist, &img, &selection->red, &selection->green,
+                                      &selection->blue, &selection->magenta, &selection->yellow, &selection->cyan))
+        return NULL;
 
-            pixel[BLUE] = (char)((_blue > 255) ? 255 : _blue);
-            pixel[GREEN] = (char)((_green > 255) ? 255 : _green);
-            pixel[RED] = (char)((_red > 255) ? 255 : _red);
-        }
+    Py_buffer buffer;
+    if (_get_3DBuffer_from_Surface(img, &buffer)) {
+        printf("image isn't a valid Surface\n");
+        Py_RETURN_NONE;
     }
 
+    Py_ssize_t width = buffer.shape[0];
+    Py_ssize_t height = buffer.shape[1];
+
+    job.buf = (uint32_t *) buffer.buf;
+    job.width = width;
+
+    Py_BEGIN_ALLOW_THREADS
+    parallel_bands(height, _color_filter_rows, &job);
+    Py_END_ALLOW_THREADS
+
     PyBuffer_Release(&buffer);
     Py_RETURN_NONE;
 }
@@ -140,6 +315,36 @@ static PyObject *method_color_filter_from_buffer(PyObject *self, PyObject *args,
 
 long distortion_time = 0;
 
+inline void _get_distortion_offsets(std::vector<Py_ssize_t> *offsets, Py_ssize_t size, bool enabled,
+                                    float amplitude, float frequency, float speed) {
+    // same sampling as the distortion filter, for the rows or the columns
+    offsets->resize(size);
+    for (Py_ssize_t i = 0; i < size; ++i) {
+        Py_ssize_t u = (Py_ssize_t)(i + (enabled ? (amplitude * sin( frequency*i + speed*distortion_time )) : 0));
+        while (u < 0)
+            u += size;
+        (*offsets)[i] = u % size;
+    }
+}
+
+struct DistortionJob {
+    const uint32_t *sbuf;
+    uint32_t *dbuf;
+    Py_ssize_t width;
+    const Py_ssize_t *source_x;
+    const Py_ssize_t *source_y;
+};
+
+static void _distortion_rows(const void *data, Py_ssize_t start, Py_ssize_t end) {
+    const struct DistortionJob *job = (const struct DistortionJob *) data;
+    for (Py_ssize_t y = start; y < end; ++y) {
+        const uint32_t *src_row = job->sbuf + job->source_y[y] * job->width;
+        uint32_t *dst_row = job->dbuf + y * job->width;
+        for (Py_ssize_t x = 0; x < job->width; ++x)
+            dst_row[x] = src_row[job->source_x[x]];
+    }
+}
+
 static PyObject *method_distortion_from_buffer(PyObject *self, PyObject *args, PyObject *kwargs) {
     PyObject * src_img;
     PyObject * dst_img;
@@ -148,8 +353,8 @@ static PyObject *method_distortion_from_buffer(PyObject *self, PyObject *args, P
     float frequency = 1.0f;
     float speed = 1.0f;
 
-    bool vertical_distortion = false;
-    bool horizontal_distortion = false;
+    int vertical_distortion = 0; // "p" writes an int
+    int horizontal_distortion = 0;
 
 
     static char *kwlist[] = {"src_image", "dst_image", "horizontal_distortion", "vertical_distortion", "amplitude", "frequency", "speed", NULL};
@@ -181,24 +386,19 @@ static PyObject *method_distortion_from_buffer(PyObject *self, PyObject *args, P
         return NULL;
     }
 
-    long *sbuf = (long *) src_buf.buf;
-    long *dbuf = (long *) dst_buf.buf;
+    uint32_t *sbuf = (uint32_t *) src_buf.buf;
+    uint32_t *dbuf = (uint32_t *) dst_buf.buf;
 
-    for (Py_ssize_t x = 0; x < width; ++x){
-        Py_ssize_t xu = (Py_ssize_t)(x + (horizontal_distortion ? (amplitude * sin( frequency*x + speed*distortion_time )) : 0));
-        while (xu < 0)
-            xu += width;
-        xu = xu % width;
+    // The column sampled only depends on the column, and the row on the row.
+    thread_local std::vector<Py_ssize_t> source_x;
+    thread_local std::vector<Py_ssize_t> source_y;
+    _get_distortion_offsets(&source_x, width, horizontal_distortion, amplitude, frequency, speed);
+    _get_distortion_offsets(&source_y, height, vertical_distortion, amplitude, frequency, speed);
 
-        for(Py_ssize_t y = 0; y < height; ++y){
-            Py_ssize_t yu = (Py_ssize_t)(y + (vertical_distortion ? (amplitude * sin( frequency*y + speed*distortion_time )) : 0));
-            while (yu < 0)
-                yu += height;
-            yu = yu % height;
-
-            dbuf[(y * width + x)] = sbuf[(yu * width + xu)];
-        }
-    }
+    struct DistortionJob job = {sbuf, dbuf, width, source_x.data(), source_y.data()};
+    Py_BEGIN_ALLOW_THREADS
+    parallel_bands(height, _distortion_rows, &job);
+    Py_END_ALLOW_THREADS
 
 
     PyBuffer_Release(&src_buf);
@@ -209,6 +409,82 @@ static PyObject *method_distortion_from_buffer(PyObject *self, PyObject *args, P
     Py_RETURN_NONE;
 }
 
+struct VignetteMask {
+    /* Brightness of every pixel for a vignette, which only depends on its parameters.
+        The distances to the center are shared with the next mask of the same size and center,
+        so a fade only computes the brightness again.
+    */
+    Py_ssize_t width;
+    Py_ssize_t height;
+    float center_x;
+    float center_y;
+    float inner_radius;
+    float strength;
+    std::shared_ptr<const std::vector<float>> distance; // distance of each pixel to the center, row by row
+    std::vector<uint16_t> factor; // brightness of each pixel, 256 keeps the pixel unchanged
+};
+
+static std::shared_ptr<const VignetteMask> vignette_mask; // last mask used
+
+static std::shared_ptr<const VignetteMask> _get_vignette_mask(Py_ssize_t width, Py_ssize_t height, float center_x, float center_y,
+                                                              float inner_radius, float strength) {
+    std::shared_ptr<const VignetteMask> last = vignette_mask;
+    bool same_center = last && last->width == width && last->height == height &&
+                       last->center_x == center_x && last->center_y == center_y;
+    if (same_center && last->inner_radius == inner_radius && last->strength == strength)
+        return last;
+
+    std::shared_ptr<VignetteMask> mask = std::make_shared<VignetteMask>();
+    mask->width = width;
+    mask->height = height;
+    mask->center_x = center_x;
+    mask->center_y = center_y;
+    mask->inner_radius = inner_radius;
+    mask->strength = strength;
+
+    if (same_center)
+        mask->distance = last->distance;
+    else {
+        std::shared_ptr<std::vector<float>> distance = std::make_shared<std::vector<float>>(width * height);
+        for (Py_ssize_t y = 0; y < height; ++y)
+            for (Py_ssize_t x = 0; x < width; ++x)
+                (*distance)[y * width + x] = (float)sqrt(pow(x - center_x, 2) + pow(y - center_y, 2));
+        mask->distance = distance;
+    }
+
+    mask->factor.resize(width * height);
+    const std::vector<float> &distance = *mask->distance;
+    // 256 * (1 - strength * (distance - inner_radius) / (width - inner_radius)), rounded
+    float slope = 256.f * strength / ((float)width - inner_radius);
+    for (Py_ssize_t i = 0; i < width * height; ++i) {
+        float factor = 256.5f - slope * MAX(distance[i] - inner_radius, 0.f);
+        mask->factor[i] = (uint16_t)MIN(MAX(factor, 0.f), 256.f);
+    }
+
+    vignette_mask = mask;
+    return mask;
+}
+
+struct VignetteJob {
+    uint32_t *buf;
+    Py_ssize_t width;
+    const uint16_t *factor;
+};
+
+static void _vignette_rows(const void *data, Py_ssize_t start, Py_ssize_t end) {
+    const struct VignetteJob *job = (const struct VignetteJob *) data;
+    const uint16_t *factor = job->factor;
+    for (Py_ssize_t i = start * job->width; i < end * job->width; ++i) {
+        if (factor[i] < 256) {
+            unsigned char *pixel = (unsigned char *)(job->buf + i);
+
+            pixel[BLUE] = (unsigned char)((pixel[BLUE] * factor[i]) >> 8);
+            pixel[GREEN] = (unsigned char)((pixel[GREEN] * factor[i]) >> 8);
+            pixel[RED] = (unsigned char)((pixel[RED] * factor[i]) >> 8);
+        }
+    }
+}
+
 static PyObject *method_vignette(PyObject *self, PyObject *args, PyObject *kwargs) {
     PyObject *src_img;
     float inner_radius = 50.0f;
@@ -236,35 +512,228 @@ static PyObject *method_vignette(PyObject *self, PyObject *args, PyObject *kwarg
         center_x = (float)width / 2;
         center_y = (float)height / 2;
     }  // Otherwise, the center of the vignette is the given position
-    else if (!PyArg_ParseTuple(pos, "ff", &center_x, &center_y))
+    else if (!PyArg_ParseTuple(pos, "ff", &center_x, &center_y)) {
+        PyBuffer_Release(&src_buf);
         return NULL;
+    }
 
-    long *buf = (long *) src_buf.buf;
+    uint32_t *buf = (uint32_t *) src_buf.buf;
 
-    for (Py_ssize_t x = 0; x < width; ++x) {
-        for (Py_ssize_t y = 0; y < height; ++y) {
-            float dist = (float)sqrt(pow(x - center_x, 2) + pow(y - center_y, 2));
-            if (dist > inner_radius) {
-                float alpha = 1 - strength * ((dist - inner_radius) / ((float)width - inner_radius));
-                if (alpha < 0)
-                    alpha = 0;
+    std::shared_ptr<const VignetteMask> mask = _get_vignette_mask(width, height, center_x, center_y, inner_radius, strength);
 
-                unsigned char *pixel = (unsigned char *)(buf + (y * width + x));
+    struct VignetteJob job = {buf, width, mask->factor.data()};
+    Py_BEGIN_ALLOW_THREADS
+    parallel_bands(height, _vignette_rows, &job);
+    Py_END_ALLOW_THREADS
 
-                pixel[BLUE] = (char)( pixel[BLUE] * alpha );
-                pixel[GREEN] = (char)(pixel[GREEN] * alpha);
-                pixel[RED] = (char)(pixel[RED] * alpha);
-            }
+    PyBuffer_Release(&src_buf);
+
+    Py_RETURN_NONE;
+}
+
+struct DarkenJob {
+    uint32_t *buf;
+    Py_ssize_t width;
+    const float *depth;
+    float start;
+    float slope; // 256 * strength / (end - start)
+};
+
+static void _darken_rows(const void *data, Py_ssize_t start, Py_ssize_t end) {
+    const struct DarkenJob *job = (const struct DarkenJob *) data;
+    const float *depth = job->depth;
+    for (Py_ssize_t i = start * job->width; i < end * job->width; ++i) {
+        // same brightness as the vignette, from the depth instead of the distance to the center
+        float factor = 256.5f - job->slope * MAX(depth[i] - job->start, 0.f);
+        if (factor < 256.f) {
+            uint16_t brightness = (uint16_t)MAX(factor, 0.f);
+            unsigned char *pixel = (unsigned char *)(job->buf + i);
+
+            pixel[BLUE] = (unsigned char)((pixel[BLUE] * brightness) >> 8);
+            pixel[GREEN] = (unsigned char)((pixel[GREEN] * brightness) >> 8);
+            pixel[RED] = (unsigned char)((pixel[RED] * brightness) >> 8);
         }
     }
+}
+
+static PyObject *method_darken_by_depth(PyObject *self, PyObject *args, PyObject *kwargs) {
+    /*
+        Darken the pixels of a surface with their depth, like a black fog.
+        The depth buffer is the one written by RayCaster.raycasting: a float per pixel, row by row.
+        The pixels closer than start are unchanged, and the brightness falls by strength between start and end.
+        Unlike the vignette, no distance is computed, so it is cheaper.
+    */
+    PyObject *src_img;
+    PyObject *depth_object;
+    float start = 1.0f;
+    float end = 5.0f;
+    float strength = 1.0f;
+
+    static char *kwlist[] = {"src_img", "depth_buffer", "start", "end", "strength", NULL};
+    if (!PyArg_ParseTupleAndKeywords(args, kwargs, "OO|fff", kwlist, &src_img, &depth_object, &start, &end, &strength))
+        return NULL;
+    if (end <= start) {
+        PyErr_SetString(PyExc_ValueError, "end must be greater than start");
+        return NULL;
+    }
+    if (strength <= 0.f)
+        Py_RETURN_NONE;
+
+    Py_buffer src_buf;
+    if (_get_3DBuffer_from_Surface(src_img, &src_buf)) {
+        printf("src_img isn't a valid Surface\n");
+        Py_RETURN_NONE;
+    }
+    Py_ssize_t width = src_buf.shape[0];
+    Py_ssize_t height = src_buf.shape[1];
 
+    Py_buffer depth_buf;
+    if (PyObject_GetBuffer(depth_object, &depth_buf, PyBUF_C_CONTIGUOUS | PyBUF_FORMAT) < 0) {
+        PyBuffer_Release(&src_buf);
+        return NULL;
+    }
+    const char *format = depth_buf.format;
+    if (*format == '@' || *format == '=') // native byte order
+        ++format;
+    if (strcmp(format, "f") || depth_buf.len < width * height * (Py_ssize_t)sizeof(float)) {
+        PyBuffer_Release(&depth_buf);
+        PyBuffer_Release(&src_buf);
+        PyErr_Format(PyExc_ValueError, "depth_buffer must be a buffer of at least %zd floats", width * height);
+        return NULL;
+    }
+
+    struct DarkenJob job = {(uint32_t *) src_buf.buf, width, (const float *) depth_buf.buf, start, 256.f * strength / (end - start)};
+    Py_BEGIN_ALLOW_THREADS
+    parallel_bands(height, _darken_rows, &job);
+    Py_END_ALLOW_THREADS
+
+    PyBuffer_Release(&depth_buf);
     PyBuffer_Release(&src_buf);
 
     Py_RETURN_NONE;
 }
 
+struct BlurJob {
+    /* Box blur of a surface, in two passes: the rows from the image to temp, then the columns from temp to the image.
+        Every pass keeps a running sum of the 2 * radius + 1 pixels under the box, so the cost per pixel doesn't depend
+        on the radius, only the first sum of each row and column does. The radius is at most the size of the image.
+        The 4 bytes of the pixels are blurred the same way, whatever the order of the channels.
+    */
+    unsigned char *image;
+    Py_ssize_t pitch; // bytes between two rows of the image
+    unsigned char *temp; // width * height pixels
+    Py_ssize_t width;
+    Py_ssize_t height;
+    int radius;
+    uint32_t inverse; // 65536 / (2 * radius + 1)
+};
+
+inline unsigned char _box_average(uint32_t sum, uint32_t inverse) {
+    return (unsigned char)MIN((sum * inverse + 32768) >> 16, 255u);
+}
+
+static void _blur_rows(const void *data, Py_ssize_t start, Py_ssize_t end) {
+    const struct BlurJob *job = (const struct BlurJob *) data;
+    Py_ssize_t last = job->width - 1;
+    int radius = job->radius;
+    for (Py_ssize_t y = start; y < end; ++y) {
+        const unsigned char *src = job->image + y * job->pitch;
+        unsigned char *dst = job->temp + y * job->width * 4;
+        for (int c = 0; c < 4; ++c) {
+            // the pixels out of the image are the pixels of the edge
+            uint32_t sum = 0;
+            for (Py_ssize_t i = -radius; i <= radius; ++i)
+                sum += src[MIN(MAX(i, 0), last) * 4 + c];
+            for (Py_ssize_t x = 0; x <= last; ++x) {
+                dst[x * 4 + c] = _box_average(sum, job->inverse);
+                sum += src[MIN(x + radius + 1, last) * 4 + c];
+                sum -= src[MAX(x - radius, 0) * 4 + c];
+            }
+        }
+    }
+}
+
+static void _blur_columns(const void *data, Py_ssize_t start, Py_ssize_t end) {
+    // The columns [start, end[ are moved down together, a row at a time, to read the memory in order.
+    const struct BlurJob *job = (const struct BlurJob *) data;
+    Py_ssize_t last = job->height - 1;
+    Py_ssize_t row_size = job->width * 4;
+    Py_ssize_t first_byte = start * 4;
+    Py_ssize_t byte_count = (end - start) * 4;
+    int radius = job->radius;
+
+    std::vector<uint32_t> sums(byte_count, 0);
+    for (Py_ssize_t i = -radius; i <= radius; ++i) {
+        const unsigned char *row = job->temp + MIN(MAX(i, 0), last) * row_size + first_byte;
+        for (Py_ssize_t k = 0; k < byte_count; ++k)
+            sums[k] += row[k];
+    }
+    for (Py_ssize_t y = 0; y <= last; ++y) {
+        unsigned char *dst = job->image + y * job->pitch + first_byte;
+        const unsigned char *add = job->temp + MIN(y + radius + 1, last) * row_size + first_byte;
+        const unsigned char *sub = job->temp + MAX(y - radius, 0) * row_size + first_byte;
+        for (Py_ssize_t k = 0; k < byte_count; ++k) {
+            dst[k] = _box_average(sums[k], job->inverse);
+            sums[k] += add[k] - sub[k];
+        }
+    }
+}
+
 static PyObject *method_blur(PyObject *self, PyObject *args, PyObject *kwargs) {
-    // TODO
+    /*
+        Blur a surface in place.
+        Every pass is a box blur of the given radius, 3 passes look like a gaussian blur.
+        The GIL is released during the blur, and threads=0 uses the number of threads set with set_threads.
+    */
+    PyObject *src_img;
+    int radius = 1;
+    int passes = 1;
+    int threads = 0;
+
+    static char *kwlist[] = {"src_img", "radius", "passes", "threads", NULL};
+    if (!PyArg_ParseTupleAndKeywords(args, kwargs, "O|iii", kwlist, &src_img, &radius, &passes, &threads))
+        return NULL;
+
+    if (radius < 0 || passes < 0 || threads < 0) {
+        PyErr_SetString(PyExc_ValueError, "radius, passes and threads must be positive");
+        return NULL;
+    }
+
+    Py_buffer src_buf;
+    if (_get_buffer_from_Surface(src_img, &src_buf)) {
+        printf("src_img isn't a valid Surface\n");
+        Py_RETURN_NONE;
+    }
+
+    if (src_buf.itemsize != 4) {
+        PyBuffer_Release(&src_buf);
+        PyErr_SetString(PyExc_ValueError, "src_img must be a 32 bits surface");
+        return NULL;
+    }
+
+    struct BlurJob job;
+    job.image = (unsigned char *) src_buf.buf;
+    job.pitch = src_buf.strides[1];
+    job.width = src_buf.shape[0];
+    job.height = src_buf.shape[1];
+    // A box larger than the image already covers whole rows and columns, and a huge radius would overflow the inverse.
+    job.radius = radius = (int)MIN((Py_ssize_t)radius, MIN(MAX(job.width, job.height), (Py_ssize_t)65535));
+    job.inverse = (65536 + radius) / (2 * radius + 1);
+
+    if (radius > 0 && job.width > 0 && job.height > 0) {
+        Py_BEGIN_ALLOW_THREADS
+        thread_local std::vector<unsigned char> temp;
+        temp.resize(job.width * job.height * 4);
+        job.temp = temp.data();
+        for (int i = 0; i < passes; ++i) {
+            parallel_bands(job.height, _blur_rows, &job, threads);
+            parallel_bands(job.width, _blur_columns, &job, threads);
+        }
+        Py_END_ALLOW_THREADS
+    }
+
+    PyBuffer_Release(&src_buf);
+
     Py_RETURN_NONE;
 }
 
@@ -307,6 +776,72 @@ inline bool _segment_intersection(float A_x, float A_y, float B_x, float B_y,
     return true;
 }
 
+struct SurfaceIn3DJob {
+    const uint32_t *sbuf;
+    uint32_t *dbuf;
+    Py_ssize_t image_width;
+    Py_ssize_t image_height;
+    Py_ssize_t dst_width;
+    Py_ssize_t dst_height;
+    float A_x, A_z;
+    float B_x, B_z;
+    float fov;
+    float step;
+    float view_dist;
+    double src_x_ratio;
+    double x_ratio;
+    float pixel_step;
+};
+
+static void _surface_in_3D_columns(const void *data, Py_ssize_t start, Py_ssize_t end) {
+    // Every band goes through all the angles, but only draws its columns [start, end[,
+    // so the columns drawn by two angles get the same pixel as in a single pass.
+    const struct SurfaceIn3DJob *job = (const struct SurfaceIn3DJob *) data;
+    float fov = job->fov;
+
+    for (float angle_y = -fov; angle_y < fov; angle_y += job->step) {
+        double x = (angle_y + fov) * job->x_ratio;
+        Py_ssize_t x_min = MAX((Py_ssize_t)x, start);
+        Py_ssize_t x_max = MIN((Py_ssize_t)(x + job->pixel_step), end);
+        if (x_min >= x_max)
+            continue;
+
+        float cos_angle = cosf(angle_y);
+        float sin_angle = sinf(angle_y);
+
+        float view_x = job->view_dist * cos_angle;
+        float view_z = job->view_dist * sin_angle;
+
+        float intersect_x;
+        float intersect_z;
+        if (!_segment_intersection(0, 0, view_x, view_z,
+                                   job->A_x, job->A_z, job->B_x, job->B_z,
+                                   &intersect_x, &intersect_z))
+            continue;
+
+        float dist = (float)sqrt(pow(intersect_x, 2) + pow(intersect_z, 2)) * cos_angle;
+        if (dist > job->view_dist)
+            continue;
+
+        double local_dist = sqrt(pow(intersect_x - job->A_x, 2) + pow(intersect_z - job->A_z, 2));
+        Py_ssize_t src_x = (Py_ssize_t)(local_dist * job->src_x_ratio);
+
+        Py_ssize_t height = (Py_ssize_t)(job->dst_height / dist);
+        Py_ssize_t delta_height = (job->dst_height - height) / 2;
+
+        float y_dec = (float)job->image_height / height;
+
+        for (Py_ssize_t dst_x = x_min; dst_x < x_max; ++dst_x)
+            for (Py_ssize_t y = 0; y < height; ++y) {
+                Py_ssize_t dst_y = delta_height + y;
+                if (dst_y < 0 || dst_y >= job->dst_height)
+                    continue;
+                Py_ssize_t src_y = (Py_ssize_t)(y * y_dec);
+                job->dbuf[dst_y * job->dst_width + dst_x] = job->sbuf[src_y * job->image_width + src_x];
+            }
+    }
+}
+
 static PyObject *method_display_surface_in_3D_space(PyObject *self, PyObject *args, PyObject *kwargs) {
     PyObject *src_img;
     PyObject *dst_img;
@@ -352,8 +887,8 @@ static PyObject *method_display_surface_in_3D_space(PyObject *self, PyObject *ar
         Py_RETURN_NONE;
     }
 
-    long *sbuf = (long*)src_buf.buf;
-    long *dbuf = (long*)dst_buf.buf;
+    uint32_t *sbuf = (uint32_t *)src_buf.buf;
+    uint32_t *dbuf = (uint32_t *)dst_buf.buf;
 
     Py_ssize_t image_width = src_buf.shape[0];
     Py_ssize_t image_height = src_buf.shape[1];
@@ -362,50 +897,28 @@ static PyObject *method_display_surface_in_3D_space(PyObject *self, PyObject *ar
     Py_ssize_t dst_height = dst_buf.shape[1];
 
     double line_length = sqrt(pow(A_x - B_x, 2) + pow(A_z - B_z, 2));
-    double src_x_ratio = (double)image_width / line_length;
-    double x_ratio = dst_width / (2 * fov);
-    float pixel_step = step * dst_width / (2 * fov);
-
-    for (float angle_y = -fov; angle_y < fov; angle_y += step) {
-        float cos_angle = cosf(angle_y);
-        float sin_angle = sinf(angle_y);
-
-        float view_x = view_dist * cos_angle;
-        float view_z = view_dist * sin_angle;
-
-        float intersect_x;
-        float intersect_z;
-        if (!_segment_intersection(0, 0, view_x, view_z,
-                                   A_x, A_z, B_x, B_z,
-                                   &intersect_x, &intersect_z))
-            continue;
-
-        float dist = (float)sqrt(pow(intersect_x, 2) + pow(intersect_z, 2)) * cos_angle;
-        if (dist > view_dist)
-            continue;
-
-        double local_dist = sqrt(pow(intersect_x - A_x, 2) + pow(intersect_z - A_z, 2));
-        Py_ssize_t src_x = (Py_ssize_t)(local_dist * src_x_ratio);
 
-        double x = (angle_y + fov) * x_ratio;
-        Py_ssize_t x_max = (Py_ssize_t)(x + pixel_step);
-        Py_ssize_t height = (Py_ssize_t)(dst_height / dist);
-        Py_ssize_t delta_height = (dst_height - height) / 2;
-
-        float y_dec = (float)image_height / height;
-
-        for (Py_ssize_t dst_x = (Py_ssize_t)x; dst_x < x_max; ++dst_x)
-            if (dst_x < 0 || dst_x >= dst_width)
-                continue;
-            else
-                for (Py_ssize_t y = 0; y < height; ++y) {
-                    Py_ssize_t dst_y = delta_height + y;
-                    if (dst_y < 0 || dst_y >= dst_height)
-                        continue;
-                    Py_ssize_t src_y = (Py_ssize_t)(y * y_dec);
-                    dbuf[dst_y * dst_width + dst_x] = sbuf[src_y * image_width + src_x];
-                }
-    }
+    struct SurfaceIn3DJob job;
+    job.sbuf = sbuf;
+    job.dbuf = dbuf;
+    job.image_width = image_width;
+    job.image_height = image_height;
+    job.dst_width = dst_width;
+    job.dst_height = dst_height;
+    job.A_x = A_x;
+    job.A_z = A_z;
+    job.B_x = B_x;
+    job.B_z = B_z;
+    job.fov = fov;
+    job.step = step;
+    job.view_dist = view_dist;
+    job.src_x_ratio = (double)image_width / line_length;
+    job.x_ratio = dst_width / (2 * fov);
+    job.pixel_step = step * dst_width / (2 * fov);
+
+    Py_BEGIN_ALLOW_THREADS
+    parallel_bands(dst_width, _surface_in_3D_columns, &job);
+    Py_END_ALLOW_THREADS
 
     PyBuffer_Release(&src_buf);
     PyBuffer_Release(&dst_buf);
@@ -443,9 +956,12 @@ static PyObject *method_mode_seven(PyObject *self, PyObject *args, PyObject *kwa
     Py_ssize_t width2 = dst_buf.shape[0];
     Py_ssize_t height2 = dst_buf.shape[1];
 
-    long *sbuf = (long *) src_buf.buf;
-    long *dbuf = (long *) dst_buf.buf;
+    uint32_t *sbuf = (uint32_t *) src_buf.buf;
+    uint32_t *dbuf = (uint32_t *) dst_buf.buf;
 
+    // The pixels of the source are moved to the destination, and when the transformation shrinks the image
+    // several of them go to the same pixel, the last one being kept. So it runs on a single thread, in this order.
+    Py_BEGIN_ALLOW_THREADS
     for (Py_ssize_t x = 0; x < width; ++x) {
         for (Py_ssize_t y = 0; y < height; ++y) {
             Py_ssize_t x_ = (Py_ssize_t)(a * x - a * x0 + b * y - b * y0 + x0);
@@ -455,6 +971,7 @@ static PyObject *method_mode_seven(PyObject *self, PyObject *args, PyObject *kwa
             dbuf[(y_ * width2 + x_)] = sbuf[(y * width + x)];
         }
     }
+    Py_END_ALLOW_THREADS
 
     PyBuffer_Release(&src_buf);
     PyBuffer_Release(&dst_buf);
@@ -462,6 +979,75 @@ static PyObject *method_mode_seven(PyObject *self, PyObject *args, PyObject *kwa
     Py_RETURN_NONE;
 }
 
+struct FishRemap {
+    // Pixel sampled for each pixel of the fish eye effect, -1 if it stays unchanged.
+    Py_ssize_t width;
+    Py_ssize_t height;
+    float distortion_coefficient;
+    std::vector<int32_t> source; // row by row
+};
+
+static std::shared_ptr<const FishRemap> fish_remap; // last remap used
+
+static std::shared_ptr<const FishRemap> _get_fish_remap(Py_ssize_t width, Py_ssize_t height, float distortion_coefficient) {
+    std::shared_ptr<const FishRemap> last = fish_remap;
+    if (last && last->width == width && last->height == height && last->distortion_coefficient == distortion_coefficient)
+        return last;
+
+    std::shared_ptr<FishRemap> remap = std::make_shared<FishRemap>();
+    remap->width = width;
+    remap->height = height;
+    remap->distortion_coefficient = distortion_coefficient;
+    remap->source.assign(width * height, -1);
+
+    float minus_width = 2.0f / width;
+    float minus_height = 2.0f / height;
+
+    // same order of the float operations as the effect computed per pixel
+    float xn = -1.0f;
+    for (Py_ssize_t x = 0; x < width; ++x){
+        float yn = -1.0f;
+        for(Py_ssize_t y = 0; y < height; ++y){
+            float xnd = xn;
+            float ynd = yn;
+
+            float div = 1.0f - distortion_coefficient * (xnd * xnd + ynd * ynd);
+            if (div != 0.0f){
+                xnd = xnd / div;
+                ynd = ynd / div;
+            }
+
+            short xu = (short)(((xnd + 1) / 2.0f) * width);
+            short yu = (short)(((ynd + 1) / 2.0f) * height);
+
+            if (0 <= xu && xu < width && 0 <= yu && yu < height)
+                remap->source[y * width + x] = (int32_t)(yu * width + xu);
+
+            yn += minus_height;
+        }
+        xn += minus_width;
+    }
+
+    fish_remap = remap;
+    return remap;
+}
+
+struct FishJob {
+    const uint32_t *sbuf;
+    uint32_t *dbuf;
+    Py_ssize_t width;
+    const int32_t *source;
+};
+
+static void _fish_rows(const void *data, Py_ssize_t start, Py_ssize_t end) {
+    const struct FishJob *job = (const struct FishJob *) data;
+    const int32_t *source = job->source;
+    for (Py_ssize_t i = start * job->width; i < end * job->width; ++i) {
+        if (source[i] >= 0)
+            job->dbuf[i] = job->sbuf[source[i]];
+    }
+}
+
 static PyObject *method_fish_from_buffer(PyObject *self, PyObject *args) {
 
     PyObject * src_img;
@@ -495,40 +1081,117 @@ static PyObject *method_fish_from_buffer(PyObject *self, PyObject *args) {
         return NULL;
     }
 
-    long *sbuf = (long *) src_buf.buf;
-    long *dbuf = (long *) dst_buf.buf;
+    uint32_t *sbuf = (uint32_t *) src_buf.buf;
+    uint32_t *dbuf = (uint32_t *) dst_buf.buf;
 
-    float minus_width = 2.0f / width;
-    float minus_height = 2.0f / height;
+    // The remap only depends on the size and the coefficient, which don't change for the TV screen.
+    std::shared_ptr<const FishRemap> remap = _get_fish_remap(width, height, distortion_coefficient);
 
-    float xn = -1.0f;
-    for (Py_ssize_t x = 0; x < width; ++x){
-        // float xn = minus_width * x - 1.0f;
+    struct FishJob job = {sbuf, dbuf, width, remap->source.data()};
+    Py_BEGIN_ALLOW_THREADS
+    parallel_bands(height, _fish_rows, &job);
+    Py_END_ALLOW_THREADS
 
-        float yn = -1.0f;
-        for(Py_ssize_t y = 0; y < height; ++y){
-            float xnd = xn;
-            float ynd = yn;
+    PyBuffer_Release(&src_buf);
+    PyBuffer_Release(&dst_buf);
 
-            // float ynd = 2.0f / height * y - 1.0f;
+    Py_RETURN_NONE;
+}
 
-            float div = 1.0f - distortion_coefficient * (xnd * xnd + ynd * ynd);
-            if (div != 0.0f){
-                xnd = xnd / div;
-                ynd = ynd / div;
+
+struct UpscaleJob {
+    const char *src;
+    char *dst;
+    Py_ssize_t src_pitch;
+    Py_ssize_t dst_pitch;
+    Py_ssize_t width;
+    Py_ssize_t width2;
+    Py_ssize_t factor_x;
+    Py_ssize_t factor_y;
+};
+
+static void _upscale_rows(const void *data, Py_ssize_t start, Py_ssize_t end) {
+    // The rows [start, end[ of the source are the rows [start * factor_y, end * factor_y[ of the destination.
+    const struct UpscaleJob *job = (const struct UpscaleJob *) data;
+    Py_ssize_t factor_x = job->factor_x;
+    for (Py_ssize_t y = start; y < end; ++y) {
+        const uint32_t *sbuf = (const uint32_t *) (job->src + y * job->src_pitch);
+        char *dst_row = job->dst + y * job->factor_y * job->dst_pitch;
+        uint32_t *dbuf = (uint32_t *) dst_row;
+        if (factor_x == 2) { // the most common factor, written two pixels at a time
+            for (Py_ssize_t x = 0; x < job->width; ++x) {
+                uint64_t pixels = sbuf[x] * 0x100000001ull;
+                memcpy(dbuf + 2 * x, &pixels, sizeof(pixels));
             }
+        } else {
+            for (Py_ssize_t x = 0; x < job->width; ++x) {
+                uint32_t pixel = sbuf[x];
+                for (Py_ssize_t i = 0; i < factor_x; ++i)
+                    *(dbuf++) = pixel;
+            }
+        }
+        for (Py_ssize_t i = 1; i < job->factor_y; ++i)
+            memcpy(dst_row + i * job->dst_pitch, dst_row, job->width2 * sizeof(uint32_t));
+    }
+}
 
-            short xu = (short)(((xnd + 1) / 2.0f) * width);
-            short yu = (short)(((ynd + 1) / 2.0f) * height);
+static PyObject *method_upscale(PyObject *self, PyObject *args) {
+    /*
+        Nearest neighbour upscale of a surface to a surface whose size is a multiple of its size.
+        Every pixel of a row is repeated, then the row is copied for the next lines of the destination.
+    */
+    PyObject * src_img;
+    PyObject * dst_img;
 
-            if (0 <= xu && xu < width && 0 <= yu && yu < height)
-                dbuf[(y * width + x)] = sbuf[(yu * width + xu)];
+    if (!PyArg_ParseTuple(args, "OO", &src_img, &dst_img))
+        return NULL;
 
-            yn += minus_height;
-        }
-        xn += minus_width;
+    Py_buffer src_buf;
+    Py_buffer dst_buf;
+
+    if (_get_buffer_from_Surface(src_img, &src_buf)) {
+        printf("src_img isn't a valid Surface\n");
+        Py_RETURN_NONE;
+    }
+
+    if (_get_buffer_from_Surface(dst_img, &dst_buf)) {
+        PyBuffer_Release(&src_buf);
+        printf("dst_img isn't a valid Surface\n");
+        Py_RETURN_NONE;
+    }
+
+    Py_ssize_t width = src_buf.shape[0];
+    Py_ssize_t height = src_buf.shape[1];
+    Py_ssize_t width2 = dst_buf.shape[0];
+    Py_ssize_t height2 = dst_buf.shape[1];
+
+    if (src_buf.itemsize != 4 || dst_buf.itemsize != 4) {
+        PyBuffer_Release(&src_buf);
+        PyBuffer_Release(&dst_buf);
+        PyErr_SetString(PyExc_ValueError, "src_img and dst_img must be 32 bits surfaces");
+        return NULL;
+    }
+    if (width == 0 || height == 0 || width2 % width || height2 % height) {
+        PyBuffer_Release(&src_buf);
+        PyBuffer_Release(&dst_buf);
+        PyErr_SetString(PyExc_ValueError, "the size of dst_img must be a multiple of the size of src_img");
+        return NULL;
     }
 
+    struct UpscaleJob job;
+    job.src = (const char *) src_buf.buf;
+    job.dst = (char *) dst_buf.buf;
+    job.src_pitch = src_buf.strides[1];
+    job.dst_pitch = dst_buf.strides[1];
+    job.width = width;
+    job.width2 = width2;
+    job.factor_x = width2 / width;
+    job.factor_y = height2 / height;
+
+    Py_BEGIN_ALLOW_THREADS
+    parallel_bands(height, _upscale_rows, &job);
+    Py_END_ALLOW_THREADS
+
     PyBuffer_Release(&src_buf);
     PyBuffer_Release(&dst_buf);
 
@@ -536,15 +1199,223 @@ static PyObject *method_fish_from_buffer(PyObject *self, PyObject *args) {
 }
 
 
+enum EffectType {
+    EFFECT_DISTORTION,
+    EFFECT_VIGNETTE,
+    EFFECT_COLOR_FILTER,
+};
+
+struct Effect {
+    enum EffectType type;
+    // distortion, blended over the previous effects with an alpha from 0 to 255
+    float alpha;
+    std::vector<Py_ssize_t> source_x; // column sampled for each column
+    std::vector<Py_ssize_t> source_y; // row sampled for each row
+    // vignette
+    float inner_radius;
+    float strength;
+    std::shared_ptr<const VignetteMask> vignette;
+    // color filter
+    struct ColorSelection selection;
+};
+
+static bool _parse_effect(PyObject *item, struct Effect *effect, Py_ssize_t width, Py_ssize_t height) {
+    if (!PyTuple_Check(item) || PyTuple_GET_SIZE(item) == 0 || !PyUnicode_Check(PyTuple_GET_ITEM(item, 0))) {
+        PyErr_SetString(PyExc_TypeError, "an effect must be a tuple starting with its name");
+        return false;
+    }
+    const char *name = PyUnicode_AsUTF8(PyTuple_GET_ITEM(item, 0));
+    if (name == NULL)
+        return false;
+
+    if (!strcmp(name, "distortion")) {
+        effect->type = EFFECT_DISTORTION;
+        int horizontal_distortion = 0;
+        int vertical_distortion = 0;
+        float amplitude = 1.0f;
+        float frequency = 1.0f;
+        float speed = 1.0f;
+        if (!PyArg_ParseTuple(item, "sf|ppfff", &name, &effect->alpha, &horizontal_distortion, &vertical_distortion,
+                              &amplitude, &frequency, &speed))
+            return false;
+        effect->alpha = MIN(MAX(effect->alpha, 0.f), 255.f);
+        _get_distortion_offsets(&effect->source_x, width, horizontal_distortion, amplitude, frequency, speed);
+        _get_distortion_offsets(&effect->source_y, height, vertical_distortion, amplitude, frequency, speed);
+        distortion_time++; // each layer moves like a call to distortion
+    }
+    else if (!strcmp(name, "vignette")) {
+        effect->type = EFFECT_VIGNETTE;
+        effect->inner_radius = 50.0f;
+        effect->strength = 1.0f;
+        if (!PyArg_ParseTuple(item, "s|ff", &name, &effect->inner_radius, &effect->strength))
+            return false;
+        if (effect->strength != 0.f)
+            effect->vignette = _get_vignette_mask(width, height, (float)width / 2, (float)height / 2,
+                                                  effect->inner_radius, effect->strength);
+    }
+    else if (!strcmp(name, "color_filter")) {
+        effect->type = EFFECT_COLOR_FILTER;
+        struct ColorSelection *selection = &effect->selection;
+        if (!PyArg_ParseTuple(item, "s|pppppp", &name, &selection->red, &selection->green, &selection->blue,
+                              &selection->magenta, &selection->yellow, &selection->cyan))
+            return false;
+    }
+    else {
+        PyErr_Format(PyExc_ValueError, "unknown effect '%s'", name);
+        return false;
+    }
+    return true;
+}
+
+struct PipelineJob {
+    uint32_t *buf;
+    Py_ssize_t width;
+    unsigned char *source; // RGB copy of the image, if a distortion samples it
+    const struct Effect *effects;
+    Py_ssize_t effect_count;
+};
+
+static void _pipeline_copy_rows(const void *data, Py_ssize_t start, Py_ssize_t end) {
+    const struct PipelineJob *job = (const struct PipelineJob *) data;
+    Py_ssize_t width = job->width;
+    for (Py_ssize_t y = start; y < end; ++y) {
+        for (Py_ssize_t x = 0; x < width; ++x) {
+            unsigned char *pixel = (unsigned char *)(job->buf + (y * width + x));
+            unsigned char *copy = &job->source[(y * width + x) * 3];
+            copy[0] = pixel[RED];
+            copy[1] = pixel[GREEN];
+            copy[2] = pixel[BLUE];
+        }
+    }
+}
+
+static void _pipeline_rows(const void *data, Py_ssize_t start, Py_ssize_t end) {
+    const struct PipelineJob *job = (const struct PipelineJob *) data;
+    Py_ssize_t width = job->width;
+    const unsigned char *source = job->source;
+    for (Py_ssize_t y = start; y < end; ++y) {
+        for (Py_ssize_t x = 0; x < width; ++x) {
+            unsigned char *pixel = (unsigned char *)(job->buf + (y * width + x));
+            unsigned char r = pixel[RED];
+            unsigned char g = pixel[GREEN];
+            unsigned char b = pixel[BLUE];
+
+            for (Py_ssize_t i = 0; i < job->effect_count; ++i) {
+                const struct Effect &effect = job->effects[i];
+                switch (effect.type) {
+                    case EFFECT_DISTORTION: {
+                        const unsigned char *sample = &source[(effect.source_y[y] * width + effect.source_x[x]) * 3];
+                        r = (unsigned char)(r + (sample[0] - r) * effect.alpha / 255.f);
+                        g = (unsigned char)(g + (sample[1] - g) * effect.alpha / 255.f);
+                        b = (unsigned char)(b + (sample[2] - b) * effect.alpha / 255.f);
+                        break;
+                    }
+                    case EFFECT_VIGNETTE: {
+                        uint16_t factor = effect.vignette->factor[y * width + x];
+                        r = (unsigned char)((r * factor) >> 8);
+                        g = (unsigned char)((g * factor) >> 8);
+                        b = (unsigned char)((b * factor) >> 8);
+                        break;
+                    }
+                    case EFFECT_COLOR_FILTER:
+                        if (!_is_selected_color(r, g, b, &effect.selection))
+                            _sepia(&r, &g, &b);
+                        break;
+                }
+            }
+
+            pixel[RED] = r;
+            pixel[GREEN] = g;
+            pixel[BLUE] = b;
+        }
+    }
+}
+
+static PyObject *method_pipeline(PyObject *self, PyObject *args) {
+    /*
+        Apply a list of effects to a surface, in a single pass over its pixels.
+        The effects are tuples:
+            ("distortion", alpha, horizontal_distortion, vertical_distortion, amplitude, frequency, speed)
+                a distorted copy of the image blended with an alpha from 0 to 255, like a distortion blitted with set_alpha.
+                Every distortion samples the image given to the pipeline, not the result of the previous effects.
+            ("vignette", inner_radius, strength)
+            ("color_filter", red, green, blue, magenta, yellow, cyan)
+        They are applied in order to each pixel.
+    */
+    PyObject * img;
+    PyObject * effects_list;
+
+    if (!PyArg_ParseTuple(args, "OO", &img, &effects_list))
+        return NULL;
+
+    PyObject *effects_seq = PySequence_Fast(effects_list, "effects must be a sequence");
+    if (effects_seq == NULL)
+        return NULL;
+
+    Py_buffer buffer;
+    if (_get_3DBuffer_from_Surface(img, &buffer)) {
+        Py_DECREF(effects_seq);
+        printf("image isn't a valid Surface\n");
+        Py_RETURN_NONE;
+    }
+
+    Py_ssize_t width = buffer.shape[0];
+    Py_ssize_t height = buffer.shape[1];
+
+    Py_ssize_t count = PySequence_Fast_GET_SIZE(effects_seq);
+    std::vector<struct Effect> effects(count);
+    bool distortion = false;
+    Py_ssize_t kept = 0;
+    for (Py_ssize_t i = 0; i < count; ++i) {
+        struct Effect *effect = &effects[kept];
+        if (!_parse_effect(PySequence_Fast_GET_ITEM(effects_seq, i), effect, width, height)) {
+            Py_DECREF(effects_seq);
+            PyBuffer_Release(&buffer);
+            return NULL;
+        }
+        // skip the effects that don't change anything
+        if ((effect->type == EFFECT_DISTORTION && effect->alpha == 0.f) ||
+            (effect->type == EFFECT_VIGNETTE && effect->strength == 0.f))
+            continue;
+        distortion |= effect->type == EFFECT_DISTORTION;
+        ++kept;
+    }
+    Py_DECREF(effects_seq);
+    effects.resize(kept);
+
+    uint32_t *buf = (uint32_t *) buffer.buf;
+
+    // The distortions sample the original image, which is overwritten during the pass.
+    thread_local std::vector<unsigned char> source;
+    if (distortion)
+        source.resize(width * height * 3);
+
+    struct PipelineJob job = {buf, width, source.data(), effects.data(), (Py_ssize_t)effects.size()};
+    Py_BEGIN_ALLOW_THREADS
+    if (distortion)
+        parallel_bands(height, _pipeline_copy_rows, &job);
+    parallel_bands(height, _pipeline_rows, &job);
+    Py_END_ALLOW_THREADS
+
+    PyBuffer_Release(&buffer);
+
+    Py_RETURN_NONE;
+}
+
 
 static PyMethodDef FilterMethods[] = {
     {"fish", method_fish_from_buffer, METH_VARARGS, "FishEye effect. Takes a two pygame Surfaces and a float as arguments."},
     {"distortion", (PyCFunction) method_distortion_from_buffer, METH_VARARGS | METH_KEYWORDS, "Earthbound distortion effect"},
     {"color_filter", (PyCFunction) method_color_filter_from_buffer, METH_VARARGS | METH_KEYWORDS, "Color selection. Takes a pygame Surface and color boolean arguments."},
     {"vignette", (PyCFunction) method_vignette, METH_VARARGS | METH_KEYWORDS, "Vignette effect."},
-    {"blur", (PyCFunction) method_blur, METH_VARARGS | METH_KEYWORDS, "Blur effect."},
+    {"darken_by_depth", (PyCFunction) method_darken_by_depth, METH_VARARGS | METH_KEYWORDS, "Darken a pygame Surface with the depth buffer written by RayCaster.raycasting, a cheaper vignette."},
+    {"blur", (PyCFunction) method_blur, METH_VARARGS | METH_KEYWORDS, "Box blur of a pygame Surface, in place. Takes a radius, a number of passes and a number of threads, 0 to use the threads set with set_threads."},
     {"display_in_3D_space", (PyCFunction) method_display_surface_in_3D_space, METH_VARARGS | METH_KEYWORDS, "Display a pygame Surface in 3D space."},
     {"mode_seven", (PyCFunction) method_mode_seven, METH_VARARGS | METH_KEYWORDS, "Mode 7 effect."},
+    {"pipeline", method_pipeline, METH_VARARGS, "Applies a list of effects to a pygame Surface in a single pass."},
+    {"upscale", method_upscale, METH_VARARGS, "Nearest neighbour upscale. Takes two pygame Surfaces, the size of the second being a multiple of the first."},
+    {"set_threads", method_set_threads, METH_VARARGS, "Set the number of threads used by the filters, 0 to use every core."},
+    {"get_threads", method_get_threads, METH_NOARGS, "Return the number of threads used by the filters."},
     {NULL, NULL, 0, NULL}
 };
 
@@ -1,7 +1,27 @@
 from setuptools import setup, Extension
+from setuptools.command.build_ext import build_ext
 # import numpy
 
 
+# The flags depend on the compiler: MSVC on Windows, gcc or clang everywhere else.
+COMPILE_ARGS: dict[str, list[str]] = {
+    "msvc": ["/O2", "/GS-", "/fp:fast"],
+    "unix": ["-O3", "-pthread"],
+}
+LINK_ARGS: dict[str, list[str]] = {
+    "unix": ["-pthread"],
+}
+
+
+class BuildExt(build_ext):
+    def build_extensions(self):
+        compiler_type = self.compiler.compiler_type
+        for extension in self.extensions:
+            extension.extra_compile_args = COMPILE_ARGS.get(compiler_type, [])
+            extension.extra_link_args = LINK_ARGS.get(compiler_type, [])
+        super().build_extensions()
+
+
 def main():
     setup(name="nostalgiaefilters",
           version="1.0.0",
@@ -13,9 +33,9 @@ def main():
                   "nostalgiaefilters",
                   ["filter.cpp"],
                   # include_dirs=[numpy.get_include()],
-                  extra_compile_args=["/O2", "/GS-", "/fp:fast"]
               )
-          ]
+          ],
+          cmdclass={"build_ext": BuildExt},
           )
 
 
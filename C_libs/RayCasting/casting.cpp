@@ -1,6 +1,12 @@
 #include <Python.h>
 #include <cmath>
+#include <cstdint>
 #include <cfloat>
+#include <algorithm>
+#include <atomic>
+#include <thread>
+#include <mutex>
+#include <condition_variable>
 
 #define M_PI 3.14159265358979323846f
 // #define FLT_MAX 3.402823466e+38f
@@ -19,11 +25,121 @@
 #define MIN(a, b) ((a) < (b) ? (a) : (b))
 #define MAX(a, b) ((a) > (b) ? (a) : (b))
 
+// The per ray functions are too big for the compiler to inline them by itself,
+// but calling them for every pixel is much slower.
+#ifdef _MSC_VER
+#define FORCE_INLINE __forceinline
+#else
+#define FORCE_INLINE inline __attribute__((always_inline))
+#endif
+
+#define BVH_LEAF_SIZE 2
+#define BVH_STACK_SIZE 64
+
+#define MAX_LAYERS 8 // translucent hits blended by a ray in the ordered mode
+
+#define BANDS_PER_THREAD 4 // more bands than threads, so a slow band does not stall the others
+
+#define INTERLEAVE_CHECKERBOARD 1
+#define INTERLEAVE_LINES 2
+#define HISTORY_MAX_MOVE 0.01f // distance the camera can move while the cells of the previous frame are reused
+
+#define MAX_RATES 8
+#define MAX_DIRTY_RECTS 16
+
+struct RateMap {
+    /* Radial rate map of the variable rate mode: a single ray is cast for a block of rate * rate cells of the ray table.
+        The screen is split in tiles of the largest rate, and a tile takes the rate of the closest of its pixels
+        to the center of the screen: the last rate whose radius, in pixels, is not above this distance.
+        The rate is 1 in the center, and a rate of 0 casts no ray in the tile.
+    */
+    int count; // 0 to cast every cell
+    float radius[MAX_RATES]; // in increasing order
+    int rate[MAX_RATES];
+    int tile; // largest rate, every other rate divides it
+};
+
+struct CellRect {
+    // Rectangle of cells of the ray table, [row, row_end[ x [column, column_end[, empty if row >= row_end.
+    Py_ssize_t row;
+    Py_ssize_t row_end;
+    Py_ssize_t column;
+    Py_ssize_t column_end;
+};
+
+struct Cell {
+    // What the ray of a cell hit.
+    uint32_t pixel; // 0 if nothing was hit
+    float depth; // distance to the closest surface seen by the ray, INFINITY if nothing was hit
+    uint32_t id; // id of that surface, 0 if nothing was hit
+};
+
+static const struct Cell EMPTY_CELL = {0, INFINITY, 0};
+
+struct DirtyRects {
+    // Cells cast again in a frame, see add_dirty_rect.
+    int count;
+    struct CellRect rects[MAX_DIRTY_RECTS];
+};
+
+struct FrameKey {
+    /* Everything that changes the rays of a frame. Compared with memcmp, so it is zeroed before being filled. */
+    float x, y, z;
+    float angle_x, angle_y;
+    float fov;
+    float view_distance;
+    Py_ssize_t width;
+    Py_ssize_t height;
+    int step;
+    int ordered;
+    int interleave;
+    struct RateMap rates;
+};
+
 typedef struct t_RayCasterObject{
     PyObject_HEAD
-    struct Surface *surfaces = nullptr;
+    struct Surface *surfaces = nullptr; // static surfaces, indexed by the BVH
+    struct Surface *temp_surfaces = nullptr; // dynamic and temporary surfaces, tested one by one
+    struct BVHNode *bvh_nodes = nullptr;
+    struct Surface **bvh_surfaces = nullptr;
+    int bvh_size = 0;
+    int bvh_surface_count = 0;
+    bool bvh_dirty = false; // the static surfaces changed since the last build
+    bool casting = false; // a raycasting is running without the GIL
+    struct RayTable *ray_table = nullptr; // directions of the rays, kept between frames
+    struct Surface **visible_surfaces = nullptr; // dynamic surfaces left after the culling
+    int visible_count = 0;
+    int visible_capacity = 0;
+    int static_culled = 0; // culled surfaces of the last frame, for profiling
+    int dynamic_count = 0;
+    int dynamic_culled = 0;
+    struct SortedSurface *sorted_surfaces = nullptr; // visible surfaces from the closest, for the ordered mode
+    int sorted_count = 0;
+    int sorted_capacity = 0;
+    struct Cell *history = nullptr; // cells of the last two frames of the interleaved mode, history_cells each
+    Py_ssize_t history_cells = 0;
+    bool history_valid = false; // the cells of the previous frame can be reused
+    unsigned long frame = 0; // frames rendered in the interleaved mode
+    float history_x; // camera of the previous frame
+    float history_y;
+    float history_z;
+    float history_angle_x;
+    float history_angle_y;
+    unsigned long scene_version = 0; // incremented when a static surface changes
+    struct FrameKey frame_key; // rays and static surfaces of the last frame, to reuse its cells
+    unsigned long frame_scene_version = 0;
+    int same_frames = 0; // frames in a row with the same key
+    struct DirtyRects pending; // cells of the removed dynamic surfaces, to render again
+    struct DirtyRects dirty; // cells cast by the last frame
+    uint32_t last_id = 0; // id of the last surface added, the ids start at 1
 } RayCasterObject;
 
+typedef struct t_SurfaceHandleObject{
+    PyObject_HEAD
+    RayCasterObject *caster; // strong reference, the surface belongs to it
+    struct Surface *surface; // nullptr once the surface has been freed
+} SurfaceHandleObject;
+
 typedef struct vec3 {
     /*
         y
@@ -61,13 +177,67 @@ struct pos3 {
 struct Surface {
     struct pos3 pos;
     vec3 bc;
+    vec3 min; // bounding box of the area that can be hit
+    vec3 max;
+    vec3 u_axis; // |dot(P - A, u_axis)| is the column of the texel at the point P
+    vec3 v_axis; // |dot(P - bc, v_axis)| is its row, from the bottom of the texture
+    int repeat_x; // number of times the image is tiled along the edge C-B
+    int repeat_y; // and along the edge C-A
     bool del;
+    bool in_bvh; // the surface is in the static list
+    bool hidden;
+    bool culled; // hidden or out of the view, for the current frame
+    unsigned long version; // incremented when a dynamic surface changes
+    unsigned long drawn_version; // version of the last frame
+    uint32_t id; // written in the id buffer of raycasting
+    struct CellRect cells; // cells the surface can cover in the last frame
     struct Surface *next;
     Py_buffer buffer;
     PyObject *parent;
+    SurfaceHandleObject *handle; // borrowed, nullptr if there is no handle
+};
+
+struct RayTable {
+    /* Direction of the rays in camera space, for a given resolution, step and fov.
+        The projection is separable: a row only sets the elevation of the ray, and a column its heading.
+        The view angles are added with the angle addition formulas, so no trigonometry is left per pixel.
+    */
+    Py_ssize_t width;
+    Py_ssize_t height;
+    int step;
+    float fov;
+    Py_ssize_t rows;
+    Py_ssize_t columns;
+    float *row_sin; // elevation of each row
+    float *row_cos;
+    float *column_cos; // heading of each column
+    float *column_sin;
+    float *row_y; // vertical and horizontal length of the rays of each row, updated every frame
+    float *row_hypo;
+    float *column_x; // heading rotated by angle_y, updated every frame
+    float *column_z;
+};
+
+struct SortedSurface {
+    float distance; // distance between the camera and the bounding box of the surface
+    struct Surface *surface;
+};
+
+struct BVHNode {
+    /* Node of the bounding volume hierarchy built over the static surfaces.
+        An inner node has its two children at nodes[first] and nodes[first + 1].
+        A leaf holds the surfaces bvh_surfaces[first] to bvh_surfaces[first + count - 1].
+    */
+    vec3 min;
+    vec3 max;
+    int first;
+    int count; // 0 for an inner node
+    bool culled; // out of the view, for the current frame
 };
 
 inline void free_surface(struct Surface *surface) {
+    if (surface->handle != nullptr)
+        surface->handle->surface = nullptr; // the handle outlives the surface
     PyBuffer_Release(&(surface->buffer));
     Py_DECREF(surface->parent);
     free(surface);
@@ -97,6 +267,109 @@ inline void free_temp_surfaces(struct Surface **surfaces) {
 
 }
 
+inline void free_surface_list(struct Surface **surfaces) {
+    struct Surface *next;
+    for (struct Surface *surface = *surfaces; surface != nullptr; surface = next) {
+        next = surface->next;
+        free_surface(surface);
+    }
+    *surfaces = nullptr;
+}
+
+/*
+    Pool of native threads shared by all the casters.
+    The workers sleep until a job is given, then take the tasks of the job one by one.
+    The calling thread works on the job too, and returns once every task is done.
+*/
+typedef void (*task_function)(int task, void *data);
+
+struct ThreadPool {
+    std::mutex busy; // held by the thread giving a job, for the whole job
+    std::mutex mutex;
+    std::condition_variable wake_up;
+    std::condition_variable finished;
+    int size = 0; // number of workers, without the calling thread
+    unsigned long generation = 0; // incremented for each new job
+
+    task_function function = nullptr;
+    void *data = nullptr;
+    int task_count = 0;
+    int workers_wanted = 0;
+    std::atomic<int> next_task{0};
+    int workers_running = 0;
+};
+
+static struct ThreadPool *THREAD_POOL = nullptr;
+
+static void run_tasks(struct ThreadPool *pool) {
+    int task;
+    while ((task = pool->next_task.fetch_add(1)) < pool->task_count)
+        pool->function(task, pool->data);
+}
+
+static void worker_loop(struct ThreadPool *pool, int index) {
+    unsigned long seen = 0;
+    while (true) {
+        std::unique_lock<std::mutex> lock(pool->mutex);
+        pool->wake_up.wait(lock, [pool, seen] { return pool->generation != seen; });
+        seen = pool->generation;
+        if (index >= pool->workers_wanted)
+            continue;
+        lock.unlock();
+
+        run_tasks(pool);
+
+        lock.lock();
+        if (--pool->workers_running == 0)
+            pool->finished.notify_one();
+    }
+}
+
+static int default_thread_count() {
+    unsigned int count = std::thread::hardware_concurrency();
+    return count ? (int)count : 1;
+}
+
+static void parallel_for(int task_count, task_function function, void *data, int threads) {
+    /*
+        Call function(task, data) for every task in [0, task_count[ using at most "threads" threads.
+        Must be called without the GIL, by one thread at a time.
+    */
+    if (threads > task_count)
+        threads = task_count;
+    if (threads <= 1) {
+        for (int task = 0; task < task_count; ++task)
+            function(task, data);
+        return;
+    }
+
+    if (THREAD_POOL == nullptr) { // The workers live until the end of the program.
+        THREAD_POOL = new ThreadPool();
+        THREAD_POOL->size = default_thread_count() - 1;
+        for (int i = 0; i < THREAD_POOL->size; ++i)
+            std::thread(worker_loop, THREAD_POOL, i).detach();
+    }
+    struct ThreadPool *pool = THREAD_POOL;
+    std::lock_guard<std::mutex> busy(pool->busy);
+
+    {
+        std::lock_guard<std::mutex> lock(pool->mutex);
+        pool->function = function;
+        pool->data = data;
+        pool->task_count = task_count;
+        pool->next_task = 0;
+        pool->workers_wanted = MIN(threads - 1, pool->size);
+        pool->workers_running = pool->workers_wanted;
+        ++pool->generation;
+    }
+    pool->wake_up.notify_all();
+
+    run_tasks(pool);
+
+    std::unique_lock<std::mutex> lock(pool->mutex);
+    pool->finished.wait(lock, [pool] { return pool->workers_running == 0; });
+}
+
 // static struct Surface *SURFACES = nullptr;
 
 inline vec3 vec3_add(vec3 a, vec3 b) {
@@ -142,6 +415,144 @@ inline void get_norm_of_plane(vec3 A, vec3 B, vec3 C, vec3 *norm) {
 }
 
 
+inline float vec3_axis(vec3 a, int axis) {
+    return axis == 0 ? a.x : (axis == 1 ? a.y : a.z);
+}
+
+inline void get_bounds_of_surface(struct Surface *surface) {
+    /*
+        The hit test only accepts intersections inside the box spanned by A and B
+        (with an EPSILON margin), so this box is also the bounding box of the surface.
+    */
+    vec3 A = surface->pos.A;
+    vec3 B = surface->pos.B;
+    surface->min = {MIN(A.x, B.x) - EPSILON, MIN(A.y, B.y) - EPSILON, MIN(A.z, B.z) - EPSILON};
+    surface->max = {MAX(A.x, B.x) + EPSILON, MAX(A.y, B.y) + EPSILON, MAX(A.z, B.z) + EPSILON};
+}
+
+static void build_bvh_node(struct BVHNode *nodes, int *node_count, struct Surface **surfaces,
+                           int index, int first, int count) {
+    /*
+        Fill nodes[index] with the node covering surfaces[first] to surfaces[first + count - 1].
+        The surfaces are split in two halves around the median of their centers,
+        along the axis where the centers are the most spread out.
+    */
+    struct BVHNode *node = nodes + index;
+
+    vec3 min = {FLT_MAX, FLT_MAX, FLT_MAX};
+    vec3 max = {-FLT_MAX, -FLT_MAX, -FLT_MAX};
+    vec3 center_min = min;
+    vec3 center_max = max;
+    for (int i = first; i < first + count; ++i) {
+        struct Surface *surface = surfaces[i];
+        min = {MIN(min.x, surface->min.x), MIN(min.y, surface->min.y), MIN(min.z, surface->min.z)};
+        max = {MAX(max.x, surface->max.x), MAX(max.y, surface->max.y), MAX(max.z, surface->max.z)};
+        vec3 center = vec3_dot_float(vec3_add(surface->min, surface->max), 0.5f);
+        center_min = {MIN(center_min.x, center.x), MIN(center_min.y, center.y), MIN(center_min.z, center.z)};
+        center_max = {MAX(center_max.x, center.x), MAX(center_max.y, center.y), MAX(center_max.z, center.z)};
+    }
+    node->min = min;
+    node->max = max;
+
+    if (count <= BVH_LEAF_SIZE) {
+        node->first = first;
+        node->count = count;
+        return;
+    }
+
+    vec3 spread = vec3_sub(center_max, center_min);
+    int axis = 0;
+    if (spread.y > spread.x)
+        axis = 1;
+    if (spread.z > vec3_axis(spread, axis))
+        axis = 2;
+
+    int half = count / 2;
+    std::nth_element(surfaces + first, surfaces + first + half, surfaces + first + count,
+                     [axis](struct Surface *a, struct Surface *b) {
+                         return vec3_axis(a->min, axis) + vec3_axis(a->max, axis)
+                                < vec3_axis(b->min, axis) + vec3_axis(b->max, axis);
+                     });
+
+    // The two children are stored next to each other.
+    int left = *node_count;
+    *node_count += 2;
+    node->first = left;
+    node->count = 0;
+    build_bvh_node(nodes, node_count, surfaces, left, first, half);
+    build_bvh_node(nodes, node_count, surfaces, left + 1, first + half, count - half);
+}
+
+static bool build_bvh(RayCasterObject *self) {
+    /*
+        Rebuild the bounding volume hierarchy over the static surfaces.
+        @return: true on error (memory), false on success
+    */
+    free(self->bvh_nodes);
+    free(self->bvh_surfaces);
+    self->bvh_nodes = nullptr;
+    self->bvh_surfaces = nullptr;
+    self->bvh_size = 0;
+    self->bvh_surface_count = 0;
+    self->bvh_dirty = false;
+
+    int count = 0;
+    for (struct Surface *surface = self->surfaces; surface != nullptr; surface = surface->next)
+        ++count;
+    if (count == 0)
+        return false;
+
+    self->bvh_surfaces = (struct Surface **) malloc(count * sizeof(struct Surface *));
+    self->bvh_nodes = (struct BVHNode *) malloc((2 * count - 1) * sizeof(struct BVHNode));
+    if (self->bvh_surfaces == nullptr || self->bvh_nodes == nullptr) {
+        self->bvh_dirty = true;
+        return true;
+    }
+
+    int i = 0;
+    for (struct Surface *surface = self->surfaces; surface != nullptr; surface = surface->next)
+        self->bvh_surfaces[i++] = surface;
+
+    self->bvh_surface_count = count;
+    self->bvh_size = 1;
+    build_bvh_node(self->bvh_nodes, &(self->bvh_size), self->bvh_surfaces, 0, 0, count);
+    return false;
+}
+
+inline bool ray_slab_collision(float origin, float inv_direction, float min, float max, float *t_min, float *t_max) {
+    /*
+        Narrow [t_min, t_max] to the part of the segment between min and max on one axis.
+        A segment parallel to the slab (a direction of 0, so an infinite inverse) is either always or never in it,
+        the product of 0 and the infinite inverse would be NaN.
+        @return: false if the segment can't be in the slab
+    */
+    if (std::isinf(inv_direction))
+        return min <= origin && origin <= max;
+    float t1 = (min - origin) * inv_direction;
+    float t2 = (max - origin) * inv_direction;
+    *t_min = MAX(*t_min, MIN(t1, t2));
+    *t_max = MIN(*t_max, MAX(t1, t2));
+    return true;
+}
+
+inline bool ray_box_collision(vec3 origin, vec3 inv_direction, vec3 min, vec3 max, float *t_enter) {
+    /*
+        Slab test between a box and the segment origin + t * direction, t in [0, 1].
+        @param t_enter: the value of t where the segment enters the box
+        @return: true if the segment goes through the box, false otherwise
+    */
+    float t_min = -INFINITY;
+    float t_max = INFINITY;
+    if (!ray_slab_collision(origin.x, inv_direction.x, min.x, max.x, &t_min, &t_max)
+        || !ray_slab_collision(origin.y, inv_direction.y, min.y, max.y, &t_min, &t_max)
+        || !ray_slab_collision(origin.z, inv_direction.z, min.z, max.z, &t_min, &t_max))
+        return false;
+
+    *t_enter = MAX(t_min, 0.f);
+    return t_max >= *t_enter && t_min <= 1.f;
+}
+
+
 inline bool line_plane_collision(vec3 plane_point, vec3 plane_normal,
                                  vec3 line_point, vec3 line_direction,
                                  vec3* intersection) {
@@ -224,7 +635,7 @@ inline bool segment_plane_collision(struct pos3 plane, struct pos2 segment,
 }
 
 /*
-inline bool get_pixel(struct Surface *surface, vec3 point, long *pixel) {
+inline bool get_pixel(struct Surface *surface, vec3 point, uint32_t *pixel) {
 
     vec3 ab = vec3_sub(surface->bc, surface->pos.A);
     vec3 av = vec3_sub(point, surface->pos.A);
@@ -247,7 +658,7 @@ inline bool get_pixel(struct Surface *surface, vec3 point, long *pixel) {
 //    if (x >= width || y >= height)
 //        return false;
 
-    long *buf = (long *)surface->buffer.buf;
+    uint32_t *buf = (uint32_t *)surface->buffer.buf;
     *pixel = buf[y * width + x];
 
     return true;
@@ -255,30 +666,22 @@ inline bool get_pixel(struct Surface *surface, vec3 point, long *pixel) {
 */
 
 inline unsigned char *get_pixel_3d(struct Surface *surface, vec3 point) {
-    vec3 ab = vec3_sub(surface->bc, surface->pos.A);
-    vec3 av = vec3_sub(point, surface->pos.A);
-
-    double x_dist = vec3_length(vec3_cross(ab, av)) / vec3_length(ab);
-
-    vec3 bc = vec3_sub(surface->pos.B, surface->bc);
-    vec3 bv = vec3_sub(point, surface->bc);
-
-    double y_dist = vec3_length(vec3_cross(bc, bv)) / vec3_length(bc);
-
-    float x_len = vec3_dist(surface->bc, surface->pos.B);
-    float y_len = vec3_dist(surface->bc, surface->pos.A);
-
     Py_ssize_t width = surface->buffer.shape[0];
     Py_ssize_t height = surface->buffer.shape[1];
 
-    Py_ssize_t x = (Py_ssize_t)(x_dist * width / x_len);
-    Py_ssize_t y = height - (Py_ssize_t)(y_dist * height / y_len);
+    // The axes are scaled to the size of the tiled image, the texel is then wrapped back into the image.
+    Py_ssize_t x = (Py_ssize_t)fabsf(vec3_dot(vec3_sub(point, surface->pos.A), surface->u_axis));
+    Py_ssize_t y = height * surface->repeat_y - (Py_ssize_t)fabsf(vec3_dot(vec3_sub(point, surface->bc), surface->v_axis));
 
-    if (x >= width || y >= height)
+    if (x >= width * surface->repeat_x || y >= height * surface->repeat_y || y < 0)
         return nullptr;
+    if (surface->repeat_x > 1)
+        x %= width;
+    if (surface->repeat_y > 1)
+        y %= height;
 
-    long *buf = (long *)surface->buffer.buf;
-    long *pixel = buf + (y * width + x);
+    uint32_t *buf = (uint32_t *)surface->buffer.buf;
+    uint32_t *pixel = buf + (y * width + x);
 
     return (unsigned char*) pixel;
 }
@@ -310,55 +713,193 @@ inline bool get_closest_surface(struct pos2 ray, float *dist, struct Surface **s
 
 
 
-inline unsigned long get_pixel_sum(struct pos2 ray, struct Surface *surface) {
-    unsigned long pixel = 0;
+FORCE_INLINE void add_surface_to_pixel(struct pos2 ray, struct Surface *surface,
+                                       uint32_t *pixel, int *alpha_sum, float *min_distance, struct Surface **hit) {
+    /*
+        Blend the color of the surface where the ray hits it into the pixel.
+        The closest surface seen by the ray is kept in hit, at min_distance.
+    */
+    if (surface->culled)
+        return;
 
-    int alpha_sum = 0;
-    unsigned char *pixel_ptr = (unsigned char*)&pixel;
-    float min_distance = FLT_MAX;
-    for (; surface != nullptr; surface = surface->next) {
+    unsigned char *pixel_ptr = (unsigned char*)pixel;
 
-        vec3 intersection;
-        float distance;
-        if (!segment_plane_collision(surface->pos, ray, &intersection, &distance))
-            continue;
+    vec3 intersection;
+    float distance;
+    if (!segment_plane_collision(surface->pos, ray, &intersection, &distance))
+        return;
 
-        bool far = distance >= min_distance;
+    bool far = distance >= *min_distance;
 
-        if (pixel_ptr[P_ALPHA] == 255 && far)
-            continue;
+    if (pixel_ptr[P_ALPHA] == 255 && far)
+        return;
 
-        unsigned char *new_pixel_ptr = get_pixel_3d(surface, intersection);
+    unsigned char *new_pixel_ptr = get_pixel_3d(surface, intersection);
 
-        if (new_pixel_ptr == nullptr || new_pixel_ptr[ALPHA] == 0)
-            continue;
+    if (new_pixel_ptr == nullptr || new_pixel_ptr[ALPHA] == 0)
+        return;
 
-        if (!far){
-            min_distance = distance;
-            if (new_pixel_ptr[ALPHA] == 255){
-                pixel = *((unsigned long *)(new_pixel_ptr - 3));
-                alpha_sum = 255;
-                continue;
-            }
+    if (!far){
+        *min_distance = distance;
+        *hit = surface;
+        if (new_pixel_ptr[ALPHA] == 255){
+            *pixel = *((uint32_t *)(new_pixel_ptr - 3));
+            *alpha_sum = 255;
+            return;
         }
+    }
 
-        alpha_sum += new_pixel_ptr[ALPHA];
+    *alpha_sum += new_pixel_ptr[ALPHA];
 
-        float alpha_factor = (float)pixel_ptr[P_ALPHA] / alpha_sum;
-        float alpha_factor2 = (float)new_pixel_ptr[ALPHA] / alpha_sum;
+    float alpha_factor = (float)pixel_ptr[P_ALPHA] / *alpha_sum;
+    float alpha_factor2 = (float)new_pixel_ptr[ALPHA] / *alpha_sum;
 
-        pixel_ptr[P_ALPHA] += (unsigned char)(alpha_factor2 - alpha_factor);
-        pixel_ptr[P_BLUE] += (unsigned char)(new_pixel_ptr[BLUE] * alpha_factor2 - pixel_ptr[P_BLUE] * alpha_factor );
-        pixel_ptr[P_GREEN] += (unsigned char)(new_pixel_ptr[GREEN] * alpha_factor2 - pixel_ptr[P_GREEN] * alpha_factor);
-        pixel_ptr[P_RED] += (unsigned char)(new_pixel_ptr[RED] * alpha_factor2 - pixel_ptr[P_RED] * alpha_factor);
+    pixel_ptr[P_ALPHA] += (unsigned char)(alpha_factor2 - alpha_factor);
+    pixel_ptr[P_BLUE] += (unsigned char)(new_pixel_ptr[BLUE] * alpha_factor2 - pixel_ptr[P_BLUE] * alpha_factor );
+    pixel_ptr[P_GREEN] += (unsigned char)(new_pixel_ptr[GREEN] * alpha_factor2 - pixel_ptr[P_GREEN] * alpha_factor);
+    pixel_ptr[P_RED] += (unsigned char)(new_pixel_ptr[RED] * alpha_factor2 - pixel_ptr[P_RED] * alpha_factor);
 
 //        pixel_ptr[P_ALPHA] += (new_pixel_ptr[ALPHA] - pixel_ptr[P_ALPHA]) / alpha_sum;
 //        pixel_ptr[P_BLUE] += new_pixel_ptr[BLUE] * new_pixel_ptr[ALPHA] / alpha_sum;
 //        pixel_ptr[P_GREEN] += new_pixel_ptr[GREEN] * new_pixel_ptr[ALPHA] / alpha_sum;
 //        pixel_ptr[P_RED] += new_pixel_ptr[RED] * new_pixel_ptr[ALPHA] / alpha_sum;
+}
+
+FORCE_INLINE uint32_t get_pixel_sum(struct pos2 ray, RayCasterObject *caster, float *depth, struct Surface **hit) {
+    uint32_t pixel = 0;
+
+    int alpha_sum = 0;
+    unsigned char *pixel_ptr = (unsigned char*)&pixel;
+    float min_distance = FLT_MAX;
+
+    // Temporary surfaces were pushed last, so they are still the first to be tested.
+    for (int i = 0; i < caster->visible_count; ++i)
+        add_surface_to_pixel(ray, caster->visible_surfaces[i], &pixel, &alpha_sum, &min_distance, hit);
+
+    // Walk the BVH of the static surfaces, closest child first,
+    // and skip the boxes that are behind an opaque hit.
+    if (caster->bvh_size) {
+        vec3 inv_direction = {1.f / ray.B.x, 1.f / ray.B.y, 1.f / ray.B.z};
+        float ray_length = (float)vec3_length(ray.B);
+
+        int stack[BVH_STACK_SIZE];
+        float stack_distance[BVH_STACK_SIZE]; // distance where the ray enters the node
+        int stack_size = 0;
+        float t_enter;
+        if (!caster->bvh_nodes[0].culled
+            && ray_box_collision(ray.A, inv_direction, caster->bvh_nodes[0].min, caster->bvh_nodes[0].max, &t_enter)) {
+            stack[0] = 0;
+            stack_distance[0] = t_enter * ray_length;
+            stack_size = 1;
+        }
+
+        while (stack_size) {
+            --stack_size;
+            if (pixel_ptr[P_ALPHA] == 255 && stack_distance[stack_size] >= min_distance)
+                continue; // An opaque surface closer than this node has already been found.
+
+            struct BVHNode *node = caster->bvh_nodes + stack[stack_size];
+
+            if (node->count) {
+                for (int i = node->first; i < node->first + node->count; ++i)
+                    add_surface_to_pixel(ray, caster->bvh_surfaces[i], &pixel, &alpha_sum, &min_distance, hit);
+                continue;
+            }
+
+            float t_left, t_right;
+            struct BVHNode *left = caster->bvh_nodes + node->first;
+            struct BVHNode *right = left + 1;
+            bool hit_left = !left->culled && ray_box_collision(ray.A, inv_direction, left->min, left->max, &t_left);
+            bool hit_right = !right->culled && ray_box_collision(ray.A, inv_direction, right->min, right->max, &t_right);
+
+            // Push the farthest child first so the closest one is visited first.
+            if (hit_left && hit_right && t_left < t_right) {
+                stack[stack_size] = node->first + 1;
+                stack_distance[stack_size++] = t_right * ray_length;
+                hit_right = false;
+            }
+            if (hit_left) {
+                stack[stack_size] = node->first;
+                stack_distance[stack_size++] = t_left * ray_length;
+            }
+            if (hit_right) {
+                stack[stack_size] = node->first + 1;
+                stack_distance[stack_size++] = t_right * ray_length;
+            }
+        }
     }
+
     pixel_ptr[P_ALPHA] = 0;
 
+    *depth = *hit == nullptr ? INFINITY : min_distance;
+    return pixel;
+}
+
+FORCE_INLINE uint32_t get_pixel_sorted(struct pos2 ray, RayCasterObject *caster, float *depth, struct Surface **hit) {
+    /*
+        Ordered mode: the surfaces are tested from the closest, and the ray stops
+        as soon as the next surface is behind an opaque hit.
+        The hits are then composited from front to back.
+    */
+    float layer_distance[MAX_LAYERS];
+    unsigned char *layer_color[MAX_LAYERS];
+    struct Surface *layer_surface[MAX_LAYERS];
+    int layers = 0;
+    float opaque_distance = FLT_MAX;
+
+    for (int i = 0; i < caster->sorted_count; ++i) {
+        struct SortedSurface *sorted = caster->sorted_surfaces + i;
+        if (sorted->distance >= opaque_distance)
+            break; // Every remaining surface is behind an opaque hit.
+
+        vec3 intersection;
+        float distance;
+        if (!segment_plane_collision(sorted->surface->pos, ray, &intersection, &distance) || distance >= opaque_distance)
+            continue;
+
+        unsigned char *color = get_pixel_3d(sorted->surface, intersection);
+        if (color == nullptr || color[ALPHA] == 0)
+            continue;
+        if (color[ALPHA] == 255)
+            opaque_distance = distance;
+
+        // Keep the layers sorted by distance, the farthest one is dropped when there are too many.
+        if (layers == MAX_LAYERS && distance >= layer_distance[MAX_LAYERS - 1])
+            continue;
+        int j = layers < MAX_LAYERS ? layers++ : MAX_LAYERS - 1;
+        for (; j > 0 && layer_distance[j - 1] > distance; --j) {
+            layer_distance[j] = layer_distance[j - 1];
+            layer_color[j] = layer_color[j - 1];
+            layer_surface[j] = layer_surface[j - 1];
+        }
+        layer_distance[j] = distance;
+        layer_color[j] = color;
+        layer_surface[j] = sorted->surface;
+    }
+
+    float transmittance = 1.f;
+    float red = 0.f;
+    float green = 0.f;
+    float blue = 0.f;
+    for (int j = 0; j < layers && layer_distance[j] <= opaque_distance; ++j) {
+        float weight = transmittance * layer_color[j][ALPHA] / 255.f;
+        red += weight * layer_color[j][RED];
+        green += weight * layer_color[j][GREEN];
+        blue += weight * layer_color[j][BLUE];
+        transmittance -= weight;
+    }
+    if (transmittance >= 1.f)
+        return 0;
+    *depth = layer_distance[0];
+    *hit = layer_surface[0];
+
+    // Like the default mode, the pixel is not blended with the background.
+    float coverage = 1.f - transmittance;
+    uint32_t pixel = 0;
+    unsigned char *pixel_ptr = (unsigned char*)&pixel;
+    pixel_ptr[P_RED] = (unsigned char)(red / coverage);
+    pixel_ptr[P_GREEN] = (unsigned char)(green / coverage);
+    pixel_ptr[P_BLUE] = (unsigned char)(blue / coverage);
     return pixel;
 }
 
@@ -411,9 +952,330 @@ inline bool _get_3DBuffer_from_Surface(PyObject *img, Py_buffer *buffer) {
 }
 
 
+inline bool _caster_is_busy(RayCasterObject *self) {
+    if (self->casting) {
+        PyErr_SetString(PyExc_RuntimeError, "the caster is being used by another thread");
+        return true;
+    }
+    return false;
+}
+
+inline vec3 get_texture_axis(vec3 normal, vec3 edge, float scale) {
+    /*
+        Unit vector in the plane and perpendicular to the edge, multiplied by scale.
+        The dot product with a point of the plane gives its distance to the edge, times scale.
+    */
+    vec3 axis = vec3_cross(normal, edge);
+    double length = vec3_length(axis);
+    if (length == 0.)
+        return {0.f, 0.f, 0.f}; // flat surface, it can't be hit anyway
+    return vec3_dot_float(axis, (float)(scale / length));
+}
+
+inline void set_surface_uv(struct Surface *surface) {
+    /*
+        Texture mapping of the surface, to be updated when its corners or its image change.
+        The column of a point is its distance to the edge A-C, scaled from |C-B| to the width of the texture,
+        and its row from the bottom is its distance to the edge C-B, scaled from |C-A| to the height.
+        A tiled image is scaled as if it was repeated in a bigger image.
+    */
+    vec3 ca = vec3_sub(surface->bc, surface->pos.A);
+    vec3 cb = vec3_sub(surface->pos.B, surface->bc);
+    surface->u_axis = get_texture_axis(surface->pos.C, ca, surface->buffer.shape[0] * surface->repeat_x / vec3_length(cb));
+    surface->v_axis = get_texture_axis(surface->pos.C, cb, surface->buffer.shape[1] * surface->repeat_y / vec3_length(ca));
+}
+
+inline void set_surface_position(struct Surface *surface,
+                                 float A_x, float A_y, float A_z, float B_x, float B_y, float B_z,
+                                 float C_x, float C_y, float C_z) {
+    surface->pos.A = {A_x, A_y, A_z};
+    surface->pos.B = {B_x, B_y, B_z};
+
+    vec3 C;
+    if (std::isnan(C_x) || std::isnan(C_y) || std::isnan(C_z))
+        C = {A_x, B_y, A_z}; // define a new vector C bellow A and at the same level as B
+    else
+        C = {C_x, C_y, C_z};
+
+    surface->bc = C;
+
+    get_norm_of_plane(surface->pos.A, surface->pos.B, C, &(surface->pos.C));
+    get_bounds_of_surface(surface);
+    set_surface_uv(surface);
+}
+
+static void handle_dealloc(SurfaceHandleObject *self) {
+    if (self->surface != nullptr)
+        self->surface->handle = nullptr;
+    Py_DECREF(self->caster);
+    PyObject_Free(self);
+}
+
+inline struct Surface *_get_handle_surface(SurfaceHandleObject *self) {
+    /*
+        Get the surface of the handle, or set an exception if it can't be modified.
+    */
+    if (_caster_is_busy(self->caster))
+        return nullptr;
+    if (self->surface == nullptr)
+        PyErr_SetString(PyExc_ValueError, "the surface has been removed from the caster");
+    return self->surface;
+}
+
+inline bool rect_is_empty(struct CellRect rect) {
+    return rect.row >= rect.row_end || rect.column >= rect.column_end;
+}
+
+inline struct CellRect rect_union(struct CellRect a, struct CellRect b) {
+    if (rect_is_empty(a))
+        return b;
+    if (rect_is_empty(b))
+        return a;
+    return {MIN(a.row, b.row), MAX(a.row_end, b.row_end), MIN(a.column, b.column), MAX(a.column_end, b.column_end)};
+}
+
+inline Py_ssize_t rect_area(struct CellRect rect) {
+    return rect_is_empty(rect) ? 0 : (rect.row_end - rect.row) * (rect.column_end - rect.column);
+}
+
+static void add_dirty_rect(struct DirtyRects *rects, struct CellRect rect) {
+    /*
+        Add a rectangle to the list. It is merged with every rectangle whose union with it is not larger than both,
+        as casting the union costs no more than casting them apart, so the close rectangles end up merged.
+        When the list is full, it is merged with the rectangle whose area grows the least.
+    */
+    if (rect_is_empty(rect))
+        return;
+    for (int i = 0; i < rects->count;) {
+        struct CellRect merged = rect_union(rect, rects->rects[i]);
+        if (rect_area(merged) <= rect_area(rect) + rect_area(rects->rects[i])) {
+            // the union replaces both, and may now be merged with the rectangles before
+            rect = merged;
+            rects->rects[i] = rects->rects[--rects->count];
+            i = 0;
+        } else
+            ++i;
+    }
+    if (rects->count < MAX_DIRTY_RECTS) {
+        rects->rects[rects->count++] = rect;
+        return;
+    }
+
+    int best = 0;
+    Py_ssize_t best_growth = PY_SSIZE_T_MAX;
+    for (int i = 0; i < rects->count; ++i) {
+        Py_ssize_t growth = rect_area(rect_union(rect, rects->rects[i])) - rect_area(rects->rects[i]);
+        if (growth < best_growth) {
+            best = i;
+            best_growth = growth;
+        }
+    }
+    rect = rect_union(rect, rects->rects[best]);
+    rects->rects[best] = rects->rects[--rects->count];
+    add_dirty_rect(rects, rect);
+}
+
+static PyObject *_build_pixel_rect(RayCasterObject *caster, struct CellRect cells) {
+    // Rectangle of pixels (x, y, width, height) of the cells.
+    int step = caster->ray_table == nullptr ? 1 : caster->ray_table->step;
+    return Py_BuildValue("(nnnn)", cells.column * step, cells.row * step,
+                         (cells.column_end - cells.column) * step, (cells.row_end - cells.row) * step);
+}
+
+inline void surface_changed(RayCasterObject *caster, struct Surface *surface) {
+    /*
+        Mark the surface as changed since the last frame, so the frames can't be reused:
+        the cells of a dynamic surface are cast again, and a static surface makes the next frame cast every cell.
+    */
+    if (surface->in_bvh)
+        caster->scene_version++;
+    else
+        surface->version++;
+}
+
+static PyObject *method_set_position(SurfaceHandleObject *self, PyObject *args, PyObject *kwargs) {
+    struct Surface *surface = _get_handle_surface(self);
+    if (surface == nullptr)
+        return NULL;
+
+    float A_x;
+    float A_y;
+    float A_z;
+
+    float B_x;
+    float B_y;
+    float B_z;
+
+    float C_x = NAN;
+    float C_y = NAN;
+    float C_z = NAN;
+
+    static char *kwlist[] = {"A_x", "A_y", "A_z", "B_x", "B_y", "B_z","C_x", "C_y", "C_z", NULL};
+    if (!PyArg_ParseTupleAndKeywords(args, kwargs, "ffffff|fff", kwlist,
+                                     &A_x, &A_y, &A_z, &B_x, &B_y, &B_z, &C_x, &C_y, &C_z))
+        return NULL;
+
+    struct pos3 pos = surface->pos;
+    vec3 bc = surface->bc;
+    set_surface_position(surface, A_x, A_y, A_z, B_x, B_y, B_z, C_x, C_y, C_z);
+    if (memcmp(&pos, &(surface->pos), sizeof(pos)) == 0 && memcmp(&bc, &(surface->bc), sizeof(bc)) == 0)
+        Py_RETURN_NONE; // the surface didn't move
+    if (surface->in_bvh)
+        self->caster->bvh_dirty = true;
+    surface_changed(self->caster, surface);
+
+    Py_RETURN_NONE;
+}
+
+inline bool _check_repeat(int repeat_x, int repeat_y) {
+    if (repeat_x < 1 || repeat_y < 1) {
+        PyErr_SetString(PyExc_ValueError, "repeat_x and repeat_y must be greater than 0");
+        return false;
+    }
+    return true;
+}
+
+static PyObject *method_set_texture(SurfaceHandleObject *self, PyObject *args, PyObject *kwargs) {
+    struct Surface *surface = _get_handle_surface(self);
+    if (surface == nullptr)
+        return NULL;
+
+    PyObject *image;
+    int repeat_x = 1;
+    int repeat_y = 1;
+
+    static char *kwlist[] = {"image", "repeat_x", "repeat_y", NULL};
+    if (!PyArg_ParseTupleAndKeywords(args, kwargs, "O|ii", kwlist, &image, &repeat_x, &repeat_y))
+        return NULL;
+    if (!_check_repeat(repeat_x, repeat_y))
+        return NULL;
+
+    if (image == surface->parent) { // same texture, the buffer is still valid
+        if (repeat_x != surface->repeat_x || repeat_y != surface->repeat_y) {
+            surface->repeat_x = repeat_x;
+            surface->repeat_y = repeat_y;
+            set_surface_uv(surface);
+            surface_changed(self->caster, surface);
+        }
+        Py_RETURN_NONE;
+    }
+
+    Py_buffer buffer;
+    if (_get_3DBuffer_from_Surface(image, &buffer)) {
+        PyErr_SetString(PyExc_ValueError, "Not a valid surface");
+        return NULL;
+    }
+
+    PyBuffer_Release(&(surface->buffer));
+    Py_DECREF(surface->parent);
+    surface->buffer = buffer;
+    surface->parent = image;
+    Py_INCREF(image);
+    surface->repeat_x = repeat_x;
+    surface->repeat_y = repeat_y;
+    set_surface_uv(surface); // the scale depends on the size of the image
+    surface_changed(self->caster, surface);
+
+    Py_RETURN_NONE;
+}
+
+static PyObject *method_touch(SurfaceHandleObject *self) {
+    struct Surface *surface = _get_handle_surface(self);
+    if (surface == nullptr)
+        return NULL;
+    surface_changed(self->caster, surface);
+    Py_RETURN_NONE;
+}
+
+static PyObject *method_get_id(SurfaceHandleObject *self) {
+    struct Surface *surface = _get_handle_surface(self);
+    if (surface == nullptr)
+        return NULL;
+    return PyLong_FromUnsignedLong(surface->id);
+}
+
+static PyObject *method_screen_bounds(SurfaceHandleObject *self) {
+    struct Surface *surface = _get_handle_surface(self);
+    if (surface == nullptr)
+        return NULL;
+    if (rect_is_empty(surface->cells))
+        Py_RETURN_NONE;
+    return _build_pixel_rect(self->caster, surface->cells);
+}
+
+static PyObject *method_hide(SurfaceHandleObject *self) {
+    struct Surface *surface = _get_handle_surface(self);
+    if (surface == nullptr)
+        return NULL;
+    if (!surface->hidden)
+        surface_changed(self->caster, surface);
+    surface->hidden = true;
+    Py_RETURN_NONE;
+}
+
+static PyObject *method_show(SurfaceHandleObject *self) {
+    struct Surface *surface = _get_handle_surface(self);
+    if (surface == nullptr)
+        return NULL;
+    if (surface->hidden)
+        surface_changed(self->caster, surface);
+    surface->hidden = false;
+    Py_RETURN_NONE;
+}
+
+static PyObject *method_remove(SurfaceHandleObject *self) {
+    struct Surface *surface = _get_handle_surface(self);
+    if (surface == nullptr)
+        return NULL;
+
+    RayCasterObject *caster = self->caster;
+    struct Surface **list = surface->in_bvh ? &(caster->surfaces) : &(caster->temp_surfaces);
+    for (struct Surface **current = list; *current != nullptr; current = &((*current)->next)) {
+        if (*current == surface) {
+            *current = surface->next;
+            break;
+        }
+    }
+    if (surface->in_bvh) {
+        caster->bvh_dirty = true;
+        caster->scene_version++;
+    }
+    else // the cells where it was are cast again
+        add_dirty_rect(&(caster->pending), surface->cells);
+
+    free_surface(surface);
+    Py_RETURN_NONE;
+}
+
+static PyMethodDef HandleMethods[] = {
+        {"set_position", (PyCFunction) method_set_position, METH_VARARGS | METH_KEYWORDS, "Moves the surface, with the same coordinates as add_surface."},
+        {"set_texture", (PyCFunction) method_set_texture, METH_VARARGS | METH_KEYWORDS, "Changes the image displayed on the surface, and the number of times it is tiled."},
+        {"touch", (PyCFunction) method_touch, METH_NOARGS, "Tells the caster that the image of the surface was drawn on, so the frame can't be reused."},
+        {"get_id", (PyCFunction) method_get_id, METH_NOARGS, "Id of the surface in the id buffer of raycasting, unique in its caster."},
+        {"screen_bounds", (PyCFunction) method_screen_bounds, METH_NOARGS, "Rectangle of pixels (x, y, width, height) the dynamic surface can cover in the last raycasting with reuse=True, None if it is out of the view."},
+        {"hide", (PyCFunction) method_hide, METH_NOARGS, "Stops displaying the surface, without removing it."},
+        {"show", (PyCFunction) method_show, METH_NOARGS, "Displays the surface again after hide."},
+        {"remove", (PyCFunction) method_remove, METH_NOARGS, "Removes the surface from the caster."},
+        {NULL, NULL, 0, NULL}
+};
+
+static PyTypeObject SurfaceHandleType = {
+        .ob_base = PyVarObject_HEAD_INIT(NULL, 0)
+        .tp_name = "nostalgiaeraycasting.SurfaceHandle",
+        .tp_basicsize = sizeof(SurfaceHandleObject),
+        .tp_itemsize = 0,
+        .tp_dealloc = (destructor) handle_dealloc,
+        .tp_flags = Py_TPFLAGS_DEFAULT,
+        .tp_doc = PyDoc_STR("Handle on a surface of a RayCaster, returned by add_surface"),
+        .tp_methods = HandleMethods,
+};
+
 static PyObject *method_add_surface(RayCasterObject *self, PyObject *args, PyObject *kwargs) {
     PyObject *surface_image;
 
+    if (_caster_is_busy(self))
+        return NULL;
+
     float A_x;
     float A_y;
     float A_z;
@@ -422,60 +1284,746 @@ static PyObject *method_add_surface(RayCasterObject *self, PyObject *args, PyObj
     float B_y;
     float B_z;
 
-    float C_x = FP_NAN;
-    float C_y = FP_NAN;
-    float C_z = FP_NAN;
+    float C_x = NAN;
+    float C_y = NAN;
+    float C_z = NAN;
 
-    bool del = false;
+    int del = 0; // "p" writes an int
+    int dynamic = 0;
+
+    int repeat_x = 1;
+    int repeat_y = 1;
+
+    static char *kwlist[] = {"image", "A_x", "A_y", "A_z", "B_x", "B_y", "B_z","C_x", "C_y", "C_z", "rm", "dynamic",
+                             "repeat_x", "repeat_y", NULL};
+    if (!PyArg_ParseTupleAndKeywords(args, kwargs, "Offffff|fffppii", kwlist,
+                                     &surface_image, &A_x, &A_y, &A_z, &B_x, &B_y, &B_z, &C_x, &C_y, &C_z, &del, &dynamic,
+                                     &repeat_x, &repeat_y))
+        return NULL;
+    if (!_check_repeat(repeat_x, repeat_y))
+        return NULL;
 
-    static char *kwlist[] = {"image", "A_x", "A_y", "A_z", "B_x", "B_y", "B_z","C_x", "C_y", "C_z", "rm",NULL};
-    if (!PyArg_ParseTupleAndKeywords(args, kwargs, "Offffff|fffp", kwlist,
-                                     &surface_image, &A_x, &A_y, &A_z, &B_x, &B_y, &B_z, &C_x, &C_y, &C_z, &del))
+    SurfaceHandleObject *handle = PyObject_New(SurfaceHandleObject, &SurfaceHandleType);
+    if (handle == NULL)
         return NULL;
+    handle->caster = self;
+    handle->surface = nullptr;
+    Py_INCREF(self);
 
     struct Surface *surface = (Surface *) malloc(sizeof(struct Surface));
-    surface->pos.A.x = A_x;
-    surface->pos.A.y = A_y;
-    surface->pos.A.z = A_z;
-    surface->pos.B.x = B_x;
-    surface->pos.B.y = B_y;
-    surface->pos.B.z = B_z;
-    surface->parent = surface_image;
-    surface->del = del;
+    if (surface == nullptr) {
+        Py_DECREF(handle);
+        return PyErr_NoMemory();
+    }
 
     if (_get_3DBuffer_from_Surface(surface_image, &(surface->buffer))) {
+        free(surface);
+        Py_DECREF(handle);
         PyErr_SetString(PyExc_ValueError, "Not a valid surface");
         return NULL;
     }
     Py_INCREF(surface_image); // We need to keep the surface alive to make sure the buffer is valid.
 
-    surface->next = self->surfaces; // Push the surface on top of the stack.
-    self->surfaces = surface;
+    surface->parent = surface_image;
+    surface->del = del;
+    surface->in_bvh = !(del || dynamic);
+    surface->hidden = false;
+    surface->culled = false;
+    surface->version = 1; // a new surface is drawn in the next frame
+    surface->drawn_version = 0;
+    surface->cells = {0, 0, 0, 0};
+    surface->id = ++self->last_id;
+    surface->repeat_x = repeat_x;
+    surface->repeat_y = repeat_y;
+    surface->handle = handle;
+    handle->surface = surface;
+
+    // Push the surface on top of the stack.
+    // Temporary and dynamic surfaces change every frame, so they are kept out of the BVH.
+    if (surface->in_bvh) {
+        surface->next = self->surfaces;
+        self->surfaces = surface;
+        self->bvh_dirty = true;
+        self->scene_version++;
+    } else {
+        surface->next = self->temp_surfaces;
+        self->temp_surfaces = surface;
+    }
 
-    vec3 C;
-    if (C_x == FP_NAN || C_y == FP_NAN || C_z == FP_NAN)
-        C = {A_x, B_y, A_z}; // define a new vector C bellow A and at the same level as B
-    else
-        C = {C_x, C_y, C_z};
+    set_surface_position(surface, A_x, A_y, A_z, B_x, B_y, B_z, C_x, C_y, C_z);
 
-    surface->bc = C;
+    return (PyObject *) handle;
+}
 
-    get_norm_of_plane(surface->pos.A, surface->pos.B, C, &(surface->pos.C));
+static PyObject *method_clear_surfaces(RayCasterObject *self) {
+    if (_caster_is_busy(self))
+        return NULL;
 
+    free_surface_list(&(self->surfaces));
+    free_surface_list(&(self->temp_surfaces));
+    self->bvh_dirty = true;
+    self->scene_version++;
     Py_RETURN_NONE;
 }
 
-static PyObject *method_clear_surfaces(RayCasterObject *self) {
-    struct Surface *next;
-    for (struct Surface *surface = self->surfaces; surface != nullptr; surface = next) {
-        next = surface->next;
-//        PyBuffer_Release(&(surface->buffer));
-//        Py_DECREF(surface->parent);
-//        free(surface);
-        free_surface(surface);
+static struct RayTable *get_ray_table(RayCasterObject *self, Py_ssize_t width, Py_ssize_t height, int step, float fov) {
+    /*
+        Get the ray table of the caster, and build it again if the screen size, step or fov changed.
+        Returns nullptr if the memory can't be allocated.
+    */
+    struct RayTable *table = self->ray_table;
+    if (table != nullptr && table->width == width && table->height == height && table->step == step && table->fov == fov)
+        return table;
+
+    free(table);
+    self->ray_table = nullptr;
+
+    Py_ssize_t rows = height / step;
+    Py_ssize_t columns = width / step;
+    // The arrays are stored right after the struct.
+    table = (struct RayTable *) malloc(sizeof(struct RayTable) + sizeof(float) * (4 * rows + 4 * columns));
+    if (table == nullptr)
+        return nullptr;
+
+    table->width = width;
+    table->height = height;
+    table->step = step;
+    table->fov = fov;
+    table->rows = rows;
+    table->columns = columns;
+    table->row_sin = (float *)(table + 1);
+    table->row_cos = table->row_sin + rows;
+    table->row_y = table->row_cos + rows;
+    table->row_hypo = table->row_y + rows;
+    table->column_cos = table->row_hypo + rows;
+    table->column_sin = table->column_cos + columns;
+    table->column_x = table->column_sin + columns;
+    table->column_z = table->column_x + columns;
+
+    double d_fov = fov / 2.;
+    double d_theta_x = fov / (double)rows;
+    double d_theta_y = fov / (double)columns;
+    for (Py_ssize_t row = 0; row < rows; ++row) {
+        double theta_x = d_fov - row * d_theta_x;
+        table->row_sin[row] = (float)sin(theta_x);
+        table->row_cos[row] = (float)cos(theta_x);
     }
-    self->surfaces = nullptr;
-    Py_RETURN_NONE;
+    for (Py_ssize_t column = 0; column < columns; ++column) {
+        double theta_y = d_fov - column * d_theta_y;
+        table->column_cos[column] = (float)cos(theta_y);
+        table->column_sin[column] = (float)sin(theta_y);
+    }
+
+    self->ray_table = table;
+    self->history_valid = false;
+    return table;
+}
+
+static void orient_ray_table(struct RayTable *table, float y, float angle_x, float angle_y, float view_distance) {
+    /*
+        Rotate the rays of the table by the view angles, and set their length.
+    */
+    // sin(a + b) = sin(a)cos(b) + cos(a)sin(b) and cos(a + b) = cos(a)cos(b) - sin(a)sin(b)
+    float cos_x = cosf(angle_x);
+    float sin_x = sinf(angle_x);
+    for (Py_ssize_t row = 0; row < table->rows; ++row) {
+        float ray_y = view_distance * (table->row_sin[row] * cos_x + table->row_cos[row] * sin_x);
+        float dist_2d = abs(ray_y - y);
+        table->row_y[row] = ray_y;
+        table->row_hypo[row] = sqrtf(view_distance * view_distance - dist_2d * dist_2d);
+    }
+
+    float cos_y = cosf(angle_y);
+    float sin_y = sinf(angle_y);
+    for (Py_ssize_t column = 0; column < table->columns; ++column) {
+        table->column_x[column] = table->column_cos[column] * cos_y - table->column_sin[column] * sin_y;
+        table->column_z[column] = table->column_sin[column] * cos_y + table->column_cos[column] * sin_y;
+    }
+}
+
+struct Frustum {
+    /* Volume covered by the rays of a frame.
+        Seen from above, the rays are in a wedge between the heading of the first and the last column.
+        Seen from the side, they are between the lowest and the highest slope of the rows.
+    */
+    vec3 origin;
+    float max_distance; // length of the longest ray
+    bool wedge; // the wedge is narrower than half a turn
+    float left_x; // heading of the first column
+    float left_z;
+    float right_x; // heading of the last column
+    float right_z;
+    bool slopes; // no ray is vertical
+    float min_slope; // vertical length of the rays divided by their horizontal length
+    float max_slope;
+};
+
+static void get_frustum(struct RayTable *table, vec3 origin, struct Frustum *frustum) {
+    frustum->origin = origin;
+    frustum->max_distance = 0.f;
+    frustum->slopes = true;
+    frustum->min_slope = FLT_MAX;
+    frustum->max_slope = -FLT_MAX;
+    for (Py_ssize_t row = 0; row < table->rows; ++row) {
+        float ray_y = table->row_y[row];
+        float hypo = table->row_hypo[row];
+        if (std::isnan(hypo))
+            continue; // the ray is not valid, it can't hit anything
+        frustum->max_distance = MAX(frustum->max_distance, sqrtf(ray_y * ray_y + hypo * hypo));
+        if (hypo <= 0.f) {
+            frustum->slopes = false;
+            continue;
+        }
+        frustum->min_slope = MIN(frustum->min_slope, ray_y / hypo);
+        frustum->max_slope = MAX(frustum->max_slope, ray_y / hypo);
+    }
+
+    Py_ssize_t last = table->columns - 1;
+    frustum->wedge = table->columns > 0 && table->fov * last / table->columns < M_PI * 0.99f;
+    frustum->left_x = frustum->wedge ? table->column_x[0] : 0.f;
+    frustum->left_z = frustum->wedge ? table->column_z[0] : 0.f;
+    frustum->right_x = frustum->wedge ? table->column_x[last] : 0.f;
+    frustum->right_z = frustum->wedge ? table->column_z[last] : 0.f;
+}
+
+inline float box_distance(vec3 point, vec3 min, vec3 max) {
+    // Distance between the point and the closest point of the box.
+    float near_x = MAX(MAX(min.x - point.x, point.x - max.x), 0.f);
+    float near_y = MAX(MAX(min.y - point.y, point.y - max.y), 0.f);
+    float near_z = MAX(MAX(min.z - point.z, point.z - max.z), 0.f);
+    return sqrtf(near_x * near_x + near_y * near_y + near_z * near_z);
+}
+
+inline bool box_outside_frustum(const struct Frustum *frustum, vec3 min, vec3 max) {
+    /*
+        Conservative test, a box that is not reported as outside may still be missed by every ray.
+        @return: true if no ray can go through the box
+    */
+    vec3 low = vec3_sub(min, frustum->origin);
+    vec3 high = vec3_sub(max, frustum->origin);
+
+    // Distance between the origin and the closest point of the box.
+    float near_x = MAX(MAX(low.x, -high.x), 0.f);
+    float near_y = MAX(MAX(low.y, -high.y), 0.f);
+    float near_z = MAX(MAX(low.z, -high.z), 0.f);
+    if (near_x * near_x + near_y * near_y + near_z * near_z > frustum->max_distance * frustum->max_distance)
+        return true;
+
+    if (frustum->wedge) {
+        // Sign of the 2D cross product between the heading and the closest corner to the wedge.
+        float left = frustum->left_x * (frustum->left_x > 0 ? low.z : high.z)
+                     - frustum->left_z * (frustum->left_z > 0 ? high.x : low.x);
+        if (left > 0)
+            return true;
+        float right = frustum->right_x * (frustum->right_x > 0 ? high.z : low.z)
+                      - frustum->right_z * (frustum->right_z > 0 ? low.x : high.x);
+        if (right < 0)
+            return true;
+    }
+
+    if (frustum->slopes) {
+        float far_x = MAX(-low.x, high.x);
+        float far_z = MAX(-low.z, high.z);
+        float near_hypo = sqrtf(near_x * near_x + near_z * near_z);
+        float far_hypo = sqrtf(far_x * far_x + far_z * far_z);
+        if (low.y > frustum->max_slope * (frustum->max_slope > 0 ? far_hypo : near_hypo))
+            return true; // above every ray
+        if (high.y < frustum->min_slope * (frustum->min_slope > 0 ? near_hypo : far_hypo))
+            return true; // below every ray
+    }
+
+    return false;
+}
+
+inline void add_sorted_surface(RayCasterObject *self, struct Surface *surface, vec3 origin) {
+    struct SortedSurface *sorted = self->sorted_surfaces + self->sorted_count++;
+    sorted->distance = box_distance(origin, surface->min, surface->max);
+    sorted->surface = surface;
+}
+
+static bool cull_surfaces(RayCasterObject *self, const struct Frustum *frustum, bool ordered) {
+    /*
+        Mark the nodes of the BVH and the static surfaces that are out of the view,
+        and gather the dynamic surfaces that are still visible in visible_surfaces.
+        In the ordered mode, every visible surface is also gathered in sorted_surfaces, from the closest.
+        @return: true on error (memory), false on success
+    */
+    int count = 0;
+    for (struct Surface *surface = self->temp_surfaces; surface != nullptr; surface = surface->next)
+        ++count;
+    if (count > self->visible_capacity) {
+        struct Surface **visible_surfaces = (struct Surface **) realloc(self->visible_surfaces, count * sizeof(struct Surface *));
+        if (visible_surfaces == nullptr)
+            return true;
+        self->visible_surfaces = visible_surfaces;
+        self->visible_capacity = count;
+    }
+    if (ordered && count + self->bvh_surface_count > self->sorted_capacity) {
+        int capacity = count + self->bvh_surface_count;
+        struct SortedSurface *sorted_surfaces = (struct SortedSurface *) realloc(self->sorted_surfaces, capacity * sizeof(struct SortedSurface));
+        if (sorted_surfaces == nullptr)
+            return true;
+        self->sorted_surfaces = sorted_surfaces;
+        self->sorted_capacity = capacity;
+    }
+    self->sorted_count = 0;
+
+    int visible_static = 0;
+    if (self->bvh_size) {
+        int stack[BVH_STACK_SIZE];
+        int stack_size = 1;
+        stack[0] = 0;
+        while (stack_size) {
+            struct BVHNode *node = self->bvh_nodes + stack[--stack_size];
+            node->culled = box_outside_frustum(frustum, node->min, node->max);
+            if (node->culled)
+                continue;
+            if (node->count == 0) {
+                stack[stack_size++] = node->first;
+                stack[stack_size++] = node->first + 1;
+                continue;
+            }
+            for (int i = node->first; i < node->first + node->count; ++i) {
+                struct Surface *surface = self->bvh_surfaces[i];
+                surface->culled = surface->hidden || box_outside_frustum(frustum, surface->min, surface->max);
+                visible_static += !surface->culled;
+                if (ordered && !surface->culled)
+                    add_sorted_surface(self, surface, frustum->origin);
+            }
+        }
+    }
+    self->static_culled = self->bvh_surface_count - visible_static;
+
+    self->visible_count = 0;
+    for (struct Surface *surface = self->temp_surfaces; surface != nullptr; surface = surface->next) {
+        surface->culled = surface->hidden || box_outside_frustum(frustum, surface->min, surface->max);
+        if (surface->culled)
+            continue;
+        self->visible_surfaces[self->visible_count++] = surface;
+        if (ordered)
+            add_sorted_surface(self, surface, frustum->origin);
+    }
+    self->dynamic_count = count;
+    self->dynamic_culled = count - self->visible_count;
+
+    if (ordered)
+        std::sort(self->sorted_surfaces, self->sorted_surfaces + self->sorted_count,
+                  [](const struct SortedSurface &a, const struct SortedSurface &b) {
+                      return a.distance < b.distance;
+                  });
+    return false;
+}
+
+static bool parse_rate_map(PyObject *rate_map, struct RateMap *rates) {
+    /*
+        Read a sequence of (radius, rate) pairs.
+        @return: false with an exception set if the sequence is not valid
+    */
+    memset(rates, 0, sizeof(*rates)); // the rates are compared with memcmp, see FrameKey
+    rates->tile = 1;
+    if (rate_map == NULL || rate_map == Py_None)
+        return true;
+
+    PyObject *sequence = PySequence_Fast(rate_map, "rate_map must be a sequence of (radius, rate) pairs");
+    if (sequence == NULL)
+        return false;
+    Py_ssize_t count = PySequence_Fast_GET_SIZE(sequence);
+    if (count > MAX_RATES) {
+        Py_DECREF(sequence);
+        PyErr_Format(PyExc_ValueError, "rate_map can't have more than %d rates", MAX_RATES);
+        return false;
+    }
+    for (Py_ssize_t i = 0; i < count; ++i) {
+        if (!PyArg_ParseTuple(PySequence_Fast_GET_ITEM(sequence, i), "fi;rate_map must be a sequence of (radius, rate) pairs",
+                              &rates->radius[i], &rates->rate[i])) {
+            Py_DECREF(sequence);
+            return false;
+        }
+        if (rates->rate[i] < 0 || (i > 0 && rates->radius[i] < rates->radius[i - 1])) {
+            Py_DECREF(sequence);
+            PyErr_SetString(PyExc_ValueError, "the rates must be positive, and their radius in increasing order");
+            return false;
+        }
+        rates->tile = MAX(rates->tile, rates->rate[i]);
+    }
+    Py_DECREF(sequence);
+    rates->count = (int)count;
+
+    for (int i = 0; i < rates->count; ++i)
+        if (rates->rate[i] > 0 && rates->tile % rates->rate[i]) {
+            PyErr_SetString(PyExc_ValueError, "every rate of rate_map must divide the largest one");
+            return false;
+        }
+    return true;
+}
+
+struct CastJob {
+    /* Everything a thread needs to render a band of rows. */
+    RayCasterObject *caster;
+    uint32_t *buf;
+    Py_ssize_t width;
+    Py_ssize_t height;
+    Py_ssize_t rows; // number of rows of "step" pixels
+    int step;
+    int band_count;
+    vec3 origin;
+    struct RayTable *table;
+    bool ordered;
+    struct RateMap rates;
+    int interleave; // 0, INTERLEAVE_CHECKERBOARD or INTERLEAVE_LINES
+    int parity; // half of the cells cast in this frame
+    float *depth; // depth and id buffers of the pixels, nullptr if they are not written
+    uint32_t *ids;
+    const struct Cell *previous; // cells of the previous frame, nullptr if they can't be reused
+    struct Cell *current; // cells of this frame, nullptr if they are not kept
+    Py_ssize_t shift_row; // rows and columns of the rotation of the camera since the previous frame
+    Py_ssize_t shift_column;
+    const struct Cell *cached; // cells of the last frame copied outside of the dirty cells, nullptr to cast every cell
+    const struct DirtyRects *dirty; // whole tiles
+};
+
+inline bool is_dirty_tile(const struct CastJob *job, Py_ssize_t tile_row, Py_ssize_t tile_column) {
+    for (int i = 0; i < job->dirty->count; ++i) {
+        const struct CellRect *rect = job->dirty->rects + i;
+        if (tile_row >= rect->row && tile_row < rect->row_end && tile_column >= rect->column && tile_column < rect->column_end)
+            return true;
+    }
+    return false;
+}
+
+inline int tile_rate(const struct CastJob *job, Py_ssize_t first_row, Py_ssize_t last_row,
+                     Py_ssize_t first_column, Py_ssize_t last_column) {
+    // Rate of the tile of the cells [first_row, last_row[ x [first_column, last_column[.
+    const struct RateMap *rates = &job->rates;
+    if (rates->count == 0)
+        return 1;
+    float center_x = job->width / 2.f;
+    float center_y = job->height / 2.f;
+    float near_x = MAX(MAX(first_column * job->step - center_x, center_x - last_column * job->step), 0.f);
+    float near_y = MAX(MAX(first_row * job->step - center_y, center_y - last_row * job->step), 0.f);
+    float distance = sqrtf(near_x * near_x + near_y * near_y);
+
+    int rate = 1;
+    for (int i = 0; i < rates->count && rates->radius[i] <= distance; ++i)
+        rate = rates->rate[i];
+    return rate;
+}
+
+FORCE_INLINE struct Cell cast_cell(const struct CastJob *job, struct pos2 *ray, Py_ssize_t row, Py_ssize_t column) {
+    struct RayTable *table = job->table;
+    float hypo = table->row_hypo[row];
+    ray->B.y = table->row_y[row];
+    ray->B.x = hypo * table->column_x[column];
+    ray->B.z = hypo * table->column_z[column];
+
+    struct Cell cell;
+    struct Surface *hit = nullptr;
+    cell.pixel = job->ordered ? get_pixel_sorted(*ray, job->caster, &cell.depth, &hit)
+                              : get_pixel_sum(*ray, job->caster, &cell.depth, &hit);
+    if (hit == nullptr)
+        return EMPTY_CELL;
+    cell.id = hit->id;
+    return cell;
+}
+
+inline void fill_cells(const struct CastJob *job, Py_ssize_t row, Py_ssize_t row_end,
+                       Py_ssize_t column, Py_ssize_t column_end, struct Cell cell) {
+    // Draw the cell on the cells [row, row_end[ x [column, column_end[, and keep it for the next frame.
+    Py_ssize_t columns = job->table->columns;
+    if (job->current != nullptr)
+        for (Py_ssize_t r = row; r < row_end; ++r)
+            for (Py_ssize_t c = column; c < column_end; ++c)
+                job->current[r * columns + c] = cell;
+
+    int step = job->step;
+    if (job->depth != nullptr || job->ids != nullptr)
+        for (Py_ssize_t dst_y = row * step; dst_y < row_end * step; ++dst_y)
+            for (Py_ssize_t dst_x = column * step; dst_x < column_end * step; ++dst_x) {
+                if (job->depth != nullptr)
+                    job->depth[dst_y * job->width + dst_x] = cell.depth;
+                if (job->ids != nullptr)
+                    job->ids[dst_y * job->width + dst_x] = cell.id;
+            }
+
+    uint32_t pixel = cell.pixel;
+    if (pixel == 0)
+        return; // nothing was hit, the surface keeps its color
+
+    for (Py_ssize_t dst_y = row * step; dst_y < row_end * step; ++dst_y)
+        for (Py_ssize_t dst_x = column * step; dst_x < column_end * step; ++dst_x)
+            *((uint32_t*)((unsigned char*)(job->buf + dst_y * job->width + dst_x) - 3)) = pixel;
+}
+
+inline bool is_cast_cell(const struct CastJob *job, Py_ssize_t row, Py_ssize_t column,
+                         Py_ssize_t row_end, Py_ssize_t column_end) {
+    /*
+        In the interleaved mode, the cells go by pairs: two cells of a row for the checkerboard, a cell and the one
+        below it for the lines. A single cell of every pair is cast, the other one in the next frame.
+        The tiles have an even size, so the pairs don't cross them, and a cell without a pair is always cast.
+    */
+    if (job->interleave == INTERLEAVE_LINES)
+        return ((row + job->parity) & 1) == 0 || (row ^ 1) >= row_end;
+    return ((row + column + job->parity) & 1) == 0 || (column ^ 1) >= column_end;
+}
+
+inline struct Cell rebuild_cell(const struct CastJob *job, Py_ssize_t row, Py_ssize_t column) {
+    // Pixel, depth and id of a cell that is not cast in this frame: the same ray in the previous frame, or the other cell of its pair.
+    Py_ssize_t columns = job->table->columns;
+    if (job->previous != nullptr) {
+        Py_ssize_t previous_row = row - job->shift_row;
+        Py_ssize_t previous_column = column - job->shift_column;
+        if (previous_row >= 0 && previous_row < job->table->rows && previous_column >= 0 && previous_column < columns)
+            return job->previous[previous_row * columns + previous_column];
+    }
+    if (job->interleave == INTERLEAVE_LINES)
+        return job->current[(row ^ 1) * columns + column];
+    return job->current[row * columns + (column ^ 1)];
+}
+
+static void cast_band(int band, void *data) {
+    struct CastJob *job = (struct CastJob *) data;
+
+    // The band is made of rows of tiles, a tile being a single cell when there is no rate map.
+    int tile = job->rates.tile;
+    Py_ssize_t tile_rows = (job->rows + tile - 1) / tile;
+    Py_ssize_t first_row = tile * (tile_rows * band / job->band_count);
+    Py_ssize_t last_row = MIN(tile * (tile_rows * (band + 1) / job->band_count), job->rows);
+    Py_ssize_t columns = job->table->columns;
+
+    struct pos2 ray;
+    ray.A = job->origin;
+
+    for (Py_ssize_t tile_row = first_row; tile_row < last_row; tile_row += tile) {
+        Py_ssize_t tile_row_end = MIN(tile_row + tile, last_row);
+        for (Py_ssize_t tile_column = 0; tile_column < columns; tile_column += tile) {
+            Py_ssize_t tile_column_end = MIN(tile_column + tile, columns);
+            if (job->cached != nullptr && !is_dirty_tile(job, tile_row, tile_column)) {
+                // nothing changed in the tile since the last frame
+                for (Py_ssize_t row = tile_row; row < tile_row_end; ++row)
+                    for (Py_ssize_t column = tile_column; column < tile_column_end; ++column)
+                        fill_cells(job, row, row + 1, column, column + 1, job->cached[row * columns + column]);
+                continue;
+            }
+            int rate = tile_rate(job, tile_row, tile_row_end, tile_column, tile_column_end);
+            if (rate == 0) {
+                fill_cells(job, tile_row, tile_row_end, tile_column, tile_column_end, EMPTY_CELL);
+                continue;
+            }
+
+            if (job->interleave && rate == 1) {
+                // cast half of the cells, then rebuild the other half from them or from the previous frame
+                for (Py_ssize_t row = tile_row; row < tile_row_end; ++row)
+                    for (Py_ssize_t column = tile_column; column < tile_column_end; ++column)
+                        if (is_cast_cell(job, row, column, tile_row_end, tile_column_end))
+                            fill_cells(job, row, row + 1, column, column + 1, cast_cell(job, &ray, row, column));
+                for (Py_ssize_t row = tile_row; row < tile_row_end; ++row)
+                    for (Py_ssize_t column = tile_column; column < tile_column_end; ++column)
+                        if (!is_cast_cell(job, row, column, tile_row_end, tile_column_end))
+                            fill_cells(job, row, row + 1, column, column + 1, rebuild_cell(job, row, column));
+                continue;
+            }
+
+            for (Py_ssize_t row = tile_row; row < tile_row_end; row += rate) {
+                Py_ssize_t row_end = MIN(row + rate, tile_row_end);
+                for (Py_ssize_t column = tile_column; column < tile_column_end; column += rate) {
+                    Py_ssize_t column_end = MIN(column + rate, tile_column_end);
+                    // the ray of a block goes through its center
+                    struct Cell cell = cast_cell(job, &ray, (row + row_end - 1) / 2, (column + column_end - 1) / 2);
+                    fill_cells(job, row, row_end, column, column_end, cell);
+                }
+            }
+        }
+    }
+}
+
+static bool prepare_history(RayCasterObject *self, struct CastJob *job, int interleave, bool reuse, float angle_x, float angle_y) {
+    /*
+        Give the cells of the previous frame to the job of an interleaved frame, if the camera moved little.
+        A rotation of the camera only shifts the rays of the table, so the previous cells are shifted too.
+        The cells are also kept in the reuse mode, to copy them in the next frame.
+        @return: false if the memory can't be allocated
+    */
+    job->interleave = interleave;
+    job->parity = 0;
+    job->previous = nullptr;
+    job->current = nullptr;
+    job->shift_row = 0;
+    job->shift_column = 0;
+    job->cached = nullptr;
+    job->dirty = &(self->dirty);
+    if (!interleave && !reuse) {
+        self->history_valid = false;
+        return true;
+    }
+
+    struct RayTable *table = job->table;
+    Py_ssize_t cells = table->rows * table->columns;
+    if (self->history_cells != cells) {
+        free(self->history);
+        self->history = (struct Cell *) malloc(sizeof(struct Cell) * 2 * cells);
+        self->history_cells = self->history == nullptr ? 0 : cells;
+        self->history_valid = false;
+        if (self->history == nullptr)
+            return false;
+    }
+
+    job->parity = (int)(self->frame & 1);
+    job->current = self->history + ((self->frame + 1) & 1) * cells;
+    if (interleave && self->history_valid &&
+        vec3_dist(job->origin, {self->history_x, self->history_y, self->history_z}) <= HISTORY_MAX_MOVE) {
+        float delta_y = angle_y - self->history_angle_y;
+        delta_y -= 2.f * M_PI * roundf(delta_y / (2.f * M_PI)); // the heading can wrap around
+        job->previous = self->history + (self->frame & 1) * cells;
+        job->shift_row = (Py_ssize_t)lroundf((angle_x - self->history_angle_x) * table->rows / table->fov);
+        job->shift_column = (Py_ssize_t)lroundf(delta_y * table->columns / table->fov);
+    }
+
+    // The tiles must have an even size for the pairs of cells.
+    if (interleave && job->rates.tile % 2)
+        job->rates.tile *= 2;
+    return true;
+}
+
+static struct CellRect get_surface_cells(struct RayTable *table, vec3 origin, struct Surface *surface) {
+    /*
+        Conservative rectangle of the cells whose ray can hit the bounding box of the surface.
+        Seen from above, a ray has the heading of its column, and seen from the side the slope of its row,
+        so the rows are the ones with a slope between the lowest and the highest point of the box,
+        and the columns the ones with a heading between the corners of the box.
+    */
+    struct CellRect cells = {0, table->rows, 0, table->columns};
+    vec3 low = vec3_sub(surface->min, origin);
+    vec3 high = vec3_sub(surface->max, origin);
+
+    // horizontal distance to the closest and the farthest point of the box
+    float near_x = MAX(MAX(low.x, -high.x), 0.f);
+    float near_z = MAX(MAX(low.z, -high.z), 0.f);
+    float near = sqrtf(near_x * near_x + near_z * near_z);
+    if (near <= 0.f)
+        return cells; // the camera is above or below the box, every ray can hit it
+    float far_x = MAX(-low.x, high.x);
+    float far_z = MAX(-low.z, high.z);
+    float far = sqrtf(far_x * far_x + far_z * far_z);
+
+    float min_slope = low.y / (low.y >= 0.f ? far : near);
+    float max_slope = high.y / (high.y >= 0.f ? near : far);
+    cells.row = table->rows;
+    cells.row_end = 0;
+    for (Py_ssize_t row = 0; row < table->rows; ++row) {
+        float hypo = table->row_hypo[row];
+        if (std::isnan(hypo))
+            continue; // the ray is not valid, it can't hit anything
+        if (hypo > 0.f && (table->row_y[row] < min_slope * hypo || table->row_y[row] > max_slope * hypo))
+            continue;
+        cells.row = MIN(cells.row, row);
+        cells.row_end = row + 1;
+    }
+
+    // The box doesn't contain the camera, so the headings of its corners are less than half a turn apart,
+    // and are measured from the heading of its center.
+    float center_x = (low.x + high.x) / 2.f;
+    float center_z = (low.z + high.z) / 2.f;
+    float min_angle = FLT_MAX;
+    float max_angle = -FLT_MAX;
+    for (int corner = 0; corner < 4; ++corner) {
+        float corner_x = corner & 1 ? high.x : low.x;
+        float corner_z = corner & 2 ? high.z : low.z;
+        float angle = atan2f(center_x * corner_z - center_z * corner_x, center_x * corner_x + center_z * corner_z);
+        min_angle = MIN(min_angle, angle);
+        max_angle = MAX(max_angle, angle);
+    }
+    cells.column = table->columns;
+    cells.column_end = 0;
+    for (Py_ssize_t column = 0; column < table->columns; ++column) {
+        float column_x = table->column_x[column];
+        float column_z = table->column_z[column];
+        float angle = atan2f(center_x * column_z - center_z * column_x, center_x * column_x + center_z * column_z);
+        if (angle < min_angle || angle > max_angle)
+            continue;
+        cells.column = MIN(cells.column, column);
+        cells.column_end = column + 1;
+    }
+
+    if (rect_is_empty(cells))
+        return {0, 0, 0, 0};
+    // a cell of margin for the rounding errors
+    return {MAX(cells.row - 1, 0), MIN(cells.row_end + 1, table->rows),
+            MAX(cells.column - 1, 0), MIN(cells.column_end + 1, table->columns)};
+}
+
+static void prepare_reuse(RayCasterObject *self, struct CastJob *job, const struct FrameKey *key) {
+    /*
+        Cast again only the cells where the dynamic surfaces changed since the last frame, if nothing else changed:
+        the same rays, the same static surfaces, and every cell of the last frame cast with them.
+        The other cells are copied from the last frame. The cells of a surface are cast again where it was and where
+        it is, in a few rectangles so the surfaces far from each other don't cast every cell between them.
+    */
+    struct RayTable *table = job->table;
+    bool same_view = self->history_valid && self->frame_scene_version == self->scene_version &&
+                     memcmp(key, &(self->frame_key), sizeof(*key)) == 0;
+    // an interleaved frame rebuilds half of its cells from the frame before
+    self->same_frames = same_view ? self->same_frames + 1 : 1;
+    bool reused = self->same_frames > (job->interleave ? 2 : 1);
+
+    struct DirtyRects changed = self->pending;
+    for (struct Surface *surface = self->temp_surfaces; surface != nullptr; surface = surface->next) {
+        if (reused && surface->version == surface->drawn_version && !surface->del)
+            continue; // its cells didn't change
+        struct CellRect cells = surface->culled ? (struct CellRect){0, 0, 0, 0} : get_surface_cells(table, job->origin, surface);
+        add_dirty_rect(&changed, surface->cells);
+        add_dirty_rect(&changed, cells);
+        surface->cells = cells;
+        surface->drawn_version = surface->version;
+    }
+    self->pending.count = 0;
+
+    self->dirty.count = 0;
+    if (reused) {
+        // the tiles are cast as a whole
+        int tile = job->rates.tile;
+        for (int i = 0; i < changed.count; ++i) {
+            struct CellRect rect = changed.rects[i];
+            add_dirty_rect(&(self->dirty), {rect.row / tile * tile, MIN((rect.row_end + tile - 1) / tile * tile, table->rows),
+                                            rect.column / tile * tile, MIN((rect.column_end + tile - 1) / tile * tile, table->columns)});
+        }
+        job->interleave = 0;
+        job->cached = self->history + (self->frame & 1) * self->history_cells;
+    } else
+        add_dirty_rect(&(self->dirty), {0, table->rows, 0, table->columns});
+    self->frame_key = *key;
+    self->frame_scene_version = self->scene_version;
+}
+
+static bool _get_output_buffer(PyObject *object, Py_buffer *buffer, Py_ssize_t count, const char *formats, const char *name) {
+    /*
+        Get a writable buffer of at least count items of 4 bytes, whose format is one of the given characters.
+        The buffer is left empty if the object is None, PyBuffer_Release can still be called on it.
+        @return: false with an exception set if the object is not a valid buffer
+    */
+    buffer->obj = NULL;
+    buffer->buf = NULL;
+    if (object == NULL || object == Py_None)
+        return true;
+    if (PyObject_GetBuffer(object, buffer, PyBUF_WRITABLE | PyBUF_C_CONTIGUOUS | PyBUF_FORMAT) < 0) {
+        buffer->obj = NULL;
+        return false;
+    }
+    const char *format = buffer->format;
+    if (*format == '@' || *format == '=') // native byte order
+        ++format;
+    if (buffer->itemsize != 4 || strlen(format) != 1 || strchr(formats, *format) == NULL || buffer->len < count * 4) {
+        PyBuffer_Release(buffer);
+        PyErr_Format(PyExc_ValueError, "%s must be a writable buffer of at least %zd items of the format '%c'",
+                     name, count, formats[0]);
+        return false;
+    }
+    return true;
+}
+
+inline void _release_outputs(Py_buffer *dst_buffer, Py_buffer *depth_buffer, Py_buffer *id_buffer) {
+    PyBuffer_Release(dst_buffer);
+    PyBuffer_Release(depth_buffer);
+    PyBuffer_Release(id_buffer);
 }
 
 static PyObject *method_raycasting(RayCasterObject *self, PyObject *args, PyObject *kwargs) {
@@ -492,11 +2040,19 @@ static PyObject *method_raycasting(RayCasterObject *self, PyObject *args, PyObje
     float view_distance = 1000.f;
     int step = 1;
     //float theta = 1.0f;
-    bool rad = false;
-
-    static char *kwlist[] = {"dst_surface", "x", "y", "z", "angle_x", "angle_y", "fov", "view_distance", "step", "rad", NULL};
-    if (!PyArg_ParseTupleAndKeywords(args, kwargs, "O|fffffffip", kwlist,
-                                     &screen, &x, &y, &z, &angle_x, &angle_y, &fov, &view_distance, &step, &rad))
+    int rad = 0; // "p" writes an int
+    int threads = 0;
+    int ordered = 0;
+    PyObject *rate_map = NULL;
+    int interleave = 0;
+    int reuse = 0;
+    PyObject *depth_object = NULL;
+    PyObject *id_object = NULL;
+
+    static char *kwlist[] = {"dst_surface", "x", "y", "z", "angle_x", "angle_y", "fov", "view_distance", "step", "rad", "threads", "ordered", "rate_map", "interleave", "reuse", "depth_buffer", "id_buffer", NULL};
+    if (!PyArg_ParseTupleAndKeywords(args, kwargs, "O|fffffffipipOipOO", kwlist,
+                                     &screen, &x, &y, &z, &angle_x, &angle_y, &fov, &view_distance, &step, &rad, &threads, &ordered, &rate_map, &interleave, &reuse,
+                                     &depth_object, &id_object))
         return NULL;
 
     if(fov <= 0.f) {
@@ -515,12 +2071,40 @@ static PyObject *method_raycasting(RayCasterObject *self, PyObject *args, PyObje
         PyErr_SetString(PyExc_ValueError, "the step must by higher than 0");
         return NULL;
     }
+    if (threads < 0) {
+        PyErr_SetString(PyExc_ValueError, "threads must be positive (0 to use every core)");
+        return NULL;
+    }
+    if (interleave < 0 || interleave > INTERLEAVE_LINES) {
+        PyErr_SetString(PyExc_ValueError, "interleave must be 0, 1 for a checkerboard or 2 for lines");
+        return NULL;
+    }
+    struct CastJob job;
+    if (!parse_rate_map(rate_map, &job.rates))
+        return NULL;
+    if (_caster_is_busy(self))
+        return NULL;
 
     Py_buffer dst_buffer;
     if (_get_3DBuffer_from_Surface(screen, &dst_buffer)) {
         PyErr_SetString(PyExc_ValueError, "dst_surface is not a valid surface");
         return NULL;
     }
+    // The depth and the id of the pixels are stored row by row, like the pixels of the surface.
+    Py_ssize_t pixel_count = dst_buffer.shape[0] * dst_buffer.shape[1];
+    Py_buffer depth_buffer;
+    Py_buffer id_buffer;
+    id_buffer.obj = NULL;
+    if (!_get_output_buffer(depth_object, &depth_buffer, pixel_count, "f", "depth_buffer") ||
+        !_get_output_buffer(id_object, &id_buffer, pixel_count, "IiLl", "id_buffer")) {
+        _release_outputs(&dst_buffer, &depth_buffer, &id_buffer);
+        return NULL;
+    }
+
+    if (self->bvh_dirty && build_bvh(self)) {
+        _release_outputs(&dst_buffer, &depth_buffer, &id_buffer);
+        return PyErr_NoMemory();
+    }
 
     if (!rad) { // If the given angles are in degrees, convert them to radians.
         angle_x = angle_x * M_PI / 180.f;
@@ -529,6 +2113,23 @@ static PyObject *method_raycasting(RayCasterObject *self, PyObject *args, PyObje
         // theta = theta * M_PI / 180.f;
     }
 
+    if (threads == 0)
+        threads = default_thread_count();
+
+    struct RayTable *table = get_ray_table(self, dst_buffer.shape[0], dst_buffer.shape[1], step, fov);
+    if (table == nullptr) {
+        _release_outputs(&dst_buffer, &depth_buffer, &id_buffer);
+        return PyErr_NoMemory();
+    }
+    orient_ray_table(table, y, angle_x, angle_y, view_distance);
+
+    // Skip the surfaces that no ray of this frame can reach.
+    struct Frustum frustum;
+    get_frustum(table, {x, y, z}, &frustum);
+    if (cull_surfaces(self, &frustum, ordered)) {
+        _release_outputs(&dst_buffer, &depth_buffer, &id_buffer);
+        return PyErr_NoMemory();
+    }
 
     // x_angle is the angle of the ray around the x axis.
     // y_angle is the angle of the ray around the y axis.
@@ -539,90 +2140,120 @@ static PyObject *method_raycasting(RayCasterObject *self, PyObject *args, PyObje
     */
     // It may be confusing because the x_angle move through the y axis,
     // and the y_angle move through the x axis as shown in the diagram.
-    struct pos2 ray;
-    ray.A.x = x;
-    ray.A.y = y;
-    ray.A.z = z;
-
-    Py_ssize_t width = dst_buffer.shape[0];
-    Py_ssize_t height = dst_buffer.shape[1];
-
-    float d_fov = fov/2;
-
-    long *buf = (long *)dst_buffer.buf;
-
-    float d_theta_x = fov / (float)(height / step);
-    float d_theta_y = fov / (float)(width / step);
-
-    float theta_x = d_fov + angle_x;
-
-    for (Py_ssize_t dst_y = 0; dst_y + step <= height; dst_y += step) {
-    //for (float theta_x = 0; theta_x < fov; theta_x += theta) {
-        //float view_theta_x = theta_x - d_fov + angle_x;
-        float view_theta_x = theta_x;
-        theta_x -= d_theta_x;
-        ray.B.y = view_distance * sinf(view_theta_x);
-        float dist_2d = abs(ray.B.y - ray.A.y);
-        float hypo = sqrtf(view_distance * view_distance - dist_2d * dist_2d);
-
-        float theta_y = d_fov + angle_y;
-
-        for (Py_ssize_t dst_x = 0; dst_x + step <= width; dst_x += step) {
-        //for(float theta_y = 0; theta_y < fov; theta_y += theta) {
-            // float view_theta_y = theta_y - d_fov + angle_y;
-            float view_theta_y = theta_y;
-            theta_y -= d_theta_y;
-            ray.B.x = hypo * cosf(view_theta_y);
-            ray.B.z = hypo * sinf(view_theta_y);
-
-            /*
-            // Check if the ray intersects with any surface.
-            // Keep only the closest surface.
-            float dist;
-            struct Surface *surface = nullptr;
-            vec3 intersection;
-            if (!get_closest_surface(ray, &dist, &surface, &intersection, self->surfaces))
-                continue;
-
-            // Calculate the color of the pixel.
-            long pixel;
-            get_pixel(surface, intersection, &pixel);
-            // Set the pixel in the destination surface.
-            // Py_ssize_t dst_x = width - (Py_ssize_t)(theta_y * width / fov );
-            // Py_ssize_t dst_y = height - (Py_ssize_t)(theta_x * height / fov );
-
-            //if (dst_x >= width || dst_y >= height)
-            //    continue;
-
-            for (Py_ssize_t xp = 0; xp < step; ++xp)
-                for (Py_ssize_t yp = 0; yp < step; ++yp)
-                    buf[(dst_y+yp) * width + (dst_x+xp)] = pixel;
-            */
-            unsigned long pixel = get_pixel_sum(ray, self->surfaces);
-            if (pixel == 0)
-                continue;
-
-            for (Py_ssize_t xp = 0; xp < step; ++xp)
-                for (Py_ssize_t yp = 0; yp < step; ++yp)
-                    *((unsigned long*)((unsigned char*)(buf + (dst_y+yp) * width + (dst_x+xp)) - 3)) = pixel;
-        }
+    job.caster = self;
+    job.buf = (uint32_t *)dst_buffer.buf;
+    job.width = dst_buffer.shape[0];
+    job.height = dst_buffer.shape[1];
+    job.rows = table->rows;
+    job.step = step;
+    job.origin = {x, y, z};
+    job.table = table;
+    job.ordered = ordered;
+    job.depth = (float *)depth_buffer.buf;
+    job.ids = (uint32_t *)id_buffer.buf;
+    if (!prepare_history(self, &job, interleave, reuse, angle_x, angle_y)) {
+        _release_outputs(&dst_buffer, &depth_buffer, &id_buffer);
+        return PyErr_NoMemory();
+    }
+    if (reuse) {
+        // The key is compared as a whole, so it is zeroed first.
+        struct FrameKey key;
+        memset(&key, 0, sizeof(key));
+        key.x = x;
+        key.y = y;
+        key.z = z;
+        key.angle_x = angle_x;
+        key.angle_y = angle_y;
+        key.fov = fov;
+        key.view_distance = view_distance;
+        key.width = job.width;
+        key.height = job.height;
+        key.step = step;
+        key.ordered = ordered;
+        key.interleave = interleave;
+        key.rates = job.rates;
+        prepare_reuse(self, &job, &key);
+    } else {
+        self->same_frames = 0;
+        self->dirty.count = 0;
+        add_dirty_rect(&(self->dirty), {0, table->rows, 0, table->columns});
+    }
+    Py_ssize_t tile_rows = (job.rows + job.rates.tile - 1) / job.rates.tile;
+    job.band_count = (int)MIN(tile_rows, (Py_ssize_t)threads * BANDS_PER_THREAD);
+
+    // Every pixel is independent, so the rows are split in bands rendered in parallel.
+    // With a rate map or in the interleaved mode, a band is made of whole tiles, so every tile is rendered by a single thread.
+    self->casting = true;
+    Py_BEGIN_ALLOW_THREADS
+    parallel_for(job.band_count, cast_band, &job, threads);
+    Py_END_ALLOW_THREADS
+    self->casting = false;
+
+    if (job.current != nullptr) {
+        self->frame++;
+        self->history_valid = true;
+        self->history_x = x;
+        self->history_y = y;
+        self->history_z = z;
+        self->history_angle_x = angle_x;
+        self->history_angle_y = angle_y;
     }
 
-    PyBuffer_Release(&dst_buffer);
+    _release_outputs(&dst_buffer, &depth_buffer, &id_buffer);
 
-    free_temp_surfaces(&(self->surfaces));
+    // the cells of the temporary surfaces are cast again in the next frame
+    for (struct Surface *surface = self->temp_surfaces; surface != nullptr; surface = surface->next)
+        if (surface->del)
+            add_dirty_rect(&(self->pending), surface->cells);
+    free_temp_surfaces(&(self->temp_surfaces));
 
     Py_RETURN_NONE;
 }
 
+static PyObject *method_dirty_rects(RayCasterObject *self) {
+    // Rectangles of pixels (x, y, width, height) cast again by the last raycasting, the rest was copied.
+    PyObject *rects = PyList_New(self->dirty.count);
+    if (rects == NULL)
+        return NULL;
+    for (int i = 0; i < self->dirty.count; ++i) {
+        PyObject *rect = _build_pixel_rect(self, self->dirty.rects[i]);
+        if (rect == NULL) {
+            Py_DECREF(rects);
+            return NULL;
+        }
+        PyList_SET_ITEM(rects, i, rect);
+    }
+    return rects;
+}
 
 
 
 
+
+static PyObject *method_culling_stats(RayCasterObject *self) {
+    return Py_BuildValue("{s:i,s:i,s:i,s:i}",
+                         "static", self->bvh_surface_count, "static_culled", self->static_culled,
+                         "dynamic", self->dynamic_count, "dynamic_culled", self->dynamic_culled);
+}
+
+static void caster_dealloc(RayCasterObject *self) {
+    free_surface_list(&(self->surfaces));
+    free_surface_list(&(self->temp_surfaces));
+    free(self->bvh_nodes);
+    free(self->bvh_surfaces);
+    free(self->ray_table);
+    free(self->history);
+    free(self->visible_surfaces);
+    free(self->sorted_surfaces);
+    Py_TYPE(self)->tp_free((PyObject *) self);
+}
+
 static PyMethodDef CasterMethods[] = {
-        {"add_surface", (PyCFunction) method_add_surface, METH_VARARGS | METH_KEYWORDS, "Adds a surface to the caster."},
+        {"add_surface", (PyCFunction) method_add_surface, METH_VARARGS | METH_KEYWORDS, "Adds a surface to the caster and returns a SurfaceHandle on it."},
         {"clear_surfaces", (PyCFunction) method_clear_surfaces, METH_NOARGS, "Clears all surfaces from the caster."},
-        {"raycasting", (PyCFunction) method_raycasting, METH_VARARGS | METH_KEYWORDS, "Display the scene using raycasting."},
+        {"raycasting", (PyCFunction) method_raycasting, METH_VARARGS | METH_KEYWORDS, "Display the scene using raycasting. A rate_map of (radius, rate) pairs casts a ray per block of pixels away from the center, interleave=1 (checkerboard) or 2 (lines) casts half of the pixels each frame, reuse=True copies the pixels of the last frame where nothing changed, and the optional depth_buffer (float32) and id_buffer (uint32) of width * height items get the distance and the id of the closest surface seen by each pixel."},
+        {"culling_stats", (PyCFunction) method_culling_stats, METH_NOARGS, "Number of surfaces, and of culled surfaces, in the last raycasting."},
+        {"dirty_rects", (PyCFunction) method_dirty_rects, METH_NOARGS, "Rectangles of pixels cast again by the last raycasting with reuse=True, the other pixels were copied from the frame before."},
         {NULL, NULL, 0, NULL}
 };
 
@@ -631,6 +2262,7 @@ static PyTypeObject RayCasterType = {
         .tp_name = "nostalgiaeraycasting.RayCaster",
         .tp_basicsize = sizeof(RayCasterObject),
         .tp_itemsize = 0,
+        .tp_dealloc = (destructor) caster_dealloc,
         .tp_flags = Py_TPFLAGS_DEFAULT | Py_TPFLAGS_BASETYPE,
         .tp_doc = PyDoc_STR("RayCaster Object"),
         .tp_methods = CasterMethods,
@@ -650,6 +2282,9 @@ PyMODINIT_FUNC PyInit_nostalgiaeraycasting(void) {
     if (PyType_Ready(&RayCasterType) < 0)
         return NULL;
 
+    if (PyType_Ready(&SurfaceHandleType) < 0)
+        return NULL;
+
     PyObject *m = PyModule_Create(&castermodule);
 
     if (m == NULL)
@@ -662,5 +2297,12 @@ PyMODINIT_FUNC PyInit_nostalgiaeraycasting(void) {
         return NULL;
     }
 
+    Py_INCREF(&SurfaceHandleType);
+    if (PyModule_AddObject(m, "SurfaceHandle", (PyObject *)&SurfaceHandleType) < 0) {
+        Py_DECREF(&SurfaceHandleType);
+        Py_DECREF(m);
+        return NULL;
+    }
+
     return m;
 }
\ No newline at end of file
@@ -1,4 +1,24 @@
 from setuptools import setup, Extension
+from setuptools.command.build_ext import build_ext
+
+
+# The flags depend on the compiler: MSVC on Windows, gcc or clang everywhere else.
+COMPILE_ARGS: dict[str, list[str]] = {
+    "msvc": ["/O2", "/GS-", "/fp:fast", "/std:c++latest", "/Zc:strictStrings-"],
+    "unix": ["-O3", "-std=c++20", "-pthread"],
+}
+LINK_ARGS: dict[str, list[str]] = {
+    "unix": ["-pthread"],
+}
+
+
+class BuildExt(build_ext):
+    def build_extensions(self):
+        compiler_type = self.compiler.compiler_type
+        for extension in self.extensions:
+            extension.extra_compile_args = COMPILE_ARGS.get(compiler_type, [])
+            extension.extra_link_args = LINK_ARGS.get(compiler_type, [])
+        super().build_extensions()
 
 
 def main():
@@ -11,9 +31,9 @@ def main():
               Extension(
                   "nostalgiaeraycasting",
                   ["casting.cpp"],
-                  extra_compile_args=["/O2", "/GS-", "/fp:fast", "/std:c++latest", "/Zc:strictStrings-"]
               )
-          ]
+          ],
+          cmdclass={"build_ext": BuildExt},
           )
 
 
@@ -0,0 +1,235 @@
+"""Headless benchmark of the renderer and the filters.
+
+Every room is built and rendered at a fixed camera pose, and every filter is timed at several resolutions.
+It runs with the dummy video and audio drivers of SDL, so it works without a screen, a GPU or a sound card.
+
+    python benchmark.py -o results.json
+    python benchmark.py --compare before.json after.json
+"""
+
+#### __IMPORTS__ ####
+
+# STANDARD IMPORTS #
+
+from os import environ
+# run without a window, and disable the pygame message
+environ["SDL_VIDEODRIVER"] = "dummy"
+environ["SDL_AUDIODRIVER"] = "dummy"
+environ["PYGAME_HIDE_SUPPORT_PROMPT"] = "True"
+
+from argparse import ArgumentParser
+from array import array
+from json import dump, load
+from os import cpu_count
+from platform import platform, python_version
+from statistics import mean
+from subprocess import run, DEVNULL
+from time import perf_counter
+from typing import Callable
+
+# THIRD PARTY IMPORTS #
+
+import pygame
+from pygame import Surface
+pygame.init()
+pygame.mixer.init()
+
+# LOCAL IMPORTS #
+
+from scripts.display import TEXTURE_CACHE
+from scripts.foveation import FOVEATION
+from scripts.player import PLAYER
+from scripts import room
+
+from nostalgiaefilters import vignette, distortion, fish, pipeline, blur, darken_by_depth, set_threads
+
+#### __INIT__ ####
+
+# Camera pose of each room: x, y, z, rot_x, rot_y
+ROOMS: dict[str, tuple[float, float, float, float, float]] = {
+    "LivingRoom": (0., 0., 0., 0., 120.),
+    "Corridor": (1.5, 2., 3.5, 0., 180.),
+    "BedRoom": (-1., 2., 5., 0., 90.),
+    "LongCorridor": (0., 0., 0., 0., 90.),
+    "InfiniteRoom": (0., 0., 0., 0., 90.),
+    "TheEnd": (0., 0., 0., 0., 90.),
+}
+
+DEFAULT_RESOLUTIONS: str = "192x108,384x216,768x432"
+
+
+# TIMING #
+
+def measure(function: Callable[[], object], repeat: int) -> dict[str, float]:
+    """Time a function, after a first call to warm up the caches.
+    :return: the best and the mean time of the calls, in milliseconds.
+    """
+    function()
+    times: list[float] = []
+    for _ in range(repeat):
+        start = perf_counter()
+        function()
+        times.append((perf_counter() - start) * 1000)
+    return {"best_ms": round(min(times), 3), "mean_ms": round(mean(times), 3)}
+
+
+def bench_rooms(resolutions: list[tuple[int, int]], repeat: int, threads: int) -> dict:
+    """Build every room and time the raycasting, in the default and in the ordered mode.
+    The foveated mode is the ordered mode with the rate map of the usual vignette of the game,
+    and the interleaved mode is the ordered mode casting half of the pixels in a checkerboard.
+    The reused mode is the ordered mode copying the last frame, as nothing moves between the calls.
+    """
+    PLAYER.movements = True
+    PLAYER.update_keys()
+
+    results: dict = {}
+    for name, pose in ROOMS.items():
+        try:
+            current_room: room.Room = getattr(room, name)()
+            PLAYER.x, PLAYER.y, PLAYER.z, PLAYER.rot_x, PLAYER.rot_y = pose
+            current_room.load_dynamic_surfaces(current_room.caster)
+        except (pygame.error, FileNotFoundError) as error:  # missing assets
+            results[name] = {"error": str(error)}
+            continue
+
+        room_results: dict = {}
+        for width, height in resolutions:
+            surface = Surface((width, height))
+            modes: dict = {}
+            rate_map = FOVEATION.update(width, -width / 6, 1.5)
+            for mode, ordered, rates, interleave, reuse in (
+                    ("default", False, None, 0, False), ("ordered", True, None, 0, False),
+                    ("foveated", True, rate_map, 0, False), ("interleaved", True, None, 1, False),
+                    ("reused", True, None, 0, True)):
+                modes[mode] = measure(
+                    lambda: current_room.caster.raycasting(
+                        surface,
+                        PLAYER.x, PLAYER.y + PLAYER.height, PLAYER.z,
+                        PLAYER.rot_x, PLAYER.rot_y,
+                        PLAYER.FOV,
+                        PLAYER.VIEW_DISTANCE,
+                        threads=threads,
+                        ordered=ordered,
+                        rate_map=rates,
+                        interleave=interleave,
+                        reuse=reuse,
+                    ),
+                    repeat)
+            modes["culling"] = current_room.caster.culling_stats()
+            room_results[f"{width}x{height}"] = modes
+        results[name] = room_results
+        current_room.clear_surfaces()
+    return results
+
+
+def bench_filters(resolutions: list[tuple[int, int]], repeat: int) -> dict:
+    """Time the filters with the arguments used in the game."""
+    results: dict = {"vignette": {}, "darken_by_depth": {}, "distortion": {}, "fish": {}, "pipeline": {}, "blur": {}}
+    for width, height in resolutions:
+        src = Surface((width, height)).convert_alpha()
+        dst = Surface((width, height)).convert_alpha()
+        src.fill((120, 80, 200))
+        resolution = f"{width}x{height}"
+        results["vignette"][resolution] = measure(
+            lambda: vignette(src, inner_radius=-width / 6, strength=1.5), repeat)
+        # the depth of a wall going away from the camera
+        depth = array("f", [4 * x / width for _ in range(height) for x in range(width)])
+        results["darken_by_depth"][resolution] = measure(
+            lambda: darken_by_depth(src, depth, 1., 4., 1.5), repeat)
+        results["distortion"][resolution] = measure(
+            lambda: distortion(src, dst, True, True, width / 200, 0.1, 0.01), repeat)
+        results["fish"][resolution] = measure(
+            lambda: fish(src, dst, 0.2), repeat)
+        # the post effects of TheEnd during the fight
+        results["pipeline"][resolution] = measure(
+            lambda: pipeline(src, [
+                ("distortion", 40, True, True, 10 * width / 1500, 0.05, 0.01),
+                ("distortion", 10, True, True, 10 * width / 1000, 0.01, 0.01),
+                ("distortion", 5, True, True, 10 * width / 500, 0.005, 0.005),
+                ("vignette", -width / 6, 1.5),
+            ]), repeat)
+        results["blur"][resolution] = measure(
+            lambda: blur(src, radius=4, passes=3), repeat)
+    return results
+
+
+# RESULTS #
+
+def git_commit() -> str | None:
+    """Return the current commit, if the project is a git repository."""
+    try:
+        result = run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, stdin=DEVNULL)
+    except OSError:
+        return None
+    return result.stdout.strip() or None
+
+
+def flatten(results: dict, prefix: str = "") -> dict[str, float]:
+    """Map the path of every best time of the results to its value."""
+    times: dict[str, float] = {}
+    for key, value in results.items():
+        if key == "best_ms":
+            times[prefix] = value
+        elif isinstance(value, dict):
+            times.update(flatten(value, f"{prefix}/{key}" if prefix else key))
+    return times
+
+
+def compare(before_path: str, after_path: str) -> None:
+    """Print the best times of two result files side by side."""
+    with open(before_path) as file:
+        before = flatten(load(file)["results"])
+    with open(after_path) as file:
+        after = flatten(load(file)["results"])
+
+    width = max(map(len, before | after))
+    print(f"{'':{width}}  {'before':>10}  {'after':>10}  {'speedup':>8}")
+    for key in sorted(before.keys() & after.keys()):
+        speedup = before[key] / after[key] if after[key] else float("inf")
+        print(f"{key:{width}}  {before[key]:>10.3f}  {after[key]:>10.3f}  {speedup:>7.2f}x")
+    for key in sorted(before.keys() ^ after.keys()):
+        print(f"{key:{width}}  only in {'before' if key in before else 'after'}")
+
+
+def parse_resolutions(text: str) -> list[tuple[int, int]]:
+    """Parse resolutions written as "192x108,384x216"."""
+    return [tuple(map(int, resolution.split("x"))) for resolution in text.split(",")]
+
+
+def main() -> None:
+    parser = ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("-o", "--output", default="benchmark.json", help="JSON file where the results are written")
+    parser.add_argument("-r", "--resolutions", default=DEFAULT_RESOLUTIONS, help="comma separated WIDTHxHEIGHT")
+    parser.add_argument("-n", "--repeat", type=int, default=10, help="number of timed calls of each function")
+    parser.add_argument("-t", "--threads", type=int, default=0, help="threads of the raycasting and the filters, 0 to use every core")
+    parser.add_argument("--compare", nargs=2, metavar=("BEFORE", "AFTER"), help="compare two result files and exit")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    resolutions = parse_resolutions(args.resolutions)
+    set_threads(args.threads)
+    report: dict = {
+        "commit": git_commit(),
+        "platform": platform(),
+        "python": python_version(),
+        "pygame": pygame.version.ver,
+        "cpu_count": cpu_count(),
+        "repeat": args.repeat,
+        "threads": args.threads,
+        "results": {
+            "rooms": bench_rooms(resolutions, args.repeat, args.threads),
+            "filters": bench_filters(resolutions, args.repeat),
+        },
+        "textures": TEXTURE_CACHE.stats(),
+    }
+
+    with open(args.output, "w") as file:
+        dump(report, file, indent=2)
+    print(f"Results written in {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -3,6 +3,7 @@
 # STANDARD IMPORTS #
 
 from os import environ
+from sys import argv
 # disable the pygame message
 environ["PYGAME_HIDE_SUPPORT_PROMPT"] = "True"
 
@@ -17,6 +18,7 @@ pygame.init()
 
 from scripts.display import DISPLAY
 from scripts.game import GAME
+from scripts.profiler import PROFILER
 
 #### __INIT__ ####
 
@@ -35,6 +37,8 @@ def events() -> bool:
         match event.type:
             case pygame.QUIT:
                 return False
+            case pygame.KEYDOWN if event.key == pygame.K_F3:
+                PROFILER.toggle_overlay()
     return True
 
 
@@ -50,12 +54,21 @@ def debug_print() -> None:
 
 
 def main(debug: bool = False) -> None:
+    # python main.py --profile frames.csv writes the time of every stage of every frame
+    if "--profile" in argv[:-1]:
+        PROFILER.open_csv(argv[argv.index("--profile") + 1])
+
     while events():
-        DISPLAY.update()
         GAME.update()
+        PROFILER.draw_overlay(DISPLAY.screen)
+        # the screen is flipped before the end of the frame, so its time is in the row of the frame it shows
+        DISPLAY.update()
+        PROFILER.end_frame()
         # if debug:
         #     debug_print()
 
+    PROFILER.close_csv()
+
 
 if __name__ == '__main__':
     main(__debug__)  # Look mom ! I'm a pro at Python !
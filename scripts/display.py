@@ -1,6 +1,9 @@
+from collections import OrderedDict
 from os.path import join as join_path
 from os import listdir
-from typing import Generator
+from sys import getrefcount
+from threading import RLock
+from typing import Generator, NamedTuple
 
 from pygame import display as pygame_display
 from pygame.transform import scale
@@ -9,13 +12,99 @@ from pygame import Surface
 from pygame.time import Clock
 from pygame.image import load as pygame_image_load
 
+from scripts.profiler import PROFILER
+
+from nostalgiaefilters import upscale
+
+
+class TextureCache:
+    """Share the images loaded from the disk.
+
+    Every path is decoded and converted once, and the same surface is returned to all the callers,
+    so the returned surfaces must not be modified.
+    An image is in use while anything other than the cache holds a reference to its surface (a furniture, a caster...).
+    When the images take more than the budget, the least recently used ones that are not in use are dropped.
+    """
+    BUDGET: int = 64 * 1024 * 1024  # bytes
+
+    def __init__(self, budget: int = BUDGET) -> None:
+        self.budget: int = budget
+        self._surfaces: OrderedDict[str, Surface] = OrderedDict()
+        self._resident_bytes: int = 0
+        self._hits: int = 0
+        self._misses: int = 0
+        self._evictions: int = 0
+        self._lock: RLock = RLock()
+
+    @staticmethod
+    def _size_of(surface: Surface) -> int:
+        return surface.get_width() * surface.get_height() * surface.get_bytesize()
+
+    def _in_use(self, key: str) -> bool:
+        # references: the cache and the argument of getrefcount
+        return getrefcount(self._surfaces[key]) > 2
+
+    def load(self, *path: str) -> Surface:
+        """Return the image at the path, loading it if it is not in the cache."""
+        key: str = join_path(*path)
+        with self._lock:
+            surface: Surface | None = self._surfaces.get(key)
+            if surface is not None:
+                self._hits += 1
+                self._surfaces.move_to_end(key)
+                return surface
+            self._misses += 1
+            surface = pygame_image_load(key).convert_alpha()
+            self._surfaces[key] = surface
+            self._resident_bytes += self._size_of(surface)
+            self.trim()
+            return surface
+
+    def trim(self) -> None:
+        """Drop the least recently used images that are not in use until the cache fits in the budget."""
+        with self._lock:
+            for key in list(self._surfaces):
+                if self._resident_bytes <= self.budget:
+                    break
+                if self._in_use(key):
+                    continue
+                surface = self._surfaces.pop(key)
+                self._resident_bytes -= self._size_of(surface)
+                self._evictions += 1
+
+    def clear(self) -> None:
+        """Forget every image, the surfaces still in use stay valid."""
+        with self._lock:
+            self._surfaces.clear()
+            self._resident_bytes = 0
+
+    def stats(self) -> dict[str, int | float]:
+        """Return the hits, the misses and the memory used by the cache."""
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "entries": len(self._surfaces),
+                "in_use": sum(map(self._in_use, self._surfaces)),
+                "resident_bytes": self._resident_bytes,
+                "budget": self.budget,
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": self._hits / lookups if lookups else 0.,
+                "evictions": self._evictions,
+            }
+
+
+TEXTURE_CACHE: TextureCache = TextureCache()
+
 
 def load_image(*path: str) -> Surface:
     """Load an image from a path.
+
+    The image is shared with the other callers loading the same path, see TextureCache.
     @param path: The path to the image.
     :return: The loaded image.
     """
-    return pygame_image_load(join_path(*path)).convert_alpha()
+    return TEXTURE_CACHE.load(*path)
 
 
 def lazy_load_images(*path: str) -> Generator:
@@ -25,15 +114,16 @@ def lazy_load_images(*path: str) -> Generator:
         yield load_image(path, file_path)
 
 
-def repeat_texture(texture: Surface, x: int = 1, y: int = 1) -> Surface:
-    """Repeat a texture multiple times."""
-    assert x > 0 and y > 0, "x and y must be greater than 0"
-    surface = Surface((texture.get_width() * x, texture.get_height() * y)).convert_alpha()
-    for i in range(x):
-        for j in range(y):
-            surface.blit(texture, (i * texture.get_width(), j * texture.get_height()))
+class TiledTexture(NamedTuple):
+    """A texture repeated on a surface by the ray caster, without making a bigger copy of it."""
+    texture: Surface
+    repeat_x: int = 1
+    repeat_y: int = 1
 
-    return surface.convert_alpha()
+    @classmethod
+    def of(cls, image: "Surface | TiledTexture") -> "TiledTexture":
+        """Return the image as a TiledTexture, a surface being displayed once."""
+        return image if isinstance(image, TiledTexture) else cls(image)
 
 
 class Display:
@@ -84,20 +174,41 @@ class Display:
         """get the time in seconds between two frames."""
         return self._delta
 
+    @property
+    def frame_time(self) -> int:
+        """get the time in milliseconds spent on the last frame, without the wait of the FPS limit."""
+        return self._clock.get_rawtime()
+
     def update(self) -> None:
         """Update the screen."""
-        pygame_display.update()
+        with PROFILER.stage("display_update"):
+            pygame_display.update()
         self.screen.fill((0, 0, 0))
         self._delta = self._clock.tick(Display.FPS_LIMIT) / 1000
         self._fps = self._clock.get_fps()
 
+    def can_upscale(self, surface: Surface) -> bool:
+        """Return True if the surface can be displayed with an integer upscale."""
+        width, height = surface.get_size()
+        return (width and height and self.width % width == 0 and self.height % height == 0
+                and surface.get_bitsize() == self.screen.get_bitsize() == 32
+                and surface.get_masks()[:3] == self.screen.get_masks()[:3])
+
     def display(self, surface: Surface) -> None:
         """Display a surface on the screen.
 
         The surface will be scaled to the screen size.
+        When the screen size is a multiple of the surface size, every pixel is simply repeated,
+        which is much faster than a scale.
         @param surface: The surface to display
         """
-        scale(surface, self.size, self.screen)
+        with PROFILER.stage("display"):
+            if self.can_upscale(surface):
+                upscale(surface, self.screen)
+                PROFILER.set_value("present", f"upscale x{self.width // surface.get_width()}")
+            else:
+                scale(surface, self.size, self.screen)
+                PROFILER.set_value("present", "scale")
 
 
 DISPLAY: Display = Display()
@@ -4,7 +4,7 @@ from scripts.display import load_image, DISPLAY
 
 
 class END_SCREEN:
-    END_SURFACE: Surface = load_image("data", "end", "end.png")
+    END_SURFACE: Surface = load_image("data", "end", "end.png").copy()  # the cached image is shared, and its alpha changes
     ALPHA: int = 0
 
     @classmethod
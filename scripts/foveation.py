@@ -0,0 +1,29 @@
+class Foveation:
+    """Rate map of the ray caster, from the parameters of the vignette.
+
+    The vignette darkens the pixels with their distance to the center of the screen, so the dark edges don't need a ray
+    per pixel: a ray is cast for a block of pixels whose size grows as the brightness falls, and none where the vignette
+    is black. The rate map is a tuple of (radius, rate) pairs, see the rate_map argument of RayCaster.raycasting.
+    """
+    # brightness under which each rate is used, from the brightest; a rate of 0 casts no ray
+    LEVELS: tuple[tuple[float, int], ...] = ((0.5, 2), (0.25, 4), (0., 0))
+
+    def __init__(self) -> None:
+        self.enabled: bool = True
+        self.rate_map: tuple[tuple[float, int], ...] = ()
+
+    def update(self, width: int, inner_radius: float, strength: float) -> tuple[tuple[float, int], ...]:
+        """Set the rate map for the vignette of a surface, with the arguments given to the vignette effect."""
+        if not self.enabled or strength <= 0 or width <= inner_radius:
+            self.rate_map = ()
+            return self.rate_map
+
+        # The brightness at a distance d of the center is 1 - strength * (d - inner_radius) / (width - inner_radius),
+        # so it goes under a level from the radius:
+        self.rate_map = tuple(
+            (inner_radius + (1 - level) * (width - inner_radius) / strength, rate) for level, rate in self.LEVELS
+        )
+        return self.rate_map
+
+
+FOVEATION: Foveation = Foveation()
@@ -6,12 +6,20 @@ from random import randint
 from pygame import Surface
 from pygame import mouse
 
-from scripts.display import load_image, repeat_texture, DISPLAY
+from scripts.display import load_image, TiledTexture, DISPLAY
 from scripts.tv_mini_game import TvGame
 from scripts.text import Text
 
 
 class Furniture(ABC):
+    animated_textures: bool = False  # the images of the dynamic surfaces are drawn on between two frames
+    TEXTURES: dict[str, tuple[str, ...]] = {}  # path of every image of the furniture, by name
+
+    @classmethod
+    def image(cls, name: str) -> Surface:
+        """Load one of the images of the furniture, see TEXTURES."""
+        return load_image(*cls.TEXTURES[name])
+
     def __init__(self, x: float = 0, y: float = 0, z: float = 0):
         self.x: float = x
         self.y: float = y
@@ -27,13 +35,17 @@ class Furniture(ABC):
 
 
 class Test(Furniture):
+    TEXTURES = {
+        "test": ("data", "textures", "furniture", "test.png"),
+    }
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.my_var: float = 0.0
 
     def static_surfaces(self) -> list[tuple]:
         return [
-            (load_image("data", "textures", "furniture", "test.png"),
+            (self.image("test"),
              self.x-1, self.y+2, self.z+2,
              self.x+1, self.y+0, self.z+2)
         ]
@@ -43,18 +55,22 @@ class Test(Furniture):
         from math import sin
         temp = 2 + sin(self.my_var)
         return [
-            (load_image("data", "textures", "furniture", "test.png"),  # Don't actually load in the dynamic method
+            (self.image("test"),  # Don't actually load in the dynamic method
              self.x, self.y+temp, self.z+temp,
              self.x+temp, self.y, self.z+temp),
         ]
 
 
 class Plant(Furniture):
+    TEXTURES = {
+        "plant": ("data", "textures", "furniture", "plant.png"),
+    }
+
     def __init__(self, height: float = 1.5, width: float = 0.5, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.height: float = height
         self.width: float = width
-        self.texture: Surface = load_image("data", "textures", "furniture", "plant.png")
+        self.texture: Surface = self.image("plant")
 
     def static_surfaces(self) -> list[tuple]:
         return []
@@ -69,6 +85,13 @@ class Plant(Furniture):
 
 
 class TV(Furniture):
+    animated_textures: bool = True  # the screen of the mini game
+    TEXTURES = {
+        "tv0": ("data", "textures", "furniture", "tv", "tv0.png"),
+        "tv1": ("data", "textures", "furniture", "tv", "tv1.png"),
+        "tv2": ("data", "textures", "furniture", "tv", "tv2.png"),
+    }
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.size: float = 0.5
@@ -77,20 +100,20 @@ class TV(Furniture):
 
     def static_surfaces(self) -> list[tuple]:
         return [
-            (load_image("data", "textures", "furniture", "tv", "tv0.png"),
+            (self.image("tv0"),
              self.x, self.y + self.size, self.z,
              self.x + self.size, self.y, self.z),
-            (load_image("data", "textures", "furniture", "tv", "tv1.png"),
+            (self.image("tv1"),
              self.x, self.y + self.size, self.z + self.size,
              self.x, self.y, self.z),
-            (load_image("data", "textures", "furniture", "tv", "tv1.png"),
+            (self.image("tv1"),
              self.x + self.size, self.y + self.size, self.z + self.size,
              self.x + self.size, self.y, self.z),
-            (load_image("data", "textures", "furniture", "tv", "tv1.png"),
+            (self.image("tv1"),
              self.x, self.y + self.size, self.z + self.size,
              self.x + self.size, self.y + self.size, self.z,
              self.x, self.y + self.size, self.z),
-            (load_image("data", "textures", "furniture", "tv", "tv2.png"),
+            (self.image("tv2"),
              self.x, self.y + 2 * self.size, self.z + self.size / 2,
              self.x + self.size, self.y + self.size, self.z + self.size / 2),
         ]
@@ -117,6 +140,11 @@ class TV(Furniture):
 
 
 class Couch(Furniture):
+    TEXTURES = {
+        "couch_texture": ("data", "textures", "furniture", "couch", "couch_texture.png"),
+        "couch_side": ("data", "textures", "furniture", "couch", "couch_side.png"),
+    }
+
     def __init__(self, width: float = 1, height: float = 1, length: float = 1, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.height: float = height
@@ -125,39 +153,39 @@ class Couch(Furniture):
 
     def static_surfaces(self) -> list[tuple]:
         return [
-            (load_image("data", "textures", "furniture", "couch", "couch_texture.png"),  # back
+            (self.image("couch_texture"),  # back
                 self.x, self.y + self.height * 0.4, self.z,
                 self.x + self.length, self.y, self.z),
-            (load_image("data", "textures", "furniture", "couch", "couch_texture.png"),  # front
+            (self.image("couch_texture"),  # front
                 self.x, self.y + self.height * 0.4, self.z - self.width,
                 self.x + self.length, self.y, self.z - self.width),
-            (load_image("data", "textures", "furniture", "couch", "couch_texture.png"),  # top
+            (self.image("couch_texture"),  # top
                 self.x, self.y + self.height * 0.4, self.z,
                 self.x + self.length, self.y + self.height * 0.4, self.z - self.width,
                 self.x, self.y + self.height * 0.4, self.z - self.width),
-            (load_image("data", "textures", "furniture", "couch", "couch_texture.png"),  # left
+            (self.image("couch_texture"),  # left
                 self.x, self.y + self.height * 0.4, self.z,
                 self.x, self.y, self.z - self.width),
-            (load_image("data", "textures", "furniture", "couch", "couch_texture.png"),  # right
+            (self.image("couch_texture"),  # right
                 self.x + self.length, self.y + self.height * 0.4, self.z,
                 self.x + self.length, self.y, self.z - self.width),
 
-            (load_image("data", "textures", "furniture", "couch", "couch_texture.png"),  # back
+            (self.image("couch_texture"),  # back
              self.x, self.y + self.height, self.z - self.width - self.width * 0.2,
              self.x + self.length, self.y, self.z - self.width,
              self.x, self.y, self.z - self.width),
-            (load_image("data", "textures", "furniture", "couch", "couch_texture.png"),  # front
+            (self.image("couch_texture"),  # front
              self.x, self.y + self.height, self.z + self.width * 0.2 - self.width,
              self.x + self.length, self.y, self.z + self.width * 0.4 - self.width,
              self.x, self.y, self.z + self.width * 0.4 - self.width),
-            (load_image("data", "textures", "furniture", "couch", "couch_texture.png"),  # top
+            (self.image("couch_texture"),  # top
              self.x, self.y + self.height, self.z - self.width - self.width * 0.2,
              self.x + self.length, self.y + self.height, self.z + self.width * 0.2 - self.width,
              self.x, self.y + self.height, self.z + self.width * 0.2 - self.width),
-            (load_image("data", "textures", "furniture", "couch", "couch_side.png"),  # left
+            (self.image("couch_side"),  # left
              self.x, self.y + self.height, self.z - self.width - self.width * 0.2,
              self.x, self.y, self.z + self.width * 0.4 - self.width),
-            (load_image("data", "textures", "furniture", "couch", "couch_side.png"),  # right
+            (self.image("couch_side"),  # right
              self.x + self.length, self.y + self.height, self.z - self.width - self.width * 0.2,
              self.x + self.length, self.y, self.z + self.width * 0.4 - self.width),
         ]
@@ -167,6 +195,12 @@ class Couch(Furniture):
 
 
 class Drawer(Furniture):
+    TEXTURES = {
+        "drawer0": ("data", "textures", "furniture", "drawer", "drawer0.png"),
+        "drawer1": ("data", "textures", "furniture", "drawer", "drawer1.png"),
+        "drawer2": ("data", "textures", "furniture", "drawer", "drawer2.png"),
+    }
+
     def __init__(self, width: float = 1, height: float = 1, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.height: float = height
@@ -174,16 +208,16 @@ class Drawer(Furniture):
 
     def static_surfaces(self) -> list[tuple]:
         return [
-            (load_image("data", "textures", "furniture", "drawer", "drawer0.png"),
+            (self.image("drawer0"),
              self.x, self.y + self.height, self.z,
              self.x + self.width, self.y, self.z),
-            (load_image("data", "textures", "furniture", "drawer", "drawer1.png"),
+            (self.image("drawer1"),
              self.x + 0.05 * self.width, self.y + self.height, self.z+self.width,
              self.x + 0.05 * self.width, self.y, self.z),
-            (load_image("data", "textures", "furniture", "drawer", "drawer1.png"),
+            (self.image("drawer1"),
              self.x + self.width - 0.05 * self.width, self.y + self.height, self.z + self.width,
              self.x + self.width - 0.05 * self.width, self.y, self.z),
-            (load_image("data", "textures", "furniture", "drawer", "drawer2.png"),
+            (self.image("drawer2"),
              self.x, self.y + self.height, self.z,
              self.x + self.width, self.y + self.height, self.z + self.width,
              self.x, self.y + self.height, self.z + self.width),
@@ -194,6 +228,13 @@ class Drawer(Furniture):
 
 
 class LivingRoomWalls(Furniture):
+    TEXTURES = {
+        "woodfine": ("data", "textures", "wall", "woodfine.png"),
+        "ceiling": ("data", "textures", "wall", "ceiling.png"),
+        "living_left_wall": ("data", "textures", "wall", "living_left_wall.png"),
+        "livingwall": ("data", "textures", "wall", "livingwall.png"),
+    }
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
@@ -205,24 +246,24 @@ class LivingRoomWalls(Furniture):
         front = self.z + 1.
         back = self.z - 3.
         return [
-            (repeat_texture(load_image("data", "textures", "wall", "woodfine.png"), 2, 2),
+            (TiledTexture(self.image("woodfine"), 2, 2),
              left-0.1, bottom, front+0.1,
              right+0.1, bottom, back-0.1,
              left-0.1, bottom, back-0.1),
-            (repeat_texture(load_image("data", "textures", "wall", "ceiling.png"), 2, 2),
+            (TiledTexture(self.image("ceiling"), 2, 2),
              left-0.1, top, front+0.1,
              right+0.1, top, back-0.1,
              left-0.1, top, back-0.1),
-            (load_image("data", "textures", "wall", "living_left_wall.png"),
+            (self.image("living_left_wall"),
              left, top, front,
              right, bottom, front,),
-            (load_image("data", "textures", "wall", "living_left_wall.png"),
+            (self.image("living_left_wall"),
              left, top, back-0.01,
              left, bottom, front,),
-            (repeat_texture(load_image("data", "textures", "wall", "livingwall.png"), 2, 2),
+            (TiledTexture(self.image("livingwall"), 2, 2),
              right, top, back,
              left, bottom, back,),
-            (repeat_texture(load_image("data", "textures", "wall", "livingwall.png"), 2, 2),
+            (TiledTexture(self.image("livingwall"), 2, 2),
              right, top, front,
              right, bottom, back,),
         ]
@@ -232,6 +273,10 @@ class LivingRoomWalls(Furniture):
 
 
 class Door(Furniture):
+    TEXTURES = {
+        "door": ("data", "textures", "furniture", "door.png"),
+    }
+
     def __init__(self, axis_x: bool = True, width: float = 0.6, height: float = 2., *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.axis_x: bool = axis_x
@@ -240,7 +285,7 @@ class Door(Furniture):
 
     def static_surfaces(self) -> list[tuple]:
         return [
-            (load_image("data", "textures", "furniture", "door.png"),
+            (self.image("door"),
              self.x, self.y+self.height, self.z,
              self.x + (self.width if self.axis_x else 0), self.y, self.z + (0 if self.axis_x else self.width)),
         ]
@@ -250,6 +295,10 @@ class Door(Furniture):
 
 
 class Window(Furniture):
+    TEXTURES = {
+        "window": ("data", "textures", "furniture", "window.png"),
+    }
+
     def __init__(self, axis_x: bool = True, width: float = 0.4, height: float = 0.8, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.axis_x: bool = axis_x
@@ -258,7 +307,7 @@ class Window(Furniture):
 
     def static_surfaces(self) -> list[tuple]:
         return [
-            (load_image("data", "textures", "furniture", "window.png"),
+            (self.image("window"),
              self.x, self.y+self.height, self.z,
              self.x + (self.width if self.axis_x else 0), self.y, self.z + (0 if self.axis_x else self.width)),
         ]
@@ -268,6 +317,10 @@ class Window(Furniture):
 
 
 class Stairs(Furniture):
+    TEXTURES = {
+        "stairs": ("data", "textures", "furniture", "stairs.png"),
+    }
+
     def __init__(self, length: float = 2., height: float = 2., width: float = 0.5, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.length: float = length
@@ -276,7 +329,7 @@ class Stairs(Furniture):
 
     def static_surfaces(self) -> list[tuple]:
         return [
-            (load_image("data", "textures", "furniture", "stairs.png"),
+            (self.image("stairs"),
              self.x, self.y + self.height, self.z + self.length,
              self.x + self.width, self.y, self.z,
              self.x, self.y, self.z),
@@ -290,41 +343,48 @@ class Stairs(Furniture):
 
 
 class CorridorWalls(Furniture):
+    TEXTURES = {
+        "corridor_wall": ("data", "textures", "wall", "corridor_wall.png"),
+        "corridor_wall_front": ("data", "textures", "wall", "corridor_wall_front.png"),
+        "ceiling": ("data", "textures", "wall", "ceiling.png"),
+        "light_wood": ("data", "textures", "wall", "light_wood.png"),
+    }
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
     def static_surfaces(self) -> list[tuple]:
         return [
-            (load_image("data", "textures", "wall", "corridor_wall.png"),  # INNER
+            (self.image("corridor_wall"),  # INNER
              self.x + 1.8, self.y + 5.5, self.z + 1.0,
              self.x + 1.8, self.y, self.z + 3.0,),
-            (load_image("data", "textures", "wall", "corridor_wall.png"),  # RIGHT
+            (self.image("corridor_wall"),  # RIGHT
              self.x + 2.5, self.y + 5.5, self.z + 1.0,
              self.x + 2.5, self.y, self.z + 4.0,),
 
-            (load_image("data", "textures", "wall", "corridor_wall.png"),  # LEFT
+            (self.image("corridor_wall"),  # LEFT
              self.x - 2.0, self.y + 5.5, self.z + 3.0,
              self.x - 2.0, self.y + 1.9, self.z + 4.0,),
 
-            (repeat_texture(load_image("data", "textures", "wall", "corridor_wall.png"), 2),  # BACK
+            (TiledTexture(self.image("corridor_wall"), 2),  # BACK
              self.x - 2.0, self.y + 5.5, self.z + 3.0,
              self.x + 1.8, self.y + 1.9, self.z + 3.0,),
 
-            (load_image("data", "textures", "wall", "corridor_wall_front.png"),  # FRONT
+            (self.image("corridor_wall_front"),  # FRONT
              self.x - 2.0, self.y + 5.5, self.z + 4.0,
              self.x + 2.5, self.y + 1.9, self.z + 4.0,),
 
-            (load_image("data", "textures", "wall", "corridor_wall.png"),
+            (self.image("corridor_wall"),
              self.x + 1.8, self.y + 5., self.z + 3.,
              self.x + 2.5, self.y + 3., self.z + 1.,
              self.x + 1.8, self.y + 3., self.z + 1.,),
 
-            (repeat_texture(load_image("data", "textures", "wall", "ceiling.png"), 2),
+            (TiledTexture(self.image("ceiling"), 2),
              self.x - 2, self.y + 5., self.z + 4.,
              self.x + 2.5, self.y + 4.99, self.z + 3.0,
              self.x - 2, self.y + 4.99, self.z + 3.0,),
 
-            (repeat_texture(load_image("data", "textures", "wall", "light_wood.png"), 2),
+            (TiledTexture(self.image("light_wood"), 2),
              self.x - 2, self.y + 2., self.z + 4.,
              self.x + 2.5, self.y + 1.99, self.z + 3.0,
              self.x - 2, self.y + 1.99, self.z + 3.0,),
@@ -335,33 +395,39 @@ class CorridorWalls(Furniture):
 
 
 class BedRoomWalls(Furniture):
+    TEXTURES = {
+        "light_wood": ("data", "textures", "wall", "light_wood.png"),
+        "ceiling": ("data", "textures", "wall", "ceiling.png"),
+        "flower_wall": ("data", "textures", "wall", "flower_wall.png"),
+    }
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
     def static_surfaces(self) -> list[tuple]:
         return [
-            (repeat_texture(load_image("data", "textures", "wall", "light_wood.png"), 2, 2),
+            (TiledTexture(self.image("light_wood"), 2, 2),
              self.x-2.5, self.y + 2., self.z+7.,
              self.x, self.y + 1.99, self.z+3.99,
              self.x-2.5, self.y + 1.99, self.z+3.99,),
-            (repeat_texture(load_image("data", "textures", "wall", "ceiling.png"), 2, 2),
+            (TiledTexture(self.image("ceiling"), 2, 2),
              self.x-2.5, self.y + 5., self.z+7.,
              self.x, self.y + 5., self.z+4.,
              self.x-2.5, self.y + 5., self.z+4.,),
 
-            (repeat_texture(load_image("data", "textures", "wall", "flower_wall.png")),  # LEFT
+            (TiledTexture(self.image("flower_wall")),  # LEFT
              self.x - 2.5, self.y + 5.1, self.z + 4.,
              self.x - 2.5, self.y + 1.9, self.z + 7.),
 
-            (repeat_texture(load_image("data", "textures", "wall", "flower_wall.png")),  # RIGHT
+            (TiledTexture(self.image("flower_wall")),  # RIGHT
              self.x, self.y + 5.1, self.z + 7.,
              self.x, self.y + 1.9, self.z + 4.01),
 
-            (repeat_texture(load_image("data", "textures", "wall", "flower_wall.png")),  # BACK
+            (TiledTexture(self.image("flower_wall")),  # BACK
              self.x - 2.5, self.y + 5.1, self.z + 7.,
              self.x, self.y + 1.9, self.z + 7.),
 
-            (repeat_texture(load_image("data", "textures", "wall", "flower_wall.png")),  # FRONT
+            (TiledTexture(self.image("flower_wall")),  # FRONT
              self.x - 4., self.y + 5.1, self.z + 4.,
              self.x - 2.0, self.y + 1.9, self.z + 4.),
         ]
@@ -371,6 +437,11 @@ class BedRoomWalls(Furniture):
 
 
 class ClosetClosed(Furniture):
+    TEXTURES = {
+        "closet": ("data", "textures", "furniture", "closet", "closet.png"),
+        "closet_side": ("data", "textures", "furniture", "closet", "closet_side.png"),
+    }
+
     def __init__(self, width: float = 0.8, length: float = 0.4, height: float = 1.8, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.width = width
@@ -379,19 +450,19 @@ class ClosetClosed(Furniture):
 
     def static_surfaces(self) -> list[tuple]:
         return [
-            (load_image("data", "textures", "furniture", "closet", "closet.png"),
+            (self.image("closet"),
                 self.x, self.y + self.height, self.z,
                 self.x - self.width, self.y, self.z + self.length,),
 
-            (load_image("data", "textures", "furniture", "closet", "closet_side.png"),
+            (self.image("closet_side"),
              self.x - self.width * 0.1, self.y + self.height, self.z + self.length * 0.1,
              self.x - self.width * 0.3, self.y, self.z - self.length,),
 
-            (load_image("data", "textures", "furniture", "closet", "closet_side.png"),
+            (self.image("closet_side"),
              self.x - self.width + self.width * 0.05, self.y + self.height, self.z + self.length - self.length * 0.05,
              self.x - self.width - self.width * 0.2, self.y, self.z, - self.length * 0.1),
 
-            (load_image("data", "textures", "furniture", "closet", "closet_side.png"),
+            (self.image("closet_side"),
              self.x - self.width * 0.3, self.y + self.height, self.z - self.length,
              self.x - self.width - self.width * 0.2, self.y, self.z, - self.length * 0.1),
         ]
@@ -401,6 +472,12 @@ class ClosetClosed(Furniture):
 
 
 class ClosetOpened(Furniture):
+    TEXTURES = {
+        "open": ("data", "textures", "furniture", "closet", "open.png"),
+        "closet_side": ("data", "textures", "furniture", "closet", "closet_side.png"),
+        "door": ("data", "textures", "furniture", "closet", "door.png"),
+    }
+
     def __init__(self, width: float = 0.8, length: float = 0.4, height: float = 1.8, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.width = width
@@ -409,23 +486,23 @@ class ClosetOpened(Furniture):
 
     def static_surfaces(self) -> list[tuple]:
         return [
-            (load_image("data", "textures", "furniture", "closet", "open.png"),
+            (self.image("open"),
                 self.x, self.y + self.height, self.z,
                 self.x - self.width, self.y, self.z + self.length,),
 
-            (load_image("data", "textures", "furniture", "closet", "closet_side.png"),
+            (self.image("closet_side"),
              self.x - self.width * 0.1, self.y + self.height, self.z + self.length * 0.1,
              self.x - self.width * 0.3, self.y, self.z - self.length,),
 
-            (load_image("data", "textures", "furniture", "closet", "door.png"),
+            (self.image("door"),
              self.x - self.width * 0.06, self.y + self.height * 0.95, self.z + self.length * 0.1,
              self.x + self.width * 0.05, self.y + self.height * 0.06, self.z + self.length * 0.9,),
 
-            (load_image("data", "textures", "furniture", "closet", "closet_side.png"),
+            (self.image("closet_side"),
              self.x - self.width + self.width * 0.05, self.y + self.height, self.z + self.length - self.length * 0.05,
              self.x - self.width - self.width * 0.2, self.y, self.z, - self.length * 0.1),
 
-            (load_image("data", "textures", "furniture", "closet", "closet_side.png"),
+            (self.image("closet_side"),
              self.x - self.width * 0.3, self.y + self.height, self.z - self.length,
              self.x - self.width - self.width * 0.2, self.y, self.z, - self.length * 0.1),
         ]
@@ -435,6 +512,12 @@ class ClosetOpened(Furniture):
 
 
 class Bed(Furniture):
+    TEXTURES = {
+        "bed_side": ("data", "textures", "furniture", "bed", "bed_side.png"),
+        "bed_top": ("data", "textures", "furniture", "bed", "bed_top.png"),
+        "bed_bottom": ("data", "textures", "furniture", "bed", "bed_bottom.png"),
+    }
+
     def __init__(self, width: float = 1.2, length: float = 1.6, height: float = 0.6, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.width = width
@@ -443,17 +526,17 @@ class Bed(Furniture):
 
     def static_surfaces(self) -> list[tuple]:
         return [
-            (load_image("data", "textures", "furniture", "bed", "bed_side.png"),  # back
+            (self.image("bed_side"),  # back
              self.x, self.y + self.height, self.z,
              self.x + self.length, self.y, self.z),
-            (load_image("data", "textures", "furniture", "bed", "bed_side.png"),  # front
+            (self.image("bed_side"),  # front
              self.x, self.y + self.height, self.z - self.width,
              self.x + self.length, self.y, self.z - self.width),
-            (load_image("data", "textures", "furniture", "bed", "bed_top.png"),  # top
+            (self.image("bed_top"),  # top
              self.x, self.y + self.height, self.z,
              self.x + self.length, self.y + self.height, self.z - self.width,
              self.x, self.y + self.height, self.z - self.width),
-            (load_image("data", "textures", "furniture", "bed", "bed_bottom.png"),  # left
+            (self.image("bed_bottom"),  # left
              self.x, self.y + self.height, self.z,
              self.x, self.y, self.z - self.width),
         ]
@@ -463,13 +546,17 @@ class Bed(Furniture):
 
 
 class Eyes(Furniture):
+    TEXTURES = {
+        "eyes": ("data", "textures", "furniture", "eyes.png"),
+    }
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
     def static_surfaces(self) -> list[tuple]:
         return [
             (
-                load_image("data", "textures", "furniture", "eyes.png"),
+                self.image("eyes"),
                 self.x, self.y + 0.15, self.z,
                 self.x + 0.15, self.y, self.z - 0.15,
             )
@@ -480,30 +567,37 @@ class Eyes(Furniture):
 
 
 class LongCorridorWalls(Furniture):
+    TEXTURES = {
+        "corridor_wall_front": ("data", "textures", "wall", "corridor_wall_front.png"),
+        "corridor_wall": ("data", "textures", "wall", "corridor_wall.png"),
+        "light_wood": ("data", "textures", "wall", "light_wood.png"),
+        "ceiling": ("data", "textures", "wall", "ceiling.png"),
+    }
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
     def static_surfaces(self) -> list[tuple]:
         return [
-            (load_image("data", "textures", "wall", "corridor_wall_front.png"),
+            (self.image("corridor_wall_front"),
              self.x, self.y + 3, self.z + 6,
              self.x, self.y, self.z),
-            (repeat_texture(load_image("data", "textures", "wall", "corridor_wall.png"), 2),
+            (TiledTexture(self.image("corridor_wall"), 2),
              self.x + 1, self.y + 3, self.z + 6,
              self.x + 1, self.y, self.z),
-            (load_image("data", "textures", "wall", "corridor_wall_front.png"),
+            (self.image("corridor_wall_front"),
              self.x + 1, self.y + 3, self.z + 12,
              self.x + 1, self.y, self.z + 6),
-            (repeat_texture(load_image("data", "textures", "wall", "corridor_wall.png"), 2),
+            (TiledTexture(self.image("corridor_wall"), 2),
              self.x, self.y + 3, self.z + 12,
              self.x, self.y, self.z + 6),
 
-            (repeat_texture(load_image("data", "textures", "wall", "light_wood.png"), 4),
+            (TiledTexture(self.image("light_wood"), 4),
              self.x - 0.1, self.y, self.z,
              self.x + 1.1, self.y, self.z + 12,
              self.x + 1.1, self.y, self.z),
 
-            (repeat_texture(load_image("data", "textures", "wall", "ceiling.png"), 4),
+            (TiledTexture(self.image("ceiling"), 4),
              self.x - 0.1, self.y + 3, self.z,
              self.x + 1.1, self.y + 3, self.z + 12,
              self.x + 1.1, self.y + 3, self.z),
@@ -514,11 +608,23 @@ class LongCorridorWalls(Furniture):
 
 
 class FloatingEye(Furniture):
+    TEXTURES = {
+        "oeil10": ("data", "textures", "furniture", "eyes", "oeil10.png"),
+        "oeil11": ("data", "textures", "furniture", "eyes", "oeil11.png"),
+        "oeil12": ("data", "textures", "furniture", "eyes", "oeil12.png"),
+        "oeil20": ("data", "textures", "furniture", "eyes", "oeil20.png"),
+        "oeil21": ("data", "textures", "furniture", "eyes", "oeil21.png"),
+        "oeil22": ("data", "textures", "furniture", "eyes", "oeil22.png"),
+        "oeil30": ("data", "textures", "furniture", "eyes", "oeil30.png"),
+        "oeil31": ("data", "textures", "furniture", "eyes", "oeil31.png"),
+        "oeil32": ("data", "textures", "furniture", "eyes", "oeil32.png"),
+    }
+
     def __init__(self, texture: Literal[1, 2, 3] = 1, width: float = 0.2, height: float = 0.15, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self.eye0: Surface = load_image("data", "textures", "furniture", "eyes", f"oeil{texture}0.png")
-        self.eye1: Surface = load_image("data", "textures", "furniture", "eyes", f"oeil{texture}1.png")
-        self.eye2: Surface = load_image("data", "textures", "furniture", "eyes", f"oeil{texture}2.png")
+        self.eye0: Surface = self.image(f"oeil{texture}0")
+        self.eye1: Surface = self.image(f"oeil{texture}1")
+        self.eye2: Surface = self.image(f"oeil{texture}2")
         self.width = width
         self.height = height
         self._anim: float = 0.
@@ -561,12 +667,16 @@ class FloatingEye(Furniture):
 
 
 class Monster(Furniture):
+    TEXTURES = {
+        "monstre": ("data", "textures", "furniture", "monstre.png"),
+    }
+
     def __init__(self, speed: float = 1., goal: tuple[float, float, float] | None = None, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.goal = goal
         self.width = 1.0
         self.height = 1.9
-        self.texture = load_image("data", "textures", "furniture", "monstre.png")
+        self.texture = self.image("monstre")
         self.speed = speed
 
     def static_surfaces(self) -> list[tuple]:
@@ -595,6 +705,13 @@ class Monster(Furniture):
 
 
 class EndTV(Furniture):
+    animated_textures: bool = True  # the screen of the mini game
+    TEXTURES = {
+        "tv0": ("data", "textures", "furniture", "tv", "tv0.png"),
+        "tv1": ("data", "textures", "furniture", "tv", "tv1.png"),
+        "tv2": ("data", "textures", "furniture", "tv", "tv2.png"),
+    }
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.size: float = 0.5
@@ -602,20 +719,20 @@ class EndTV(Furniture):
 
     def static_surfaces(self) -> list[tuple]:
         return [
-            (load_image("data", "textures", "furniture", "tv", "tv0.png"),
+            (self.image("tv0"),
              self.x, self.y + self.size, self.z,
              self.x + self.size, self.y, self.z),
-            (load_image("data", "textures", "furniture", "tv", "tv1.png"),
+            (self.image("tv1"),
              self.x, self.y + self.size, self.z + self.size,
              self.x, self.y, self.z),
-            (load_image("data", "textures", "furniture", "tv", "tv1.png"),
+            (self.image("tv1"),
              self.x + self.size, self.y + self.size, self.z + self.size,
              self.x + self.size, self.y, self.z),
-            (load_image("data", "textures", "furniture", "tv", "tv1.png"),
+            (self.image("tv1"),
              self.x, self.y + self.size, self.z + self.size,
              self.x + self.size, self.y + self.size, self.z,
              self.x, self.y + self.size, self.z),
-            (load_image("data", "textures", "furniture", "tv", "tv2.png"),
+            (self.image("tv2"),
              self.x, self.y + 2 * self.size, self.z + self.size / 2,
              self.x + self.size, self.y + self.size, self.z + self.size / 2),
         ]
@@ -641,6 +758,10 @@ class EndTV(Furniture):
 
 
 class Frame(Furniture):
+    TEXTURES = {
+        "frame": ("data", "textures", "furniture", "frame.png"),
+    }
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.height: float = 0.4
@@ -648,7 +769,7 @@ class Frame(Furniture):
 
     def static_surfaces(self) -> list[tuple]:
         return [
-            (load_image("data", "textures", "furniture", "frame.png"),
+            (self.image("frame"),
              self.x, self.y + self.height, self.z,
              self.x, self.y, self.z + self.width),
         ]
@@ -658,37 +779,43 @@ class Frame(Furniture):
 
 
 class InfiniteRoomWalls(Furniture):
+    TEXTURES = {
+        "flower_wall": ("data", "textures", "wall", "flower_wall.png"),
+        "woodfine": ("data", "textures", "wall", "woodfine.png"),
+        "ceiling": ("data", "textures", "wall", "ceiling.png"),
+    }
+
     def __init__(self, mode: int = 0, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.mode = mode
         self.width = 2.0
         self.height = 2.0
-        self.texture = repeat_texture(load_image("data", "textures", "wall", "flower_wall.png"), 2, 2)
+        self.texture = TiledTexture(self.image("flower_wall"), 2, 2)
 
     def static_surfaces(self) -> list[tuple]:
         return [
-            (repeat_texture(load_image("data", "textures", "wall", "flower_wall.png"), 2, 2),
+            (TiledTexture(self.image("flower_wall"), 2, 2),
                 self.x, self.y + self.height, self.z,
                 self.x + self.width, self.y, self.z),
 
-            (repeat_texture(load_image("data", "textures", "wall", "flower_wall.png"), 2, 2),
+            (TiledTexture(self.image("flower_wall"), 2, 2),
                 self.x + self.width, self.y + self.height, self.z,
                 self.x + self.width, self.y, self.z + self.width),
 
-            (repeat_texture(load_image("data", "textures", "wall", "flower_wall.png"), 2, 2),
+            (TiledTexture(self.image("flower_wall"), 2, 2),
                 self.x + self.width, self.y + self.height, self.z + self.width,
                 self.x, self.y, self.z + self.width),
 
-            (repeat_texture(load_image("data", "textures", "wall", "flower_wall.png"), 2, 2),
+            (TiledTexture(self.image("flower_wall"), 2, 2),
                 self.x, self.y + self.height, self.z + self.width,
                 self.x, self.y, self.z),
 
-            (repeat_texture(load_image("data", "textures", "wall", "woodfine.png"), 2, 2),
+            (TiledTexture(self.image("woodfine"), 2, 2),
              self.x-0.1, self.y, self.z-0.1,
              self.x + self.width + 0.1, self.y, self.z + self.width + 0.1,
              self.x-0.1, self.y, self.z + self.width + 0.1),
 
-            (repeat_texture(load_image("data", "textures", "wall", "ceiling.png"), 2, 2),
+            (TiledTexture(self.image("ceiling"), 2, 2),
              self.x - 0.1, self.y + 2, self.z - 0.1,
              self.x + self.width + 0.1, self.y + 1.99, self.z + self.width + 0.1,
              self.x - 0.1, self.y + 1.99, self.z + self.width + 0.1),
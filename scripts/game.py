@@ -10,8 +10,11 @@ from scripts.display import DISPLAY
 from scripts.room import Room, LivingRoom
 from scripts.text import Text
 from scripts.end_screen import END_SCREEN
+from scripts.profiler import PROFILER
+from scripts.resolution import RESOLUTION
+from scripts.foveation import FOVEATION
 
-from nostalgiaefilters import vignette
+from nostalgiaefilters import pipeline
 
 
 class GAME_STATE(Enum):
@@ -24,13 +27,14 @@ class GAME_STATE(Enum):
 class GAME:
 
     STATE: GAME_STATE = GAME_STATE.SPLASH_SCREEN
-    SCREEN_SIZE_MULTIPLIER: float = 0.1
-    SURFACE: Surface = Surface((DISPLAY.width * SCREEN_SIZE_MULTIPLIER, DISPLAY.height * SCREEN_SIZE_MULTIPLIER))
+    SCREEN_SIZE_MULTIPLIER: float = RESOLUTION.scale
+    SURFACE: Surface = RESOLUTION.surface
     # CURRENT_ROOM: Room = TheEnd()  # TODO: set to LivingRoom on release
     CURRENT_ROOM: Room = LivingRoom()
     ESCAPE_PRESSED: bool = False
     TEXT: Text | None = None
     VIGNETTE: float = 0
+    POST_EFFECTS: list[tuple] = []  # effects of the pipeline added by the room for the current frame, before the vignette
     BG_COLOR: tuple[int, int, int] = (0, 0, 0)
 
     @classmethod
@@ -60,10 +64,20 @@ class GAME:
     def run_game(cls):
 
         cls.performance_adjustment()
+        vignette_radius = -cls.SURFACE.get_width()/6
+        # The room casts fewer rays where the vignette will darken the image.
+        # The rooms change the vignette in their update, so the strength is read once and used for the whole frame,
+        # a change only shows in the next frame and never brightens the pixels that got no ray.
+        vignette = cls.VIGNETTE
+        FOVEATION.update(cls.SURFACE.get_width(), vignette_radius, vignette)
         cls.SURFACE.fill(cls.BG_COLOR)
         cls.CURRENT_ROOM.update(cls.SURFACE)
-        vignette(cls.SURFACE, inner_radius=-cls.SURFACE.get_width()/6, strength=cls.VIGNETTE)
-        cls.display_text()
+        with PROFILER.stage("post_effects"):
+            cls.POST_EFFECTS.append(("vignette", vignette_radius, vignette))
+            pipeline(cls.SURFACE, cls.POST_EFFECTS)
+            cls.POST_EFFECTS.clear()
+        with PROFILER.stage("display_text"):
+            cls.display_text()
         # cls.draw_collisions()
         DISPLAY.display(cls.SURFACE)
 
@@ -114,13 +128,7 @@ class GAME:
 
     @classmethod
     def performance_adjustment(cls):
-        if DISPLAY.fps < 35:
-            cls.SCREEN_SIZE_MULTIPLIER *= 0.99
-            cls.SCREEN_SIZE_MULTIPLIER = max(cls.SCREEN_SIZE_MULTIPLIER, 0.1)
-            cls.SURFACE = Surface((DISPLAY.size[0] * cls.SCREEN_SIZE_MULTIPLIER,
-                                   DISPLAY.size[1] * cls.SCREEN_SIZE_MULTIPLIER))
-        elif DISPLAY.fps > 50:
-            cls.SCREEN_SIZE_MULTIPLIER *= 1.005
-            cls.SCREEN_SIZE_MULTIPLIER = min(cls.SCREEN_SIZE_MULTIPLIER, 1.)
-            cls.SURFACE = Surface((DISPLAY.size[0] * cls.SCREEN_SIZE_MULTIPLIER,
-                                   DISPLAY.size[1] * cls.SCREEN_SIZE_MULTIPLIER))
+        """Use the resolution, and the interleaving of the rays, chosen by the RESOLUTION controller
+        from the time of the last frame."""
+        cls.SURFACE = RESOLUTION.update(DISPLAY.frame_time)
+        cls.SCREEN_SIZE_MULTIPLIER = RESOLUTION.scale
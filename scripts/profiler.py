@@ -0,0 +1,147 @@
+from collections import deque
+from contextlib import contextmanager
+from csv import writer
+from functools import wraps
+from time import perf_counter
+from typing import Callable, Generator, TextIO
+
+from pygame import Surface
+from pygame.font import Font
+
+
+class Profiler:
+    """Record the wall time of the stages of every frame.
+
+    The times are kept for the rolling percentiles of the overlay, and written to a CSV file if one is open.
+    Nothing is recorded while both are disabled.
+    """
+    STAGES: tuple[str, ...] = (
+        "load_dynamic_surfaces",  # includes tv_game
+        "tv_game",
+        "raycasting",
+        "post_effects",
+        "display_text",
+        "display",
+        "display_update",
+    )
+    VALUES: tuple[str, ...] = (
+        "resolution",
+        "interleave",
+        "present",
+    )
+    WINDOW: int = 120  # frames used for the percentiles
+    OVERLAY_REFRESH: int = 10  # frames between two renders of the overlay text
+
+    def __init__(self) -> None:
+        self.overlay: bool = False
+        self._frame_index: int = 0
+        self._frame_start: float = perf_counter()
+        self._stages: dict[str, float] = {}
+        self._values: dict[str, str] = {}
+        self._history: dict[str, deque[float]] = {name: deque(maxlen=self.WINDOW) for name in ("frame",) + self.STAGES}
+        self._csv_file: TextIO | None = None
+        self._csv_writer = None
+        self._font: Font | None = None
+        self._overlay_surface: Surface | None = None
+
+    @property
+    def enabled(self) -> bool:
+        """Return True if the stages are recorded."""
+        return self.overlay or self._csv_file is not None
+
+    @contextmanager
+    def stage(self, name: str) -> Generator:
+        """Add the time spent in the with block to the stage of the current frame."""
+        if not self.enabled:
+            yield
+            return
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self._stages[name] = self._stages.get(name, 0.) + (perf_counter() - start) * 1000
+
+    def profile(self, name: str) -> Callable:
+        """Decorator adding the time spent in the function to a stage."""
+        def decorator(function: Callable) -> Callable:
+            @wraps(function)
+            def wrapper(*args, **kwargs):
+                with self.stage(name):
+                    return function(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def set_value(self, name: str, value: str) -> None:
+        """Set a value describing the current frame, like its resolution."""
+        self._values[name] = value
+
+    def end_frame(self) -> None:
+        """Store the times of the frame, and start a new one."""
+        now = perf_counter()
+        if self.enabled:
+            frame_time = (now - self._frame_start) * 1000
+            self._history["frame"].append(frame_time)
+            for name in self.STAGES:
+                self._history[name].append(self._stages.get(name, 0.))
+            if self._csv_writer is not None:
+                self._csv_writer.writerow(
+                    [self._frame_index, f"{frame_time:.3f}"]
+                    + [f"{self._stages.get(name, 0.):.3f}" for name in self.STAGES]
+                    + [self._values.get(name, "") for name in self.VALUES])
+        self._stages.clear()
+        self._frame_index += 1
+        self._frame_start = now
+
+    def percentiles(self, name: str, *percents: float) -> list[float]:
+        """Return the percentiles of the last frames for a stage, in milliseconds."""
+        values = sorted(self._history[name])
+        if not values:
+            return [0.] * len(percents)
+        return [values[min(int(percent / 100 * len(values)), len(values) - 1)] for percent in percents]
+
+    def open_csv(self, path: str) -> None:
+        """Write a row with the stages of every frame to a CSV file."""
+        self.close_csv()
+        self._csv_file = open(path, "w", newline="")
+        self._csv_writer = writer(self._csv_file)
+        self._csv_writer.writerow(["frame", "frame_ms"] + [f"{name}_ms" for name in self.STAGES] + list(self.VALUES))
+
+    def close_csv(self) -> None:
+        if self._csv_file is None:
+            return
+        self._csv_file.close()
+        self._csv_file = None
+        self._csv_writer = None
+
+    def toggle_overlay(self) -> None:
+        self.overlay = not self.overlay
+        self._overlay_surface = None
+
+    def draw_overlay(self, surface: Surface) -> None:
+        """Draw the percentiles of every stage in the top left corner of the surface."""
+        if not self.overlay:
+            return
+        if self._overlay_surface is None or self._frame_index % self.OVERLAY_REFRESH == 0:
+            self._overlay_surface = self._render_overlay()
+        surface.blit(self._overlay_surface, (0, 0))
+
+    def _render_overlay(self) -> Surface:
+        if self._font is None:
+            self._font = Font(None, 20)
+        rows = [("ms", "p50", "p95", "p99")]
+        for name in ("frame",) + self.STAGES:
+            rows.append((name, *(f"{value:.2f}" for value in self.percentiles(name, 50, 95, 99))))
+        for name in self.VALUES:
+            rows.append((name, self._values.get(name, "")))
+
+        line_height = self._font.get_linesize()
+        overlay = Surface((350, line_height * len(rows) + 8)).convert_alpha()
+        overlay.fill((0, 0, 0, 160))
+        # The default font is not monospaced, so every column is drawn at its own position.
+        for i, row in enumerate(rows):
+            for x, text in zip((4, 190, 245, 300), row):
+                overlay.blit(self._font.render(text, True, (255, 255, 255)), (x, 4 + i * line_height))
+        return overlay
+
+
+PROFILER: Profiler = Profiler()
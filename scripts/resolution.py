@@ -0,0 +1,114 @@
+from pygame import Surface
+
+from scripts.display import DISPLAY
+from scripts.profiler import PROFILER
+
+
+class ResolutionController:
+    """Choose the resolution of the game surface to render the frames within a time budget.
+
+    The resolutions are the size of the screen divided by an integer, and their surfaces are allocated once,
+    so changing the resolution doesn't allocate anything and the caches of the ray caster stay valid.
+    The frame time is smoothed, and the resolution only changes after it stayed out of the budget for a while.
+    Every resolution can also be interleaved: the ray caster renders half of the pixels each frame and rebuilds
+    the others from the previous frame, so the game keeps a sharper image before using a lower resolution.
+    The levels are every resolution, interleaved or not, from the cheapest.
+    """
+    DIVISORS: tuple[int, ...] = (10, 8, 6, 5, 4, 3, 2, 1)  # from the lowest to the highest resolution
+    FRAME_BUDGET: float = 1000 / 40  # milliseconds of work per frame
+    SMOOTHING: float = 0.1  # weight of the last frame in the smoothed frame time
+    LOWER_AFTER: int = 10  # frames over the budget before using a lower resolution
+    RAISE_AFTER: int = 60  # frames with enough margin before using a higher resolution
+    RAISE_MARGIN: float = 0.8  # the estimated time at the higher resolution must fit in this part of the budget
+    INTERLEAVE: int = 1  # interleave argument of RayCaster.raycasting: 1 for a checkerboard, 2 for lines
+    INTERLEAVE_COST: float = 0.6  # time of an interleaved frame relative to a full one
+
+    def __init__(self, width: int, height: int) -> None:
+        # the divisors of the screen size can be displayed with an integer upscale, see Display.display
+        exact = tuple(divisor for divisor in self.DIVISORS if width % divisor == 0 and height % divisor == 0)
+        self.divisors: tuple[int, ...] = exact if len(exact) >= 4 else self.DIVISORS
+        self.surfaces: list[Surface] = [Surface((width // divisor, height // divisor)) for divisor in self.divisors]
+        # index of the surface, and whether it is interleaved
+        self.levels: list[tuple[int, bool]] = sorted(
+            ((bucket, interleaved) for bucket in range(len(self.surfaces)) for interleaved in (True, False)),
+            key=self._cost)
+        self.level: int = 0
+        self.frame_time: float = 0.
+        self._over: int = 0
+        self._under: int = 0
+        self.changes: int = 0
+
+    @property
+    def bucket(self) -> int:
+        """Return the index of the surface of the current resolution."""
+        return self.levels[self.level][0]
+
+    @property
+    def interleave(self) -> int:
+        """Return the interleave argument of the ray caster for the current level, 0 to render every pixel."""
+        return self.INTERLEAVE if self.levels[self.level][1] else 0
+
+    @property
+    def surface(self) -> Surface:
+        """Return the surface of the current resolution."""
+        return self.surfaces[self.bucket]
+
+    @property
+    def scale(self) -> float:
+        """Return the size of the current resolution relative to the screen."""
+        return 1 / self.divisors[self.bucket]
+
+    def _cost(self, level: tuple[int, bool]) -> float:
+        # most of the time of a frame is spent per pixel
+        bucket, interleaved = level
+        pixels = self.surfaces[bucket].get_width() * self.surfaces[bucket].get_height()
+        return pixels * self.INTERLEAVE_COST if interleaved else pixels
+
+    def update(self, frame_time: float) -> Surface:
+        """Add the work time of the last frame, in milliseconds, and return the surface of the next frame."""
+        self.frame_time += (frame_time - self.frame_time) * self.SMOOTHING
+
+        if self.frame_time > self.FRAME_BUDGET:
+            self._over += 1
+            self._under = 0
+        elif (self.level + 1 < len(self.levels) and
+              self.frame_time * self._cost(self.levels[self.level + 1]) / self._cost(self.levels[self.level])
+              < self.FRAME_BUDGET * self.RAISE_MARGIN):
+            self._under += 1
+            self._over = 0
+        else:
+            self._over = self._under = 0
+
+        if self._over >= self.LOWER_AFTER and self.level > 0:
+            self._set_level(self.level - 1)
+        elif self._under >= self.RAISE_AFTER:
+            self._set_level(self.level + 1)
+
+        PROFILER.set_value("resolution", "{}x{}".format(*self.surface.get_size()))
+        PROFILER.set_value("interleave", str(self.interleave))
+        return self.surface
+
+    def _set_level(self, level: int) -> None:
+        # the smoothed time is estimated for the new level, to not wait for it to settle
+        self.frame_time *= self._cost(self.levels[level]) / self._cost(self.levels[self.level])
+        self.level = level
+        self._over = self._under = 0
+        self.changes += 1
+
+    def state(self) -> dict[str, int | float | str]:
+        """Return the state of the controller."""
+        return {
+            "level": self.level,
+            "bucket": self.bucket,
+            "resolution": "{}x{}".format(*self.surface.get_size()),
+            "interleave": self.interleave,
+            "scale": self.scale,
+            "frame_time_ms": self.frame_time,
+            "budget_ms": self.FRAME_BUDGET,
+            "frames_over": self._over,
+            "frames_under": self._under,
+            "changes": self.changes,
+        }
+
+
+RESOLUTION: ResolutionController = ResolutionController(DISPLAY.width, DISPLAY.height)
@@ -1,4 +1,6 @@
 from abc import ABC, abstractmethod
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
 from os.path import join as join_path
 from math import sin, cos, radians, pi
 from random import uniform, choice
@@ -6,46 +8,238 @@ from random import uniform, choice
 from pygame import Surface, Rect
 from pygame.mixer import Sound
 from pygame import mouse
+from pygame.pixelcopy import array_to_surface
 
 from scripts.player import PLAYER
 from scripts.furniture import Furniture
-from scripts.display import DISPLAY, load_image
+from scripts.display import DISPLAY, TiledTexture, load_image
 from scripts.text import Text
+from scripts.profiler import PROFILER
+from scripts.foveation import FOVEATION
+from scripts.resolution import RESOLUTION
 
-from nostalgiaeraycasting import RayCaster
-from nostalgiaefilters import distortion
+from nostalgiaeraycasting import RayCaster, SurfaceHandle
 
 
 class Room(ABC):
+    PREFETCH_DISTANCE: float = 0.5  # distance to a door from which the next room is prepared
+    # Cast the rays in the ordered mode of the caster, faster where the opaque surfaces hide the others.
+    # The translucent texels are blended in depth order, so the edges of the sprites can look slightly different.
+    ORDERED: bool = False
 
     def __init__(self):
         self.caster: RayCaster = RayCaster()
         self.items: list[Furniture] = []
         self.collisions: list[Rect] = []
+        self.handles: dict[Furniture, list[SurfaceHandle]] = {}
+        self.texture_bytes: dict[int, int] = {}  # size in bytes of the textures of the static surfaces, by id
+
+    @property
+    def resident_bytes(self) -> int:
+        return sum(self.texture_bytes.values())
+
+    @classmethod
+    def cache_key(cls) -> tuple | None:
+        """Return the key of the room in the RoomCache, None if the room must be built every time."""
+        return None
+
+    def go_to(self, room_class: type["Room"]) -> None:
+        """Leave the room for another one, built or taken from the RoomCache."""
+        from scripts.game import GAME
+        ROOM_CACHE.put(self)
+        GAME.CURRENT_ROOM = ROOM_CACHE.get(room_class)
+
+    @classmethod
+    def furniture(cls) -> tuple[type[Furniture], ...]:
+        """Return the classes of the furniture of the room, their textures are decoded in advance by RoomCache.prefetch."""
+        return ()
+
+    @classmethod
+    def textures(cls) -> list[tuple[str, ...]]:
+        """Return the path of every image of the furniture of the room, once."""
+        return list(dict.fromkeys(path for furniture in cls.furniture() for path in furniture.TEXTURES.values()))
+
+    @staticmethod
+    def prefetch(room_class: type["Room"]) -> None:
+        """Start building a room the player is about to enter, see RoomCache.prefetch."""
+        ROOM_CACHE.prefetch(room_class)
 
     def load_static_surfaces(self, caster):
         for item in self.items:
-            for surface in item.static_surfaces():
-                caster.add_surface(*surface, rm=False)
+            for image, *position in item.static_surfaces():
+                texture, repeat_x, repeat_y = TiledTexture.of(image)
+                caster.add_surface(texture, *position, rm=False, repeat_x=repeat_x, repeat_y=repeat_y)
+                self.texture_bytes[id(texture)] = texture.get_width() * texture.get_height() * texture.get_bytesize()
 
     def load_dynamic_surfaces(self, caster):
+        # The surfaces of each item are kept from a frame to another and only moved,
+        # the extra ones are hidden and the ones of the removed items are deleted.
+        # The caster reuses the pixels of a surface that didn't change, so the animated textures are touched.
+        handles = {}
         for item in self.items:
-            for surface in item.dynamic_surfaces():
-                caster.add_surface(*surface, rm=True)
+            item_handles = self.handles.pop(item, [])
+            surfaces = item.dynamic_surfaces()
+            for i, (image, *position) in enumerate(surfaces):
+                texture, repeat_x, repeat_y = TiledTexture.of(image)
+                if i < len(item_handles):
+                    handle = item_handles[i]
+                    handle.set_texture(texture, repeat_x, repeat_y)
+                    handle.set_position(*position)
+                    handle.show()
+                    if item.animated_textures:
+                        handle.touch()
+                else:
+                    item_handles.append(caster.add_surface(
+                        texture, *position, dynamic=True, repeat_x=repeat_x, repeat_y=repeat_y))
+            for handle in item_handles[len(surfaces):]:
+                handle.hide()
+            if item_handles:
+                handles[item] = item_handles
+
+        for item_handles in self.handles.values():
+            for handle in item_handles:
+                handle.remove()
+        self.handles = handles
+
+    def clear_surfaces(self):
+        self.caster.clear_surfaces()
+        self.handles.clear()
+        self.texture_bytes.clear()
 
     @abstractmethod
     def update(self, surface: Surface):
-        self.load_dynamic_surfaces(self.caster)
-        self.caster.raycasting(
-            surface,
-            PLAYER.x, PLAYER.y + PLAYER.height, PLAYER.z,
-            PLAYER.rot_x, PLAYER.rot_y,
-            PLAYER.FOV,
-            PLAYER.VIEW_DISTANCE,
-        )
+        with PROFILER.stage("load_dynamic_surfaces"):
+            self.load_dynamic_surfaces(self.caster)
+        with PROFILER.stage("raycasting"):
+            self.caster.raycasting(
+                surface,
+                PLAYER.x, PLAYER.y + PLAYER.height, PLAYER.z,
+                PLAYER.rot_x, PLAYER.rot_y,
+                PLAYER.FOV,
+                PLAYER.VIEW_DISTANCE,
+                ordered=self.ORDERED,
+                rate_map=FOVEATION.rate_map,
+                interleave=RESOLUTION.interleave,
+                reuse=True,
+            )
+
+
+class RoomCache:
+    """Keep the rooms the player left, with their caster and their static surfaces.
+
+    Going back to a room takes it from the cache instead of loading its textures and surfaces again.
+    A room is stored under the key returned by its cache_key, so a room that changes with the story is built again.
+    When the rooms use more than the budget, the least recently left ones are cleared.
+    The textures of the next rooms can be decoded in advance on a worker thread, so entering them only builds the room.
+    """
+    BUDGET: int = 48 * 1024 * 1024  # bytes
+
+    def __init__(self, budget: int = BUDGET) -> None:
+        self.budget: int = budget
+        self._rooms: OrderedDict[tuple, Room] = OrderedDict()
+        self._pending: dict[tuple, Future] = {}
+        self._executor: ThreadPoolExecutor | None = None
+        self._hits: int = 0
+        self._misses: int = 0
+        self._prefetched: int = 0
+
+    @property
+    def resident_bytes(self) -> int:
+        # the textures are shared by the rooms through the texture cache, each one is counted once
+        textures: dict[int, int] = {}
+        for room in self._rooms.values():
+            textures.update(room.texture_bytes)
+        return sum(textures.values())
+
+    @staticmethod
+    def _load_textures(paths: list[tuple[str, ...]]) -> list[Surface]:
+        # the surfaces are kept by the future, so the texture cache doesn't drop them before the room is built
+        return [load_image(*path) for path in paths]
+
+    def prefetch(self, room_class: type[Room]) -> None:
+        """Decode the textures of the room on a worker thread, if it is neither cached nor being prefetched.
+
+        Only the images of its furniture are loaded, see Room.textures, through the texture cache which is locked.
+        The room itself is built on the main thread when the player enters it,
+        because the furniture may create sounds or read the state of the player.
+        """
+        key = room_class.cache_key()
+        if key is None or key in self._rooms or key in self._pending:
+            return
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="room_prefetch")
+        self._pending[key] = self._executor.submit(self._load_textures, room_class.textures())
+
+    def get(self, room_class: type[Room]) -> Room:
+        """Return the cached room of the class, or build a new one.
+
+        The textures of a room being prefetched are waited for, which is still shorter than loading them from the start.
+        The prefetches of the other rooms are dropped, so the texture cache can evict their images again.
+        """
+        key = room_class.cache_key()
+        future: Future | None = self._pending.pop(key, None) if key is not None else None
+        self._drop_pending()
+        room: Room | None = self._rooms.pop(key, None) if key is not None else None
+        if room is not None:
+            self._hits += 1
+            return room
+        if future is not None:
+            self._prefetched += 1
+            future.exception()  # a texture that failed to load is loaded again by the room, which raises the error
+            return room_class()
+        self._misses += 1
+        return room_class()
+
+    def put(self, room: Room) -> None:
+        """Keep a room the player is leaving."""
+        key = room.cache_key()
+        if key is None:
+            room.clear_surfaces()
+            return
+        old_room = self._rooms.pop(key, None)
+        if old_room is not None and old_room is not room:
+            old_room.clear_surfaces()
+        self._rooms[key] = room
+        self.trim()
+
+    def trim(self) -> None:
+        """Clear the least recently left rooms until the cache fits in the budget, the last room is always kept."""
+        while len(self._rooms) > 1 and self.resident_bytes > self.budget:
+            _, old_room = self._rooms.popitem(last=False)
+            old_room.clear_surfaces()
+
+    def _drop_pending(self) -> None:
+        for future in self._pending.values():
+            future.cancel()  # a running one only loads images, it isn't waited for
+        self._pending.clear()
+
+    def clear(self) -> None:
+        """Forget every room, once the player can't go back to them."""
+        self._drop_pending()
+        for room in self._rooms.values():
+            room.clear_surfaces()
+        self._rooms.clear()
+
+    def stats(self) -> dict[str, int | float]:
+        lookups = self._hits + self._prefetched + self._misses
+        return {
+            "rooms": len(self._rooms),
+            "pending": len(self._pending),
+            "resident_bytes": self.resident_bytes,
+            "budget": self.budget,
+            "hits": self._hits,
+            "prefetched": self._prefetched,
+            "misses": self._misses,
+            "hit_rate": (self._hits + self._prefetched) / lookups if lookups else 0.,
+        }
+
+
+ROOM_CACHE: RoomCache = RoomCache()
 
 
 class LivingRoom(Room):
+    ORDERED = True  # 41 -> 14 ms at 384x216
+
     def __init__(self):
         from scripts.furniture import TV, Couch, Drawer, LivingRoomWalls, Plant, Door, Window, Stairs, CorridorWalls, Frame
         super().__init__()
@@ -79,6 +273,16 @@ class LivingRoom(Room):
             Rect(-80, -230, 150, 80),  # COUCH
         ]
 
+    @classmethod
+    def furniture(cls) -> tuple[type[Furniture], ...]:
+        from scripts.furniture import TV, Couch, Drawer, LivingRoomWalls, Plant, Door, Window, Stairs, CorridorWalls, Frame
+        return TV, Couch, Drawer, LivingRoomWalls, Plant, Door, Window, Stairs, CorridorWalls, Frame
+
+    @classmethod
+    def cache_key(cls) -> tuple | None:
+        # the furniture is only added once the player can move
+        return cls, PLAYER.movements
+
     def update(self, surface: Surface):
         from scripts.furniture import Couch, Drawer, LivingRoomWalls, Plant, Door, Window, Stairs, CorridorWalls, Frame
         super().update(surface)
@@ -99,13 +303,15 @@ class LivingRoom(Room):
             self.items.append(Frame(x=-1.99, y=1.7, z=-2))
             self.load_static_surfaces(self.caster)
 
+        if PLAYER.movements and PLAYER.z >= 2.5 - self.PREFETCH_DISTANCE:
+            self.prefetch(Corridor)
         if PLAYER.z >= 2.5:
-            from scripts.game import GAME
-            self.caster.clear_surfaces()
-            GAME.CURRENT_ROOM = Corridor()
+            self.go_to(Corridor)
 
 
 class Corridor(Room):
+    ORDERED = True  # 26 -> 14 ms at 384x216
+
     def __init__(self):
         from scripts.furniture import LivingRoomWalls, Door, Stairs, CorridorWalls, BedRoomWalls, ClosetClosed
         super().__init__()
@@ -131,20 +337,32 @@ class Corridor(Room):
 
         self.load_static_surfaces(self.caster)
 
+    @classmethod
+    def furniture(cls) -> tuple[type[Furniture], ...]:
+        from scripts.furniture import LivingRoomWalls, Door, Stairs, CorridorWalls, BedRoomWalls, ClosetClosed
+        return LivingRoomWalls, Door, Stairs, CorridorWalls, BedRoomWalls, ClosetClosed
+
+    @classmethod
+    def cache_key(cls) -> tuple | None:
+        return cls,
+
     def update(self, surface: Surface):
         super().update(surface)
 
-        if PLAYER.z < 2.5:
-            from scripts.game import GAME
-            self.caster.clear_surfaces()
-            GAME.CURRENT_ROOM = LivingRoom()
+        if PLAYER.x < 1. + self.PREFETCH_DISTANCE:
+            self.prefetch(BedRoom)
+        if PLAYER.z < 2.5 + self.PREFETCH_DISTANCE:
+            self.prefetch(LivingRoom)
+
         if PLAYER.x < 1.:
-            from scripts.game import GAME
-            self.caster.clear_surfaces()
-            GAME.CURRENT_ROOM = BedRoom()
+            self.go_to(BedRoom)
+        elif PLAYER.z < 2.5:
+            self.go_to(LivingRoom)
 
 
 class BedRoom(Room):
+    ORDERED = True  # 27 -> 15 ms at 384x216
+
     def __init__(self):
         from scripts.furniture import Door, Stairs, CorridorWalls, BedRoomWalls, ClosetClosed, Bed, Drawer
         super().__init__()
@@ -174,12 +392,21 @@ class BedRoom(Room):
 
         self.load_static_surfaces(self.caster)
 
+    @classmethod
+    def furniture(cls) -> tuple[type[Furniture], ...]:
+        from scripts.furniture import Door, Stairs, CorridorWalls, BedRoomWalls, ClosetClosed, Bed, Drawer
+        return Door, Stairs, CorridorWalls, BedRoomWalls, ClosetClosed, Bed, Drawer
+
+    @classmethod
+    def cache_key(cls) -> tuple | None:
+        return cls,
+
     def update(self, surface: Surface):
         super().update(surface)
+        if PLAYER.x >= 1. - self.PREFETCH_DISTANCE:
+            self.prefetch(Corridor)
         if PLAYER.x >= 1.:
-            from scripts.game import GAME
-            self.caster.clear_surfaces()
-            GAME.CURRENT_ROOM = Corridor()
+            self.go_to(Corridor)
         if PLAYER.z > 5.0:
             from scripts.game import GAME
             PLAYER.movements = False
@@ -189,11 +416,14 @@ class BedRoom(Room):
             PLAYER.rot_y = 220
             PLAYER.rot_x = 5.
             Sound(join_path("data", "sounds", "door.mp3")).play()
-            self.caster.clear_surfaces()
+            self.clear_surfaces()
+            ROOM_CACHE.clear()  # the house is never visited again
             GAME.CURRENT_ROOM = BedRoomNightmare()
 
 
 class BedRoomNightmare(Room):
+    ORDERED = True  # 30 -> 19 ms at 384x216
+
     def __init__(self):
         from scripts.furniture import Door, CorridorWalls, BedRoomWalls, ClosetClosed, Bed
         super().__init__()
@@ -226,10 +456,7 @@ class BedRoomNightmare(Room):
         from scripts.furniture import Door, CorridorWalls, BedRoomWalls, ClosetOpened, Bed, Eyes
         self._anim += DISPLAY.delta_time
         if self._anim >= 205:
-            temp = Surface(GAME.SURFACE.get_size())
-            distortion(GAME.SURFACE, temp, True, True, GAME.SURFACE.get_width() / 200, 0.1, 0.01)
-            temp.set_alpha(30)
-            GAME.SURFACE.blit(temp, (0, 0))
+            GAME.POST_EFFECTS.append(("distortion", 30, True, True, GAME.SURFACE.get_width() / 200, 0.1, 0.01))
 
         if self._anim > 400:
             if GAME.VIGNETTE < 7.5:
@@ -261,7 +488,7 @@ class BedRoomNightmare(Room):
                 if GAME.VIGNETTE > 7.5:
                     self._anim = 300
                     self.items.append(Eyes(x=-1.65, y=3., z=4.7))
-                    self.caster.clear_surfaces()
+                    self.clear_surfaces()
                     self.load_static_surfaces(self.caster)
                     Sound(join_path("data", "sounds", "breath.wav")).play()
         elif self._anim >= 100:
@@ -284,12 +511,14 @@ class BedRoomNightmare(Room):
                 self.items.append(BedRoomWalls())
                 self.items.append(Bed(x=-1.5, y=2, z=6.))
                 self.items.append(ClosetOpened(x=-1.4, y=2, z=4.4))
-                self.caster.clear_surfaces()
+                self.clear_surfaces()
                 self.load_static_surfaces(self.caster)
                 self._anim = 100
 
 
 class LongCorridor(Room):
+    ORDERED = True  # 32 -> 14 ms at 384x216
+
     def __init__(self):
         from scripts.furniture import LongCorridorWalls, Door, FloatingEye
         super().__init__()
@@ -313,22 +542,44 @@ class LongCorridor(Room):
 
         self.load_static_surfaces(self.caster)
         self.rec_surf: Surface = Surface((150, 150))
+        # The end of the corridor is drawn by its own caster, so the one of the screen keeps its rays and its pixels.
+        # It only has the static surfaces, the items are not seen at the end of the corridor.
+        self.rec_caster: RayCaster = RayCaster()
+        self.load_static_surfaces(self.rec_caster)
+        # The view is shown on the screen through a single surface, whose image is only updated when the view changed.
+        # The caster keeps the surface locked, so the pixels are copied instead of blitted.
+        self.rec_texture: Surface = self.rec_surf.convert_alpha()
+        self.rec_handle: SurfaceHandle | None = None
         self.monster: bool = False
 
+    def clear_surfaces(self):
+        super().clear_surfaces()
+        self.rec_caster.clear_surfaces()
+        self.rec_handle = None
+
     def update(self, surface: Surface):
         from scripts.game import GAME
         z = 35.5
         # self.caster.add_surface(self.rec_surf.copy(), -0.49, 2.0, z, -0.49, 0, z + 1.0, rm=True)
         self.rec_surf.fill((0, 0, 0))
-        self.caster.raycasting(
-            self.rec_surf,
-            PLAYER.x, PLAYER.height, 0,
-            0, 90,
-            PLAYER.FOV, PLAYER.VIEW_DISTANCE,
-        )
-        self.caster.add_surface(
-            self.rec_surf.copy().convert_alpha(), -1.30 + PLAYER.x, 3.1, z, 1.30 + PLAYER.x, -0.1, z, rm=True
-                                                  )
+        with PROFILER.stage("raycasting"):
+            self.rec_caster.raycasting(
+                self.rec_surf,
+                PLAYER.x, PLAYER.height, 0,
+                0, 90,
+                PLAYER.FOV, PLAYER.VIEW_DISTANCE,
+                ordered=self.ORDERED,
+                reuse=True,
+            )
+        position = (-1.30 + PLAYER.x, 3.1, z, 1.30 + PLAYER.x, -0.1, z)
+        if self.rec_handle is None:
+            array_to_surface(self.rec_texture, self.rec_surf.get_view("3"))
+            self.rec_handle = self.caster.add_surface(self.rec_texture, *position, dynamic=True)
+        else:
+            if self.rec_caster.dirty_rects():
+                array_to_surface(self.rec_texture, self.rec_surf.get_view("3"))
+                self.rec_handle.touch()
+            self.rec_handle.set_position(*position)
 
         super().update(surface)
         if not self.monster:
@@ -344,7 +595,7 @@ class LongCorridor(Room):
                 PLAYER.x = PLAYER.y = PLAYER.z = PLAYER.rot_x = 0
                 PLAYER.rot_y = 90
                 mouse.get_rel()
-                self.caster.clear_surfaces()
+                self.clear_surfaces()
                 GAME.CURRENT_ROOM = InfiniteRoom()
                 GAME.TEXT = Text("You can't trust what you see in the dark.")
         else:
@@ -435,38 +686,28 @@ class TheEnd(Room):
         super().update(surface)
 
         if len(self.game.entities) > 1:
-            temp1 = Surface(GAME.SURFACE.get_size())
-            temp2 = Surface(GAME.SURFACE.get_size())
-            temp3 = Surface(GAME.SURFACE.get_size())
-            distortion(
-                GAME.SURFACE, temp1, True, True,
-                (20 - self.game.entities[1].life) * GAME.SURFACE.get_width() / 1500, 0.05, 0.01)
-            temp1.set_alpha(50 - self.game.entities[1].life)
-            distortion(
-                GAME.SURFACE, temp2, True, True,
-                (20 - self.game.entities[1].life) * GAME.SURFACE.get_width() / 1000, 0.01, 0.01)
-            temp2.set_alpha(20 - self.game.entities[1].life)
-            distortion(
-                GAME.SURFACE, temp3, True, True,
-                (20 - self.game.entities[1].life) * GAME.SURFACE.get_width() / 500, 0.005, 0.005)
-            temp3.set_alpha((20 - self.game.entities[1].life) // 2)
-
-            GAME.SURFACE.blit(temp1, (0, 0))
-            GAME.SURFACE.blit(temp2, (0, 0))
-            GAME.SURFACE.blit(temp3, (0, 0))
+            # distorted copies of the frame blended over it, applied with the vignette
+            life = self.game.entities[1].life
+            width = GAME.SURFACE.get_width()
+            GAME.POST_EFFECTS.append(("distortion", 50 - life, True, True, (20 - life) * width / 1500, 0.05, 0.01))
+            GAME.POST_EFFECTS.append(("distortion", 20 - life, True, True, (20 - life) * width / 1000, 0.01, 0.01))
+            GAME.POST_EFFECTS.append(("distortion", (20 - life) // 2, True, True, (20 - life) * width / 500, 0.005, 0.005))
 
             if self.game.entities[1].damage_anim > 0.:
-                temp4 = Surface(GAME.SURFACE.get_size())
-                distortion(
-                    GAME.SURFACE, temp4, True, True,
-                    (20 - self.game.entities[1].life) * GAME.SURFACE.get_width() / 250, 100, 1
-                )
-                temp4.set_alpha(512 * self.game.entities[1].damage_anim)
-                GAME.SURFACE.blit(temp4, (0, 0))
+                GAME.POST_EFFECTS.append((
+                    "distortion", 512 * self.game.entities[1].damage_anim, True, True, (20 - life) * width / 250, 100, 1))
                 GAME.VIGNETTE += DISPLAY.delta_time * 0.1
 
 
 class InfiniteRoom(Room):
+    ORDERED = True  # 21 -> 12 ms at 384x216
+    # corners of the doors shown between the rooms
+    DOORS: tuple[tuple[float, ...], ...] = (
+        (-0.2, 1.8, -0.49, 0.2, 0, -0.49),
+        (-0.49, 1.8, 0.9, -0.49, 0, 1.3),
+        (-0.49, 1.8, -0.2, -0.49, 0, 0.2),
+    )
+
     def __init__(self):
         from scripts.furniture import InfiniteRoomWalls, FloatingEye
         super().__init__()
@@ -486,6 +727,7 @@ class InfiniteRoom(Room):
 
         self.room_number = 0
         self.door_texture = load_image(join_path("data", "textures", "furniture", "door.png"))
+        self.doors: list[SurfaceHandle] = []
 
         self.default_collisions = [
             Rect(-50, -50, 200, 10),
@@ -497,6 +739,17 @@ class InfiniteRoom(Room):
         self.collisions = self.default_collisions + [Rect(50, -50, 10, 150)]
         self.load_static_surfaces(self.caster)
 
+    def load_static_surfaces(self, caster):
+        super().load_static_surfaces(caster)
+        # The doors stay in the caster and are shown in the rooms that have them, from the next frame.
+        self.doors = [caster.add_surface(self.door_texture, *position) for position in self.DOORS]
+        for door in self.doors:
+            door.hide()
+
+    def clear_surfaces(self):
+        super().clear_surfaces()
+        self.doors = []
+
     def update(self, surface: Surface):
         from scripts.furniture import Plant
         from scripts.game import GAME
@@ -509,27 +762,28 @@ class InfiniteRoom(Room):
             else:
                 GAME.VIGNETTE = 1.5
 
+        shown_doors: set[int] = set()
         match self.room_number:
             case 0:
-                self.caster.add_surface(self.door_texture, -0.2, 1.8, -0.49, 0.2, 0, -0.49, rm=True)
+                shown_doors.add(0)
                 if PLAYER.x > 0.5:
                     self.room_number = 1
                     self.collisions = self.default_collisions + [Rect(50, 0, 10, 100)]
             case 1:
                 if PLAYER.z > 1.:
                     if PLAYER.x < 1.0:
-                        self.caster.add_surface(self.door_texture, -0.2, 1.8, -0.49, 0.2, 0, -0.49, rm=True)
+                        shown_doors.add(0)
                     if PLAYER.x < 0.5:
                         self.room_number = 0
                         self.collisions = self.default_collisions + [Rect(50, -50, 10, 150)]
                 else:
                     if PLAYER.z < 0.5:
-                        self.caster.add_surface(self.door_texture, -0.49, 1.8, 0.9, -0.49, 0, 1.3, rm=True)
+                        shown_doors.add(1)
                     if PLAYER.x < 0.5:
                         self.room_number = 2
 
             case 2:
-                self.caster.add_surface(self.door_texture, -0.49, 1.8, 0.9, -0.49, 0, 1.3, rm=True)
+                shown_doors.add(1)
                 if PLAYER.z < 1.:
                     if PLAYER.x > 0.5:
                         self.room_number = 1
@@ -537,16 +791,16 @@ class InfiniteRoom(Room):
                     self.room_number = 3
                     self.collisions = self.default_collisions + [Rect(50, 0, 10, 100), Rect(50, 50, 50, 10)]
                     self.items.append(Plant(x=0.75, z=0.75))
-                    self.caster.clear_surfaces()
+                    self.clear_surfaces()
                     self.load_static_surfaces(self.caster)
 
             case 3:
-                self.caster.add_surface(self.door_texture, -0.49, 1.8, 0.9, -0.49, 0, 1.3, rm=True)
+                shown_doors.add(1)
                 if PLAYER.z < 1.:
                     if PLAYER.x < 0.5:
                         self.room_number = 2
                         self.items = self.items[:-1]
-                        self.caster.clear_surfaces()
+                        self.clear_surfaces()
                         self.load_static_surfaces(self.caster)
                         self.collisions = self.default_collisions + [Rect(50, 0, 10, 100)]
                 else:
@@ -554,7 +808,7 @@ class InfiniteRoom(Room):
                         self.room_number = 4
 
             case 4:
-                self.caster.add_surface(self.door_texture, -0.49, 1.8, 0.9, -0.49, 0, 1.3, rm=True)
+                shown_doors.add(1)
                 if PLAYER.z > 1.:
                     if PLAYER.x < 0.5:
                         self.room_number = 3
@@ -564,8 +818,8 @@ class InfiniteRoom(Room):
                         self.collisions = self.default_collisions + [Rect(50, 50, 10, 50), Rect(0, 50, 100, 10)]
 
             case 5:
-                self.caster.add_surface(self.door_texture, -0.49, 1.8, 0.9, -0.49, 0, 1.3, rm=True)
-                self.caster.add_surface(self.door_texture, -0.49, 1.8, -0.2, -0.49, 0, 0.2, rm=True)
+                shown_doors.add(1)
+                shown_doors.add(2)
                 if PLAYER.z > 1.0:
                     if PLAYER.x > 0.5:
                         self.room_number = 4
@@ -576,13 +830,19 @@ class InfiniteRoom(Room):
                         self.collisions = self.default_collisions
 
             case 6:
-                self.caster.add_surface(self.door_texture, -0.49, 1.8, 0.9, -0.49, 0, 1.3, rm=True)
-                self.caster.add_surface(self.door_texture, -0.49, 1.8, -0.2, -0.49, 0, 0.2, rm=True)
+                shown_doors.add(1)
+                shown_doors.add(2)
                 GAME.VIGNETTE += DISPLAY.delta_time
                 if GAME.VIGNETTE > 7.0:
                     GAME.TEXT = Text("Reality is not what it seems.")
-                    self.caster.clear_surfaces()
+                    self.clear_surfaces()
                     GAME.CURRENT_ROOM = TheEnd()  # TODO: add more rooms
                     mouse.get_rel()
                     PLAYER.x = PLAYER.z = PLAYER.rot_x = 0
                     PLAYER.rot_y = 90
+
+        for i, door in enumerate(self.doors):
+            if i in shown_doors:
+                door.show()
+            else:
+                door.hide()
@@ -9,6 +9,7 @@ from pygame import mixer
 
 from scripts.display import DISPLAY, load_image
 from scripts.player import PLAYER
+from scripts.profiler import PROFILER
 
 from nostalgiaefilters import fish
 
@@ -33,6 +34,7 @@ class TvGame:
         self.nightmare = nightmare
         self._anim = 0
 
+    @PROFILER.profile("tv_game")
     def update(self) -> bool:
 
         self.move()
@@ -418,7 +420,7 @@ class Knight(Entity):
         self.walk = load_image("data", "mini_game", "Character", "Main-walk.png")
         self.pre_attack = load_image("data", "mini_game", "Character", "Main-cut.png")
         self.attack_surf = load_image("data", "mini_game", "Character", "Main-cutted.png")
-        self.hurt = load_image("data", "mini_game", "Character", "Main-Hit.png")
+        self.hurt = load_image("data", "mini_game", "Character", "Main-hit.png")
         self.state: Knight.STATE = Knight.STATE.WAIT
         self._anim: float = 0.
         self._jump: float = 0.
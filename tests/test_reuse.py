@@ -0,0 +1,121 @@
+"""Frames of the ray caster that reuse the pixels of the frame before, checked against frames cast in full.
+
+The same scene is given to two casters, one casting with reuse=True and the other without it.
+Along the frames the camera stands still, turns and moves, and dynamic surfaces are moved, hidden, shown and drawn on.
+Every frame of the first caster must be the frame of the second one.
+Interleaved frames cast half of the pixels and take the other half from the frame before,
+so after a frame with the same camera they must be the full frame as well.
+"""
+from math import sin
+from os import environ
+from os.path import join as join_path, dirname
+
+import pytest
+
+environ.setdefault("SDL_VIDEODRIVER", "dummy")
+pygame = pytest.importorskip("pygame")
+nostalgiaeraycasting = pytest.importorskip("nostalgiaeraycasting")
+
+WALLS: str = join_path(dirname(dirname(__file__)), "data", "textures", "wall")
+SIZE: tuple[int, int] = (96, 72)
+FOV: float = 90.
+VIEW_DISTANCE: float = 10.
+FRAMES: int = 240
+
+# A, B and C of each static surface
+STATIC_SURFACES: tuple[tuple[str, tuple[tuple[float, float, float], ...]], ...] = (
+    ("flower_wall.png", ((4., 2., -3.), (4., -1., 3.))),
+    ("flower_wall.png", ((0., 2., 3.), (4., -1., 3.))),
+    ("flower_wall.png", ((4., 2., -3.), (0., -1., -3.))),
+    ("flower_wall.png", ((0.5, -1., -3.), (4., -1., 3.), (4., -1., -3.))),
+)
+
+
+def load_texture(name: str):
+    image = pygame.image.load(join_path(WALLS, name))
+    texture = pygame.Surface(image.get_size(), pygame.SRCALPHA, 32)
+    texture.blit(image, (0, 0))
+    return texture
+
+
+def draw_texture(texture, frame: int) -> None:
+    """Draw a pattern that changes with the frame on the texture."""
+    texture.fill((40 + frame % 200, 200 - frame % 150, 90, 255))
+    texture.fill((250, 250, 250, 255), (frame % 12, 0, 4, 16))
+
+
+class Scene:
+    """The static surfaces and three dynamic surfaces on a caster: a moving one, a blinking one and a drawn one."""
+
+    def __init__(self, texture, drawn_texture):
+        self.caster = nostalgiaeraycasting.RayCaster()
+        for name, corners in STATIC_SURFACES:
+            self.caster.add_surface(load_texture(name), *(value for corner in corners for value in corner))
+        self.moving = self.caster.add_surface(texture, 2., 0.5, -1., 2., -0.5, 0., dynamic=True)
+        self.blinking = self.caster.add_surface(texture, 3., 1., 0.5, 3., 0., 1.5, dynamic=True)
+        self.drawn = self.caster.add_surface(drawn_texture, 2.5, 0., -2., 2.5, -1., -1., dynamic=True)
+        self.screen = pygame.Surface(SIZE, 0, 32)
+
+    def cast(self, camera: tuple[float, ...], **kwargs) -> bytes:
+        # the pixels no ray hits keep their color, the display clears the screen before every frame too
+        self.screen.fill((0, 0, 0))
+        self.caster.raycasting(self.screen, *camera, FOV, VIEW_DISTANCE, threads=1, **kwargs)
+        return pygame.image.tobytes(self.screen, "RGB")
+
+
+def camera_at(frame: int) -> tuple[float, ...]:
+    """Position and angles of the camera, it stands still most of the time."""
+    if 80 <= frame < 100:  # turns
+        return 0., 0., 0., 0., (frame - 80) * 0.01
+    if 150 <= frame < 160:  # walks
+        return (frame - 150) * 0.05, 0., 0., 0., 0.2
+    if frame >= 100:
+        return (0.5 if frame >= 160 else 0.), 0., 0., 0., 0.2
+    return 0., 0., 0., 0., 0.
+
+
+def update_handles(scenes: tuple[Scene, ...], drawn_texture, frame: int) -> None:
+    if frame % 40 < 10:  # the moving surface moves for a few frames, then stops
+        offset = sin(frame * 0.3) * 0.5
+        for scene in scenes:
+            scene.moving.set_position(2., 0.5, -1. + offset, 2., -0.5, offset)
+    if frame % 30 == 10:
+        for scene in scenes:
+            scene.blinking.hide()
+    elif frame % 30 == 20:
+        for scene in scenes:
+            scene.blinking.show()
+    if frame % 25 == 5:
+        draw_texture(drawn_texture, frame)
+        for scene in scenes:
+            scene.drawn.touch()
+
+
+@pytest.mark.parametrize("ordered", [False, True])
+def test_reuse_matches_full_cast(ordered: bool):
+    texture = load_texture("flower_wall.png")
+    drawn_texture = pygame.Surface((16, 16), pygame.SRCALPHA, 32)
+    draw_texture(drawn_texture, 0)
+    reused, full = Scene(texture, drawn_texture), Scene(texture, drawn_texture)
+
+    reused_frames = 0
+    for frame in range(FRAMES):
+        update_handles((reused, full), drawn_texture, frame)
+        camera = camera_at(frame)
+        assert reused.cast(camera, ordered=ordered, reuse=True) == full.cast(camera, ordered=ordered), frame
+        if sum(width * height for _, _, width, height in reused.caster.dirty_rects()) < SIZE[0] * SIZE[1]:
+            reused_frames += 1
+    assert reused_frames > FRAMES // 2  # the frames were really reused
+
+
+@pytest.mark.parametrize("interleave", [1, 2])
+@pytest.mark.parametrize("ordered", [False, True])
+def test_interleave_matches_full_cast(interleave: int, ordered: bool):
+    texture = load_texture("flower_wall.png")
+    drawn_texture = pygame.Surface((16, 16), pygame.SRCALPHA, 32)
+    draw_texture(drawn_texture, 0)
+    interleaved, full = Scene(texture, drawn_texture), Scene(texture, drawn_texture)
+    camera = (0.2, 0., 0.3, 0.05, 0.15)
+
+    interleaved.cast(camera, ordered=ordered, interleave=interleave)
+    assert interleaved.cast(camera, ordered=ordered, interleave=interleave) == full.cast(camera, ordered=ordered)
@@ -0,0 +1,127 @@
+"""Texture mapping of the ray caster, checked against the mapping it used before the texture axes were precomputed.
+
+The rays of the caster are rebuilt here, and the texel of every hit is computed with the old formula:
+the column is the distance of the point to the edge A-C and the row its distance to the edge C-B.
+A texel on the border of two others can go either way with the rounding, so both are accepted there.
+"""
+from math import cos, sin, sqrt, radians, floor
+from os import environ, listdir
+from os.path import join as join_path, dirname
+
+import pytest
+
+environ.setdefault("SDL_VIDEODRIVER", "dummy")
+pygame = pytest.importorskip("pygame")
+nostalgiaeraycasting = pytest.importorskip("nostalgiaeraycasting")
+
+WALLS: str = join_path(dirname(dirname(__file__)), "data", "textures", "wall")
+SIZE: tuple[int, int] = (96, 72)
+FOV: float = 90.
+VIEW_DISTANCE: float = 10.
+BORDER: float = 0.01  # part of a texel in which the texel next to it is accepted too
+EDGE: float = 0.001  # distance to the corners A and B under which the caster still hits the surface
+
+# A, B and C of each surface, C is the corner between the edges A-C and C-B
+SURFACES: dict[str, tuple[tuple[float, float, float], ...]] = {
+    "wall": ((2., 1., -1.5), (2., -1., 1.5), (2., -1., -1.5)),
+    "slanted_wall": ((1.5, 1., -2.), (3., -1., 1.), (1.5, -1., -2.)),
+    "floor": ((0.5, -0.8, -2.), (4., -0.8, 2.), (4., -0.8, -2.)),
+}
+
+
+def sub(a: tuple, b: tuple) -> tuple:
+    return a[0] - b[0], a[1] - b[1], a[2] - b[2]
+
+
+def dot(a: tuple, b: tuple) -> float:
+    return a[0] * b[0] + a[1] * b[1] + a[2] * b[2]
+
+
+def cross(a: tuple, b: tuple) -> tuple:
+    return a[1] * b[2] - a[2] * b[1], a[2] * b[0] - a[0] * b[2], a[0] * b[1] - a[1] * b[0]
+
+
+def length(a: tuple) -> float:
+    return sqrt(dot(a, a))
+
+
+def load_texture(name: str):
+    image = pygame.image.load(join_path(WALLS, name))
+    texture = pygame.Surface(image.get_size(), pygame.SRCALPHA, 32)
+    texture.blit(image, (0, 0))
+    return texture
+
+
+def rays(width: int, height: int):
+    """Yield the pixel and the direction of the rays of a camera at the origin looking at +x, as the caster casts them."""
+    fov = radians(FOV)
+    for row in range(height):
+        theta_x = fov / 2 - row * fov / height
+        ray_y = VIEW_DISTANCE * sin(theta_x)
+        hypo = sqrt(VIEW_DISTANCE ** 2 - ray_y ** 2)
+        for column in range(width):
+            theta_y = fov / 2 - column * fov / width
+            yield (column, row), (hypo * cos(theta_y), ray_y, hypo * sin(theta_y))
+
+
+def old_texels(a: tuple, b: tuple, c: tuple, point: tuple, width: int, height: int) -> set[tuple[int, int]] | None:
+    """Return the texels the old mapping can give for the point, None if the point is near or out of the image."""
+    ca = sub(c, a)
+    x_dist = length(cross(ca, sub(point, a))) / length(ca)
+    bc = sub(b, c)
+    y_dist = length(cross(bc, sub(point, c))) / length(bc)
+    u = x_dist * width / length(sub(c, b))
+    v = y_dist * height / length(ca)
+
+    columns = {floor(u), floor(u + BORDER), floor(u - BORDER)}
+    rows = {height - floor(v), height - floor(v + BORDER), height - floor(v - BORDER)}
+    if min(columns) < 0 or max(columns) >= width or min(rows) < 0 or max(rows) >= height:
+        return None
+    return {(x, y) for x in columns for y in rows}
+
+
+def check_surface(texture, corners: tuple, repeat_x: int = 1, repeat_y: int = 1) -> int:
+    """Cast a frame through the surface and compare every pixel to the old mapping, return the number of pixels checked."""
+    a, b, c = corners
+    caster = nostalgiaeraycasting.RayCaster()
+    caster.add_surface(texture, *a, *b, *c, repeat_x=repeat_x, repeat_y=repeat_y)
+    screen = pygame.Surface(SIZE, 0, 32)
+    caster.raycasting(screen, 0., 0., 0., 0., 0., FOV, VIEW_DISTANCE, threads=1)
+
+    width, height = texture.get_size()
+    normal = cross(sub(a, c), sub(b, c))
+    checked = 0
+    for pixel, direction in rays(*SIZE):
+        facing = dot(normal, direction)
+        if facing == 0.:
+            continue
+        t = dot(normal, a) / facing
+        if not 0. < t < 1.:
+            continue
+        point = (direction[0] * t, direction[1] * t, direction[2] * t)
+        if any(not min(a[i], b[i]) - EDGE <= point[i] <= max(a[i], b[i]) + EDGE for i in range(3)):
+            continue  # the distances to the edges don't tell on which side of them the point is
+
+        # the tiled image is mapped as one bigger image, then wrapped
+        texels = old_texels(a, b, c, point, width * repeat_x, height * repeat_y)
+        if texels is None:
+            continue
+        colors = [texture.get_at((x % width, y % height)) for x, y in texels]
+        if any(color.a != 255 for color in colors):
+            continue  # the caster blends the transparent texels with the background
+        assert tuple(screen.get_at(pixel))[:3] in {tuple(color)[:3] for color in colors}, (pixel, point, texels)
+        checked += 1
+    return checked
+
+
+@pytest.mark.parametrize("name", sorted(listdir(WALLS)))
+@pytest.mark.parametrize("surface", SURFACES)
+def test_uv_mapping_matches_old_mapping(name: str, surface: str):
+    assert check_surface(load_texture(name), SURFACES[surface]) > SIZE[0] * SIZE[1] // 8
+
+
+@pytest.mark.parametrize("repeat_x, repeat_y", [(2, 1), (1, 3), (3, 2)])
+@pytest.mark.parametrize("surface", SURFACES)
+def test_uv_mapping_matches_old_mapping_repeated(surface: str, repeat_x: int, repeat_y: int):
+    texture = load_texture("flower_wall.png")
+    assert check_surface(texture, SURFACES[surface], repeat_x, repeat_y) > SIZE[0] * SIZE[1] // 8